@@ -4,8 +4,16 @@ import numpy as np
 import math
 import time
 import sys
+import os
+import shutil
 import utils
 
+# Master equation solver lives with the robust simulation
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'robust'))
+import solver
+import cache
+import reference
+
 if len(sys.argv) != 8:
     print("Usage: ./RW.py <deltaT> <time> <D> <b> <gamma> <numParticles> <numCores>")
     sys.exit(0)
@@ -22,17 +30,27 @@ increments = int (timeConst / deltaT)
 # Potential problem area -- rounding
 moveDistance = round(math.sqrt(2 * diffCon * deltaT), 3)
 
-runProgram = ['./RWoperation', sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6], sys.argv[7]]
+runProgram = ['./RWoperation', sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6], sys.argv[7], '--binary']
+
+# Threads seed their own generators, so the core count picks the random streams
+cacheKey = cache.cacheKey({'program': 'fastRW', 'dt': deltaT, 'T': timeConst, 'D': diffCon, 'b': bSpin,
+                           'gamma': gamma, 'particles': numParticles, 'cores': coresToUse}, runProgram[0])
+cached = cache.lookupResult(cacheKey)
 
 runTime = time.perf_counter()
-result = subprocess.run(runProgram, capture_output=False)
+if cached is not None:
+    shutil.copyfile(os.path.join(cached, 'probSim.bin'), 'sims/probSim.bin')
+else:
+    result = subprocess.run(runProgram, capture_output=False)
+    if result.returncode == 0:
+        cache.storeResult(cacheKey, files=['sims/probSim.bin'])
 runTime = time.perf_counter() - runTime
 
-print(f"Simulation ran in {runTime:.2f} seconds.\n")
+print(f"Simulation {'loaded from cache' if cached is not None else 'ran'} in {runTime:.2f} seconds.\n")
 
 # Separate the x-values based on y-values for prob and step data
-topValsProb, bottomValsProb = utils.readDataCSV("sims/probSim.csv")
-topValsStep, bottomValsStep = utils.readDataCSV("sims/stepSim.csv")
+topValsProb, bottomValsProb = utils.readData("sims/probSim")
+topValsStep, bottomValsStep = utils.readData("sims/stepSim")
 
 # Create the figure
 plt.figure(figsize=(10, 6))
@@ -61,47 +79,52 @@ bin_centers_bottom_step = 0.5 * (bin_edges_bottom_step[1:] + bin_edges_bottom_st
 plt.bar(bin_centers_bottom_prob, -hist_bottomProb, width=np.diff(bin_edges_bottom_prob), alpha=0.5, color='orange')
 plt.bar(bin_centers_bottom_step, -hist_bottomStep, width=np.diff(bin_edges_bottom_step), alpha=0.5, color='blue')
 
-def analyticSolution(x, t, v, D=1):    
-    lead = 1 / math.sqrt(4 * math.pi * D * t)
-    exponent = -1 * ((x - (v * t)) ** 2)/(4 * D * t)
-    return lead * (math.e ** exponent)
-
 # top max
-if max(topValsProb) < max(topValsStep):
-    topMax = max(topValsStep)
+if np.max(topValsProb) < np.max(topValsStep):
+    topMax = np.max(topValsStep)
 else:
-    topMax = max(topValsProb)
+    topMax = np.max(topValsProb)
 # top min
-if min(topValsProb) > min(topValsStep):
-    topMin = min(topValsStep)
+if np.min(topValsProb) > np.min(topValsStep):
+    topMin = np.min(topValsStep)
 else:
-    topMin = min(topValsProb)
+    topMin = np.min(topValsProb)
 # bottom max
-if max(bottomValsProb) > max(bottomValsStep):
-    bottomMax = max(bottomValsStep)
+if np.max(bottomValsProb) > np.max(bottomValsStep):
+    bottomMax = np.max(bottomValsStep)
 else:
-    bottomMax = max(bottomValsProb)
+    bottomMax = np.max(bottomValsProb)
 # bottom min
-if min(bottomValsProb) > min(bottomValsStep):
-    bottomMin = min(bottomValsStep)
+if np.min(bottomValsProb) > np.min(bottomValsStep):
+    bottomMin = np.min(bottomValsStep)
 else:
-    bottomMin = min(bottomValsProb)
+    bottomMin = np.min(bottomValsProb)
 
 xRangeTop = np.linspace(topMin, topMax, num=1000)
 xRangeBottom = np.linspace(bottomMin, bottomMax, num=1000)
                         
-yRangeTop = []
-yRangeBottom = []
-
-for xVal in xRangeTop:
-    yRangeTop.append(analyticSolution(xVal, timeConst, bSpin, diffCon))
-
-for xVal in xRangeBottom:
-    yRangeBottom.append(-analyticSolution(xVal, timeConst, -bSpin, diffCon))
+# Two-lane solution with gamma coupling, each lane normalized like its histogram.
+# This simulation drifts its top line +b, the opposite of the robust kernel.
+yRangeTop = reference.telegraph(xRangeTop, timeConst, -bSpin, diffCon, gamma)[0]
+yRangeBottom = -reference.telegraph(xRangeBottom, timeConst, -bSpin, diffCon, gamma)[1]
 
 plt.plot(xRangeTop, yRangeTop, color='black')
 plt.plot(xRangeBottom, yRangeBottom, color='black')
 
+# Noise-free distribution including gamma coupling, normalized per line like the histograms.
+# This simulation drifts its top line +b and rounds moveProbCalc of help/helper.c to float32.
+D32, b32, dt32 = np.float32(diffCon), np.float32(bSpin), np.float32(deltaT)
+if D32 == 0 and b32 == 0:
+    fastMoveProb = 0.5
+else:
+    fastMoveProb = float(np.float32(0.5) * (np.float32(1) + b32 / np.sqrt(np.float32(2) * D32 / dt32 + b32 * b32)))
+xSites, bottomSites, topSites = solver.masterEquation(deltaT, timeConst, diffCon, bSpin, gamma, steps=increments,
+                                                      topFraction=(numParticles // 2) / numParticles,
+                                                      moveProb=fastMoveProb, topDrift=1)
+xMid = (xSites[:-1] + 0.5) * moveDistance
+plt.plot(xMid, solver.lineDensity(topSites / topSites.sum(), moveDistance), color='red', label='Master equation')
+plt.plot(xMid, -solver.lineDensity(bottomSites / bottomSites.sum(), moveDistance), color='red')
+
 # Step 4: Formatting the plot
 plt.title(f"{numParticles} Walkers taking {increments} steps with {bSpin} bias")
 plt.xlabel('X Coordinate')
@@ -114,7 +137,7 @@ plt.grid(True)
 plt.tight_layout()
 plt.savefig(f"images/{time.time()}.png")
 
-utils.writeFreqCSV("sims/probSim.csv", "freq/probTopSim", "freq/probBottomSim", numParticles)
-utils.writeFreqCSV("sims/stepSim.csv", "freq/stepTopSim", "freq/stepBottomSim", numParticles)
-#utils.writeFreqTXT("sims/probSim.csv", "freq/probTopSim", "freq/probBottomSim", numParticles)
-#utils.writeFreqTXT("sims/stepSim.csv", "freq/stepTopSim", "freq/stepBottomSim", numParticles)
\ No newline at end of file
+utils.writeFreqCSV(utils.dataPath("sims/probSim"), "freq/probTopSim", "freq/probBottomSim", numParticles)
+utils.writeFreqCSV(utils.dataPath("sims/stepSim"), "freq/stepTopSim", "freq/stepBottomSim", numParticles)
+#utils.writeFreqTXT(utils.dataPath("sims/probSim"), "freq/probTopSim", "freq/probBottomSim", numParticles)
+#utils.writeFreqTXT(utils.dataPath("sims/stepSim"), "freq/stepTopSim", "freq/stepBottomSim", numParticles)
\ No newline at end of file
@@ -22,8 +22,8 @@
 
 
 int main(int argc, char *argv[]) {
-    if (argc != 8) {
-        printf("Usage: ./RWoperation.exe <deltaT> <timeConst> <diffCon> <bSpin> <gamma> <numParticles> <numCores>\n");
+    if (argc != 8 && !(argc == 9 && strcmp(argv[8], "--binary") == 0)) {
+        printf("Usage: ./RWoperation.exe <deltaT> <timeConst> <diffCon> <bSpin> <gamma> <numParticles> <numCores> [--binary]\n");
         return 1;
     }
     double startTime = omp_get_wtime();
@@ -38,6 +38,7 @@ int main(int argc, char *argv[]) {
     int numParticles = atoi(argv[6]);
     int coresToUse = atoi(argv[7]);
     int step = 50; // How many iterations to run before sending data
+    bool binaryOutput = (argc == 9); // Columnar sims/probSim.bin instead of sims/probSim.csv
 
     // Behavior calculations
     float moveDistance = roundValue(sqrt(2 * diffCon * deltaT), 2);
@@ -140,6 +141,14 @@ int main(int argc, char *argv[]) {
     double simEnd = omp_get_wtime();
     printf("Simulation completed in %.2f seconds\n", simEnd - simStart);
 
+    // Final positions for RW.py. x is kept in discrete moves and written in
+    // physical units, like stepSim and the curves RW.py draws over it
+    if (binaryOutput) {
+        exportParticlesToBinary(particleListProb, numParticles, moveDistance, "sims/probSim.bin");
+    } else {
+        exportParticlesToCSV(particleListProb, numParticles, moveDistance, "sims/probSim.csv");
+    }
+
     free(particleListProb);
 
     //free(particleListStep);
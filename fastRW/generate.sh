@@ -48,6 +48,12 @@ fi
 # python3 RW.py 0.1 1000 1 0.25 $i 10000 4
 #done
 
+# Sweep - Every bias in one process, one row per parameter set
+# (needs ../robust/RWoperation, output rows are set,y,x,frequency)
+#echo "dt,T,D,b,gamma" > sims/sweep.csv
+#awk 'BEGIN{for(i=-0.5;i<=0.5;i+=0.05) printf "0.1,1000,1,%.2f,0.001\n", i}' >> sims/sweep.csv
+#../robust/RWoperation --sweep sims/sweep.csv 10000 4 freq/sweep.csv
+
 
 # One iteration, base
 #             dt - T - D - b - g - part - cores
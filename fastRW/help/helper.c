@@ -94,7 +94,7 @@ bool moveParticleStep(Particle *particle, float jumpProb, float driftVal, float
     }
 }
 
-void exportParticlesToCSV(Particle particles[], int numParticles, const char *filename) {
+void exportParticlesToCSV(Particle particles[], int numParticles, double scale, const char *filename) {
     FILE *file = fopen(filename, "w");
     if (file == NULL) {
         perror("Error opening file");
@@ -103,11 +103,52 @@ void exportParticlesToCSV(Particle particles[], int numParticles, const char *fi
 
     fprintf(file, "x,y\n");
     for (int i = 0; i < numParticles; i++) {
-        fprintf(file, "%.3f,%f\n", particles[i].x, particles[i].y);
+        fprintf(file, "%.3f,%f\n", particles[i].x * scale, particles[i].y);
     }
     fclose(file);
 }
 
+void exportParticlesToBinary(Particle particles[], int numParticles, double scale, const char *filename) {
+    FILE *file = fopen(filename, "wb");
+    if (file == NULL) {
+        perror("Error opening file");
+        return;
+    }
+
+    int32_t *x = malloc(numParticles * sizeof(int32_t));
+    uint8_t *lanes = malloc(numParticles * sizeof(uint8_t));
+    if (x == NULL || lanes == NULL) {
+        perror("Failed to allocate memory");
+        free(x);
+        free(lanes);
+        fclose(file);
+        return;
+    }
+
+    // Split the particles into one column per field
+    #pragma omp parallel for
+    for (int i = 0; i < numParticles; i++) {
+        x[i] = (int32_t)lround(particles[i].x);
+        lanes[i] = (particles[i].y != 0);
+    }
+
+    uint32_t version = BINARY_VERSION;
+    int64_t count = numParticles;
+    fwrite(BINARY_MAGIC, 1, 4, file);
+    fwrite(&version, sizeof(version), 1, file);
+    fwrite(&count, sizeof(count), 1, file);
+    fwrite(&scale, sizeof(scale), 1, file);
+    fwrite(x, sizeof(int32_t), numParticles, file);
+    fwrite(lanes, sizeof(uint8_t), numParticles, file);
+    if (ferror(file)) {
+        perror("Error writing file");
+    }
+
+    free(x);
+    free(lanes);
+    fclose(file);
+}
+
 float moveProbCalc(float D, float b, float dt) {
     if (D == 0 && b == 0) {
         return 0.5;
@@ -15,6 +15,8 @@
 #include "../pcg_basic.h"
 
 #define PARTICLE_COUNT 325
+#define BINARY_MAGIC "RWPB"
+#define BINARY_VERSION 1
 #ifndef HELPER_H
 #define HELPER_H
 
@@ -41,7 +43,12 @@ float moveProbCalc(float D, float b, float dt);
 void initializeParticles(Particle partList[], int numParts);
 bool moveParticleProb(Particle *particle, float jumpProb, float driftVal, pcg32_random_t *rng_states);
 bool moveParticleStep(Particle *particle, float jumpProb, float driftVal, float moveDistance, pcg32_random_t *rng_states);
-void exportParticlesToCSV(Particle particles[], int numParticles, const char *filename);
+// Particle x is in moves of length scale, written as x * scale
+void exportParticlesToCSV(Particle particles[], int numParticles, double scale, const char *filename);
+// Columnar binary file: "RWPB", uint32 version, int64 count, double scale,
+// then int32 x[count] (moves, physical x / scale) and uint8 lane[count]. Little-endian.
+// Particle x is in moves of length scale.
+void exportParticlesToBinary(Particle particles[], int numParticles, double scale, const char *filename);
 void initialize_rng_states(int num_threads, pcg32_random_t *rng_states);
 // Function to convert particles to frequency list
 ParticleDataList particlesToFrequency(Particle particles[], int numParticles);
@@ -1,6 +1,19 @@
 import csv
+import itertools
+import os
+import struct
+import numpy as np
 from collections import defaultdict
 
+# Columnar particle file written by exportParticlesToBinary (matches help/helper.h)
+BINARY_MAGIC = b"RWPB"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sIqd")  # magic, version, count, scale
+# Positions in CSV results have three decimals (exportParticlesToCSV)
+CSV_RESOLUTION = 0.001
+# Particles read at a time when building frequency tables
+CHUNK_SIZE = 1 << 22
+
 def readDataCSV(filepath):
     """
     This function reads CSV data from a file into two lists, one list for the x-values on the top line and the 
@@ -16,100 +29,228 @@ def readDataCSV(filepath):
         reader = csv.DictReader(file)  # Automatically handles the header row
         for row in reader:
             x_val = float(row['x'])
-            y_val = int(row['y'])
+            y_val = int(float(row['y']))
             if y_val == 1:
                 x_top.append(x_val)
             else:
                 x_bottom.append(x_val)
     return x_top, x_bottom
 
+def mapDataBinary(filepath):
+    """
+    This function memory-maps a binary particle file from the simulation ran in C. Nothing is read
+    until the arrays are used, so opening is instant however many particles the file holds.
+
+    Input: file path
+
+    Output: int32 positions, uint8 lanes (1 is the top line), scale to multiply positions by
+    """
+
+    with open(filepath, 'rb') as file:
+        magic, version, count, scale = BINARY_HEADER.unpack(file.read(BINARY_HEADER.size))
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"{filepath} is not a version {BINARY_VERSION} particle file")
+
+    positions = np.memmap(filepath, dtype='<i4', mode='r', offset=BINARY_HEADER.size, shape=(count,))
+    lanes = np.memmap(filepath, dtype=np.uint8, mode='r', offset=BINARY_HEADER.size + 4 * count, shape=(count,))
+    return positions, lanes, scale
+
+def readDataBinary(filepath):
+    """
+    This function reads a binary particle file into two arrays, one for the x-values on the top line
+    and the other for the bottom line, like readDataCSV.
+
+    Input: file path
+
+    Output: top line array, bottom line array
+    """
+
+    positions, lanes, scale = mapDataBinary(filepath)
+    top = lanes.view(np.bool_)
+    if scale == 1:
+        return positions[top], positions[~top]
+    return positions[top] * scale, positions[~top] * scale
+
+def readData(basepath):
+    """
+    This function reads a simulation result from basepath + ".bin" if the simulation wrote one,
+    otherwise from basepath + ".csv".
+
+    Input: file path without extension
+
+    Output: top line values, bottom line values
+    """
+
+    filepath = dataPath(basepath)
+    if filepath.endswith(".bin"):
+        return readDataBinary(filepath)
+    return readDataCSV(filepath)
+
+def dataPath(basepath):
+    """
+    This function picks the file a simulation result is stored in, the binary file if the
+    simulation wrote one, otherwise the CSV file.
+
+    Input: file path without extension
+
+    Output: file path with extension
+    """
+
+    if os.path.exists(basepath + ".bin"):
+        return basepath + ".bin"
+    return basepath + ".csv"
+
+def iterParticleChunks(filepath, chunkSize=CHUNK_SIZE):
+    """
+    This function reads a simulation result a chunk at a time, so memory stays bounded however many
+    particles there are. Positions come back as integer keys: multiply by the scale for x.
+
+    Input: file path (.bin or .csv), particles per chunk
+
+    Output: generator of (int64 position keys, bool top line mask, scale)
+    """
+
+    if filepath.endswith(".bin"):
+        positions, lanes, scale = mapDataBinary(filepath)
+        for start in range(0, len(positions), chunkSize):
+            yield positions[start:start + chunkSize].astype(np.int64), lanes[start:start + chunkSize] != 0, scale
+        return
+
+    with open(filepath, 'r') as csvfile:
+        csvfile.readline()  # Header
+        while True:
+            lines = list(itertools.islice(csvfile, chunkSize))
+            if not lines:
+                return
+            rows = np.loadtxt(lines, delimiter=',', ndmin=2)
+            # Positions are written with three decimals, count them in thousandths
+            yield np.rint(rows[:, 0] / CSV_RESOLUTION).astype(np.int64), rows[:, 1] != 0, CSV_RESOLUTION
+
+def countKeys(keys):
+    """
+    This function counts integer position keys, with bincount when the keys span a small range
+    and np.unique otherwise.
+
+    Input: int64 keys
+
+    Output: sorted distinct keys, count of each
+    """
+
+    if len(keys) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    low = keys.min()
+    span = int(keys.max() - low) + 1
+    if span > 2 * len(keys) + 1024:
+        return np.unique(keys, return_counts=True)
+    counts = np.bincount(keys - low, minlength=span)
+    occupied = np.flatnonzero(counts)
+    return occupied + low, counts[occupied]
+
+def mergeCounts(keys, counts, newKeys, newCounts):
+    """
+    This function merges two sorted (key, count) tables, adding the counts of keys found in both.
+
+    Input: keys, counts, new keys, new counts
+
+    Output: sorted distinct keys, count of each
+    """
+
+    allKeys = np.concatenate((keys, newKeys))
+    mergedKeys, inverse = np.unique(allKeys, return_inverse=True)
+    mergedCounts = np.bincount(inverse, weights=np.concatenate((counts, newCounts)), minlength=len(mergedKeys))
+    return mergedKeys, mergedCounts.astype(np.int64)
+
+def countFrequencies(filepath, chunkSize=CHUNK_SIZE):
+    """
+    This function counts how many particles sit at each x on each line, streaming the simulation
+    result in chunks.
+
+    Input: file path (.bin or .csv), particles per chunk
+
+    Output: (top line x, top line counts), (bottom line x, bottom line counts), sorted by x
+    """
+
+    empty = np.empty(0, np.int64)
+    tables = [(empty, empty), (empty, empty)]
+    scale = 1.0
+    for keys, top, scale in iterParticleChunks(filepath, chunkSize):
+        for line, mask in enumerate((top, ~top)):
+            tables[line] = mergeCounts(*tables[line], *countKeys(keys[mask]))
+    return [(lineKeys * scale, lineCounts) for lineKeys, lineCounts in tables]
+
 def writeFreqCSV(input, output1, output2, numParticles):
     """
-    This function is designed to take a name for a CSV file, convert the values in the file starting 
-    as (X,Y) to (X, frequency(X)). Then, this function places these frequencies into two separate CSV
-    files for the top line and the bottom line.
+    This function is designed to take a simulation result (.csv or .bin), convert the values in the
+    file starting as (X,Y) to (X, frequency(X)). Then, this function places these frequencies, sorted
+    by X, into two separate CSV files for the top line and the bottom line.
 
     Input: file path, output name 1, output name 2, number of particles to process
 
     Output: No output, operates on files
     """
 
-    output1 = output1 + ".csv"
-    output2 = output2 + ".csv"
-    #Dictionaries for top and bottom particles
-    coordTopDict = defaultdict(int)
-    coordBottomDict = defaultdict(int)
-
-    # Read values out of CSV into a dictionary
-    with open(input, 'r') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            # Ignore header
-            if (row[0] == 'x'):
-                continue
-            if (row[1] == '1'):
-                coordTopDict[row[0]] += 1
-                # Add to top dictionary
-            elif (row[1] == '0'):
-                # Add to bottom dictionary
-                coordBottomDict[row[0]] += 1
-    #print(sum(coordTopDict.values()))
-    #print(sum(coordBottomDict.values()))
-
-    # Write the values into output CSV file
-    with open(output1, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['x', 'frequency'])  # Write header
-        for x, freq in coordTopDict.items():
-            writer.writerow([x, freq / numParticles])
-    
-    with open(output2, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['x', 'frequency'])  # Write header
-        for x, freq in coordBottomDict.items():
-            writer.writerow([x, freq / numParticles])
+    top, bottom = countFrequencies(input)
+    for output, (x, counts) in ((output1, top), (output2, bottom)):
+        table = np.column_stack((x, counts / numParticles))
+        np.savetxt(output + ".csv", table, delimiter=',', fmt='%.10g', header='x,frequency', comments='')
     return
 
 def writeFreqTXT(input, output1, output2, numParticles):
     """
-    This function is designed to take a name for a CSV file, convert the values in the file starting 
-    as (X,Y) to (X, frequency(X)). Then, this function places these frequencies into two separate CSV
-    files for the top line and the bottom line.
+    This function is designed to take a simulation result (.csv or .bin), convert the values in the
+    file starting as (X,Y) to (X, frequency(X)). Then, this function places these frequencies, sorted
+    by X, into two separate text files for the top line and the bottom line.
 
     Input: file path, output name 1, output name 2, number of particles to process
 
     Output: No output, operates on files
     """
-    output1 = output1 + ".txt"
-    output2 = output2 + ".txt"
-    #Dictionaries for top and bottom particles
-    coordTopDict = defaultdict(int)
-    coordBottomDict = defaultdict(int)
 
-    # Read values out of CSV into a dictionary
-    with open(input, 'r') as csvfile:
-        reader = csv.reader(csvfile)
+    top, bottom = countFrequencies(input)
+    for output, (x, counts) in ((output1, top), (output2, bottom)):
+        table = np.column_stack((x, counts / numParticles))
+        with open(output + ".txt", 'w') as txtfile:
+            txtfile.write('x, frequency')  # Write header
+            if len(table):
+                txtfile.write('\n')
+            np.savetxt(txtfile, table, delimiter=', ', fmt='%.10g', newline='\n')
+    return
+
+def writeSweepTable(filepath, parameterSets):
+    """
+    This function writes a parameter table for a sweep ran in C (RWoperation --sweep), one
+    parameter set per row. Row n of the table is set n of the sweep output.
+
+    Input: file path, list of (dt, T, D, b, gamma) tuples
+
+    Output: No output, operates on files
+    """
+
+    with open(filepath, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['dt', 'T', 'D', 'b', 'gamma'])
+        for parameters in parameterSets:
+            writer.writerow(parameters)
+    return
+
+def readSweepCSV(filepath):
+    """
+    This function reads the output of a sweep ran in C into frequency dictionaries, one pair
+    per parameter set. Positions are in discrete moves, multiply by the set's move distance
+    for the physical x.
+
+    Input: file path
+
+    Output: dictionary of set index to (top line {x: frequency}, bottom line {x: frequency})
+    """
+
+    sets = defaultdict(lambda: ({}, {}))
+    with open(filepath, mode='r') as file:
+        reader = csv.DictReader(file)
         for row in reader:
-            # Ignore header
-            if (row[0] == 'x'):
-                continue
-            if (row[1] == '1'):
-                coordTopDict[float(row[0])] += 1
-                # Add to top dictionary
-            elif (row[1] == '0'):
-                # Add to bottom dictionary
-                coordBottomDict[float(row[0])] += 1
-    #print(sum(coordTopDict.values()))
-    #print(sum(coordBottomDict.values()))
-
-    # Write the values into output CSV file
-    with open(output1, 'w') as txtfile:
-        txtfile.write('x, frequency')  # Write header
-        for x, freq in coordTopDict.items():
-            txtfile.write(f"\n{x}, {freq / numParticles}")
-
-    with open(output2, 'w') as txtfile:
-        txtfile.write('x, frequency') # Write header
-        for x, freq in coordBottomDict.items():
-            txtfile.write(f"\n{x}, {freq / numParticles}")
-    return
\ No newline at end of file
+            top, bottom = sets[int(row['set'])]
+            if row['y'] == '1':
+                top[int(row['x'])] = float(row['frequency'])
+            else:
+                bottom[int(row['x'])] = float(row['frequency'])
+    return dict(sets)
@@ -8,122 +8,947 @@
 #include <sys/mman.h> 
 #include <sys/stat.h>
 #include <unistd.h>
+#include <string.h>
+#include <signal.h>
 #include "inc/pcg_basic.h"
 #include "inc/helper.h"
+#include "inc/lattice.h"
+#include "inc/simd.h"
+#include "inc/histogram.h"
+#include "inc/notify.h"
+#include "inc/sweep.h"
+#include "inc/server.h"
+#include "inc/checkpoint.h"
+#include "inc/moments.h"
+#include "inc/shard.h"
+#include "inc/bench.h"
+#include "inc/profile.h"
+#include "inc/placement.h"
+#include "inc/tune.h"
 
 #define SHM_NAME "/particle_shm"
+// Increments per published snapshot
+#define WINDOW_INCREMENTS 10
 
-int main(int argc, char *argv[]) {
-    setbuf(stdout, NULL);
-    
-    if (argc != 8) {
-        printf("Usage: ./RWoperation.exe <deltaT> <timeConst> <diffCon> <bSpin> <gamma> <numParticles> <numCores>\n");
-        return 1;
+// Everything one run owns, set up by openSimulation and released by closeSimulation
+typedef struct {
+    ParticleStruct *particleList;
+    size_t mapSize;
+    int fd;
+    RngStream *rng_streams;
+    SimdStream *simd_streams;
+    LatticeState *lattice;
+    HistogramScratch *histogram;
+    MomentLog *moments;
+    int increments;
+    int done;         // Increments applied so far
+    float moveProb;
+    float jumpProb;
+    int pace;
+    // Saved with every checkpoint
+    float deltaT;
+    float timeConst;
+    float diffCon;
+    float bSpin;
+    float gamma;
+    uint64_t seed;
+    int kernel;
+    int numStreams;
+    const char *checkpointPath;
+    int checkpointEvery;
+    Profile *profile;      // Phase timers and work counters of this run
+    const char *statsPath; // End of run JSON summary, NULL for none
+} Simulation;
+
+// advanceWindow result when a server command arrived before the window ran,
+// also returned by runSimulation when a signal stopped a checkpointed run
+#define WINDOW_INTERRUPTED 1
+// advanceWindow result when visual pacing without semaphores skipped the
+// window because Python had not taken the last snapshot yet
+#define WINDOW_SKIPPED 2
+
+// Set by SIGINT or SIGTERM while a checkpointed run is going
+static volatile sig_atomic_t stopRequested = 0;
+
+static void requestStop(int signum)
+{
+    (void)signum;
+    stopRequested = 1;
+}
+
+// Release whatever openSimulation managed to set up
+static void closeSimulation(Simulation *sim)
+{
+    if (sim->particleList != NULL)
+    {
+        munmap(sim->particleList, sim->mapSize);
     }
-    
-    // Parameters
-    float deltaT = atof(argv[1]); // Delta t
-    float timeConst = atof(argv[2]); // Time Constant
-    float diffCon = atof(argv[3]); // Diffusion Constant
-    float bSpin = atof(argv[4]); // beta / bias
-    float gamma = atof(argv[5]); // GammaRWo
-    int numParticles = atoi(argv[6]); // Number of particles
-    int coresToUse = atoi(argv[7]); // Cores to use in multithreading
-    int step = 10; // How many iterations to run before sending data
+    if (sim->fd >= 0)
+    {
+        close(sim->fd);
+    }
+    free(sim->rng_streams);
+    free(sim->simd_streams);
+    freeLatticeState(sim->lattice);
+    freeHistogramScratch(sim->histogram);
+    closeMomentLog(sim->moments);
+    freeProfile(sim->profile);
+    memset(sim, 0, sizeof(*sim));
+    sim->fd = -1;
+}
+
+// Stream array of the kernel in use and the size of one entry
+static void* getStreams(Simulation *sim, size_t *entrySize)
+{
+    if (sim->simd_streams != NULL)
+    {
+        *entrySize = sizeof(SimdStream);
+        return sim->simd_streams;
+    }
+    *entrySize = sizeof(RngStream);
+    return sim->rng_streams;
+}
+
+// Write the walkers and streams of a run to its checkpoint file
+static int saveCheckpoint(Simulation *sim)
+{
+    size_t entrySize;
+    void *streams = getStreams(sim, &entrySize);
+
+    CheckpointHeader info;
+    memset(&info, 0, sizeof(info));
+    info.layout = sim->particleList->layout;
+    info.kernel = sim->kernel;
+    info.count = sim->particleList->count;
+    info.sites = sim->particleList->sites;
+    info.increments = sim->increments;
+    info.done = sim->done;
+    info.deltaT = sim->deltaT;
+    info.timeConst = sim->timeConst;
+    info.diffCon = sim->diffCon;
+    info.bSpin = sim->bSpin;
+    info.gamma = sim->gamma;
+    info.numStreams = sim->numStreams;
+    info.seed = sim->seed;
+    info.streamBytes = (uint64_t)sim->numStreams * entrySize;
+    return writeCheckpoint(sim->checkpointPath, &info, sim->particleList, streams);
+}
+
+// Copy saved lattice counts into the mapped lattice, keeping x = 0 at the
+// middle site. The lattice may differ in width as long as the occupied sites
+// can still take remaining increments in either direction.
+static int restoreLattice(ParticleStruct *sharedData, const CheckpointHeader *info, const int64_t *saved, int remaining)
+{
+    if (info->bodyBytes < 2 * (uint64_t)info->sites * sizeof(int64_t))
+    {
+        printf("Checkpoint lattice is truncated\n");
+        return -1;
+    }
+
+    int savedSites = info->sites;
+    int sites = sharedData->sites;
+    int shift = sites / 2 - savedSites / 2;
+    int lo = savedSites;
+    int hi = -1;
+    for (int j = 0; j < savedSites; j++)
+    {
+        if (saved[j] != 0 || saved[savedSites + j] != 0)
+        {
+            if (j < lo) lo = j;
+            hi = j;
+        }
+    }
+    if (hi >= 0 && (lo + shift - remaining < 0 || hi + shift + remaining > sites - 1))
+    {
+        printf("Lattice of %d sites is too small for the checkpoint, need %d\n", sites, hi - lo + 1 + 2 * remaining);
+        return -1;
+    }
+
+    int64_t *counts = getLatticeCounts(sharedData);
+    memset(counts, 0, 2 * (size_t)sites * sizeof(int64_t));
+    for (int lane = 0; lane < 2; lane++)
+    {
+        for (int j = lo; j <= hi; j++)
+        {
+            counts[lane * sites + j + shift] = saved[lane * savedSites + j];
+        }
+    }
+    return 0;
+}
+
+// Load a checkpoint into a freshly opened run. Resuming finishes the saved
+// run, forking runs this run's parameters from the saved walkers. The saved
+// streams carry on unless a fork asks for a different seed.
+static int restoreSimulation(Simulation *sim, const RunOptions *options)
+{
+    CheckpointHeader info;
+    size_t size;
+    char *checkpoint = mapCheckpoint(options->resumePath, &info, &size);
+    if (checkpoint == NULL)
+    {
+        return -1;
+    }
+
+    ParticleStruct *sharedData = sim->particleList;
+    size_t entrySize;
+    void *streams = getStreams(sim, &entrySize);
+    int sameRun = (info.deltaT == sim->deltaT && info.timeConst == sim->timeConst && info.diffCon == sim->diffCon
+                   && info.bSpin == sim->bSpin && info.gamma == sim->gamma);
+    int keepStreams = !options->fork || options->seed == info.seed;
+    int status = -1;
+
+    if (info.layout != sharedData->layout || info.count != sharedData->count || info.kernel != sim->kernel)
+    {
+        printf("Checkpoint holds %d walkers in layout %d for kernel %d, this run has %d in layout %d for kernel %d\n",
+               info.count, info.layout, info.kernel, sharedData->count, sharedData->layout, sim->kernel);
+    }
+    else if (info.streamBytes != (uint64_t)info.numStreams * entrySize)
+    {
+        printf("Checkpoint streams do not match kernel %d\n", sim->kernel);
+    }
+    else if (!options->fork && !sameRun)
+    {
+        printf("Checkpoint parameters differ from this run, use --fork to run new parameters from it\n");
+    }
+    else if (sharedData->layout == LAYOUT_LATTICE)
+    {
+        int remaining = options->fork ? sim->increments : sim->increments - info.done;
+        status = restoreLattice(sharedData, &info, (const int64_t *)(checkpoint + sizeof(CheckpointHeader)), remaining);
+    }
+    else if (info.bodyBytes != getBodySize(sharedData) - sizeof(ParticleStruct))
+    {
+        printf("Checkpoint body has %llu bytes, expected %zu\n", (unsigned long long)info.bodyBytes, getBodySize(sharedData) - sizeof(ParticleStruct));
+    }
+    else
+    {
+        memcpy((char *)sharedData + sizeof(ParticleStruct), checkpoint + sizeof(CheckpointHeader), info.bodyBytes);
+        status = 0;
+    }
+
+    if (status == 0)
+    {
+        // A wider lattice keeps fresh streams for the blocks the checkpoint did not have
+        if (keepStreams)
+        {
+            int numStreams = (info.numStreams < sim->numStreams) ? info.numStreams : sim->numStreams;
+            memcpy(streams, checkpoint + getCheckpointStreamOffset(&info), (size_t)numStreams * entrySize);
+        }
+        if (!options->fork)
+        {
+            sim->done = info.done;
+            sim->seed = info.seed;
+        }
+        printf("Restored %s at increment %d of %d, %s\n", options->resumePath, info.done, info.increments,
+               options->fork ? (keepStreams ? "forked with the saved streams" : "forked with fresh streams") : "resuming");
+    }
+    unmapCheckpoint(checkpoint, size);
+    return status;
+}
+
+// Allocate streams and scratch and create and fill the shared block with
+// binWidth sites per histogram bin, the same way for a single run and for
+// every server reset. Returns 0, or -1 with nothing left open.
+static int openSimulation(Simulation *sim, float deltaT, float timeConst, float diffCon, float bSpin, float gamma, int numParticles, const RunOptions *options, int binWidth)
+{
+    memset(sim, 0, sizeof(*sim));
+    sim->fd = -1;
+    sim->pace = options->pace;
 
     // Behavior calculations
-    int increments = (int)floor((timeConst / deltaT) * (1 + fabsf(bSpin)));
-    float moveProb = moveProbCalc(diffCon, bSpin, deltaT);
-    float jumpProb = gamma * deltaT;
+    sim->increments = (int)floor((timeConst / deltaT) * (1 + fabsf(bSpin)));
+    sim->moveProb = moveProbCalc(diffCon, bSpin, deltaT);
+    sim->jumpProb = gamma * deltaT;
+    sim->deltaT = deltaT;
+    sim->timeConst = timeConst;
+    sim->diffCon = diffCon;
+    sim->bSpin = bSpin;
+    sim->gamma = gamma;
+    sim->seed = options->seed;
+    sim->checkpointPath = options->checkpointPath;
+    sim->checkpointEvery = options->checkpointEvery;
+    sim->statsPath = options->statsPath;
+
+    printf("Behavior:\nIncrements: %d\nMove Probability: %f\nJump Probability: %f\nSeed: %llu\n", sim->increments, sim->moveProb, sim->jumpProb, (unsigned long long)options->seed);
+
+    // Allocate one cache line aligned RNG stream per particle block,
+    // or per block of sites in lattice mode
+    int latticeMode = (options->mode == MODE_LATTICE);
+    // One spare site each side, like the blocks the GUI used to size
+    int sites = getLatticeSites(sim->increments + 1);
+    int numStreams = latticeMode ? getNumStreams(sites) : getNumStreams(numParticles);
+    sim->numStreams = numStreams;
+    sim->kernel = (!latticeMode && options->kernel == KERNEL_SIMD) ? KERNEL_SIMD : KERNEL_SCALAR;
+    sim->rng_streams = allocate_rng_streams(numStreams);
+    if (sim->rng_streams == NULL) 
+    {
+        perror("Failed to allocate memory, returning");
+        closeSimulation(sim);
+        return -1;
+    }
+
+    // Set unique streams for each block, used for randomness
+    initialize_rng_streams(sim->rng_streams, numStreams, options->seed);
+
+    // The SIMD kernel splits every block's stream into lanes
+    if (!latticeMode && options->kernel == KERNEL_SIMD)
+    {
+        sim->simd_streams = allocate_simd_streams(numStreams);
+        if (sim->simd_streams == NULL)
+        {
+            perror("Failed to allocate memory, returning");
+            closeSimulation(sim);
+            return -1;
+        }
+        initialize_simd_streams(sim->simd_streams, numStreams, options->seed);
+    }
+
+    // Create or resize the shared block, walkers at x = 0 and nothing published
+    sim->particleList = createSharedBlock(numParticles, latticeMode ? LAYOUT_LATTICE : LAYOUT_COMPACT, sites, binWidth, options->numa, &sim->fd);
+    if (sim->particleList == NULL)
+    {
+        perror("Failed to init particles. Returning.\n");
+        fflush(stdout);
+        closeSimulation(sim);
+        return -1;
+    }
+    sim->mapSize = getMappedSize(sim->particleList);
+    if (sim->particleList->count != numParticles)
+    {
+        printf("Size mismatch, expected %d, got %d. Returning. \n", numParticles, sim->particleList->count);
+        closeSimulation(sim);
+        return -1;
+    }
+
+    // Without a histogram region there is no double buffered snapshot to read
+    if (options->pace == PACE_MAX && sim->particleList->histBins <= 0)
+    {
+        printf("Max pace needs a histogram region. Returning.\n");
+        closeSimulation(sim);
+        return -1;
+    }
+
+    // Saved walkers and streams replace the fresh ones before any scratch is sized
+    if (options->resumePath != NULL && restoreSimulation(sim, options) != 0)
+    {
+        printf("Failed to restore %s. Returning.\n", options->resumePath);
+        closeSimulation(sim);
+        return -1;
+    }
+
+    // Lattice scratch, sized to the mapped lattice
+    if (latticeMode)
+    {
+        sim->lattice = createLatticeState(sim->particleList);
+        if (sim->lattice == NULL)
+        {
+            perror("Failed to allocate lattice, returning");
+            closeSimulation(sim);
+            return -1;
+        }
+    }
+
+    // Per-thread histogram rows, only when there is a histogram region
+    if (!latticeMode && sim->particleList->histBins > 0)
+    {
+        sim->histogram = createHistogramScratch(sim->particleList, omp_get_max_threads());
+        if (sim->histogram == NULL)
+        {
+            perror("Failed to allocate histogram, returning");
+            closeSimulation(sim);
+            return -1;
+        }
+    }
+
+    // Moment samples are taken inside the scalar particle kernel
+    if (options->momentsEvery > 0)
+    {
+        if (latticeMode || sim->kernel != KERNEL_SCALAR)
+        {
+            printf("Moments need the scalar particle kernel. Returning.\n");
+            closeSimulation(sim);
+            return -1;
+        }
+        sim->moments = createMomentLog(options->momentsEvery, WINDOW_INCREMENTS, omp_get_max_threads(), options->momentsPath);
+        if (sim->moments == NULL)
+        {
+            closeSimulation(sim);
+            return -1;
+        }
+    }
+
+    // The kernels report to this run's profile from here on
+    const char *kernelName = latticeMode ? "lattice" : (sim->kernel == KERNEL_SIMD) ? "simd" : "scalar";
+    sim->profile = createProfile(omp_get_max_threads(), numParticles, kernelName);
+    if (sim->profile == NULL)
+    {
+        perror("Failed to allocate profile, returning");
+        closeSimulation(sim);
+        return -1;
+    }
+    activeProfile = sim->profile;
+
+    printf("All initialization successful. Running.\n");
+    return 0;
+}
+
+// Write the JSON summary of the run so far if one was asked for
+static void writeStats(Simulation *sim)
+{
+    if (sim->statsPath != NULL && sim->profile != NULL && writeProfileSummary(sim->statsPath, sim->profile) == 0)
+    {
+        printf("Stats written to %s\n", sim->statsPath);
+    }
+}
 
-    printf("Behavior:\nIncrements: %d\nMove Probability: %f\nJump Probability: %f\n", increments, moveProb, jumpProb);
+// Advance one publish window with whichever engine is in use
+static int advanceWindow(Simulation *sim, int step, Notifier *notifier, ControlBlock *control)
+{
+    // A server drops the rest of the run as soon as Python sends a command,
+    // checked on every window, skipped or not
+    if (control != NULL && controlPending(control))
+    {
+        return WINDOW_INTERRUPTED;
+    }
 
+    // Visual pacing only advances once Python has taken the last snapshot,
+    // sleeping on the semaphore if there is one, skipping the window if not
+    if (sim->pace == PACE_VISUAL)
+    {
+        if (notifier != NULL)
+        {
+            double blockedStart = omp_get_wtime();
+            int waited = waitForReader(notifier, &stopRequested);
+            addPhase(sim->profile, PHASE_BLOCKED, blockedStart);
+            if (waited != 0)
+            {
+                return (waited > 0) ? WINDOW_INTERRUPTED : -1;
+            }
+        }
+        else if (__atomic_load_n(&sim->particleList->read, __ATOMIC_ACQUIRE) != 1)
+        {
+            return WINDOW_SKIPPED;
+        }
+    }
+
+    // A command may have arrived while waiting for the reader
+    if (control != NULL && controlPending(control))
+    {
+        return WINDOW_INTERRUPTED;
+    }
+
+    double computeStart = omp_get_wtime();
+    int result;
+    if (sim->lattice != NULL)
+    {
+        result = advanceLattice(sim->particleList, sim->lattice, sim->moveProb, sim->jumpProb, sim->rng_streams, step);
+    }
+    else if (sim->simd_streams != NULL)
+    {
+        result = moveParticlesSimd(sim->particleList, sim->moveProb, sim->jumpProb, sim->simd_streams, step, sim->histogram);
+    }
+    else
+    {
+        result = moveParticles(sim->particleList, sim->moveProb, sim->jumpProb, sim->rng_streams, step, sim->histogram, sim->moments, sim->done);
+    }
+
+    addPhase(sim->profile, PHASE_COMPUTE, computeStart);
+
+    if (result == 0)
+    {
+        recordWindow(sim->profile, sim->particleList, step);
+        if (notifier != NULL)
+        {
+            signalSnapshot(notifier);
+        }
+    }
+    return result;
+}
+
+// Run every increment not done yet, publishing a snapshot every step increments
+// and saving a checkpoint every checkpointEvery windows and at the end.
+// Returns 0 when done, WINDOW_INTERRUPTED if a server command or a signal cut it short, -1 on error.
+static int runSimulation(Simulation *sim, Notifier *notifier, ControlBlock *control)
+{
+    int step = WINDOW_INCREMENTS; // How many iterations to run before sending data
+    int windows = 0;
+
+    // Semaphores from Python replace the fixed sleeps
+    int sleepBetween = (sim->pace == PACE_VISUAL && notifier == NULL);
+    if (sleepBetween)
+    {
+        double sleepStart = omp_get_wtime();
+        usleep(100000);
+        addPhase(sim->profile, PHASE_SLEEP, sleepStart);
+    }
+
+    // Full windows, then whatever does not divide evenly
+    while (sim->done < sim->increments)
+    {
+        int window = (sim->increments - sim->done < step) ? sim->increments - sim->done : step;
+
+        // Perform this window's iterations
+        int result = advanceWindow(sim, window, notifier, control);
+        int skipped = (result == WINDOW_SKIPPED);
+        if (skipped)
+        {
+            result = 0;
+        }
+        if (result == WINDOW_INTERRUPTED && stopRequested && sim->checkpointPath != NULL)
+        {
+            // Stopped while waiting for the reader, the last finished window is saved
+            double checkpointStart = omp_get_wtime();
+            int saved = saveCheckpoint(sim);
+            addPhase(sim->profile, PHASE_CHECKPOINT, checkpointStart);
+            return (saved == 0) ? WINDOW_INTERRUPTED : -1;
+        }
+        if (result != 0)
+        {
+            return result;
+        }
+        sim->done += window;
+        windows++;
+
+        if (sim->checkpointPath != NULL)
+        {
+            int finished = (sim->done == sim->increments);
+            if (finished || stopRequested || windows % sim->checkpointEvery == 0)
+            {
+                double checkpointStart = omp_get_wtime();
+                int saved = saveCheckpoint(sim);
+                addPhase(sim->profile, PHASE_CHECKPOINT, checkpointStart);
+                if (saved != 0)
+                {
+                    return -1;
+                }
+            }
+            if (stopRequested && !finished)
+            {
+                return WINDOW_INTERRUPTED;
+            }
+        }
+
+        // Microseconds. After a skipped window the sleep is spent polling
+        // for Python to take the last snapshot, so it counts as blocked.
+        if (sleepBetween)
+        {
+            double sleepStart = omp_get_wtime();
+            usleep((window == step) ? 55000 : 105000);
+            addPhase(sim->profile, skipped ? PHASE_BLOCKED : PHASE_SLEEP, sleepStart);
+        }
+    }
+    return 0;
+}
+
+// Set the thread count, capped at the cores there are
+static void setCores(int coresToUse)
+{
     // Error detection for incorrect cores
     if (coresToUse > omp_get_num_procs()) 
     {
         printf("Not enough cores. Using max: %d\n", omp_get_num_procs());
         coresToUse = omp_get_num_procs();
     } 
-    
-    // Set cores
     omp_set_num_threads(coresToUse);
-    
-    // Allocate specific storage for each core's RNG state
-    pcg32_random_t *rng_states = malloc(coresToUse * sizeof(pcg32_random_t));
-    if (rng_states == NULL) 
+    setBlockSchedule(0);
+}
+
+// Set the thread count from a numCores argument: a count, or auto for the
+// fastest calibrated setting for this many walkers
+static void chooseCores(const char *cores, int mode, int kernel, int numParticles, const RunOptions *options)
+{
+    if (strcmp(cores, "auto") != 0)
+    {
+        setCores(atoi(cores));
+        return;
+    }
+    // Lattice work grows with the run length, not the walkers
+    if (mode == MODE_LATTICE)
+    {
+        printf("Auto: lattice mode uses all %d cores\n", omp_get_num_procs());
+        setCores(omp_get_num_procs());
+        return;
+    }
+
+    TuneResult best;
+    if (autotune(kernel, numParticles, options->numa, options->retune, &best) != 0)
+    {
+        printf("Calibration failed. Using all %d cores\n", omp_get_num_procs());
+        setCores(omp_get_num_procs());
+        return;
+    }
+    printf("Auto: %d threads, chunk %d\n", best.threads, best.chunk);
+    setCores(best.threads);
+    setBlockSchedule(best.chunk);
+}
+
+// Calibration times moveParticles, so modes with their own loops take a core
+// count. Returns nonzero if cores is auto.
+static int rejectAutoCores(const char *cores, const char *mode)
+{
+    if (strcmp(cores, "auto") != 0)
+    {
+        return 0;
+    }
+    printf("numCores auto calibrates the run kernel, %s needs a core count\n", mode);
+    return 1;
+}
+
+// Pin the threads when the run asked for NUMA placement
+static void applyPlacement(const RunOptions *options)
+{
+    if (!options->numa)
+    {
+        return;
+    }
+    int pinned = pinThreads();
+    if (pinned < 0)
+    {
+        printf("Could not pin threads, they stay unpinned\n");
+        return;
+    }
+    printf("Pinned %d threads\n", pinned);
+}
+
+// Run every parameter set of a sweep table in one pass and write one indexed output
+static int sweepMain(int argc, char *argv[])
+{
+    const char *tablePath = argv[2];
+    int numParticles = atoi(argv[3]); // Particles per parameter set
+    const char *cores = argv[4];
+    const char *outputPath = argv[5];
+
+    RunOptions options;
+    if (parseOptions(argc, argv, 6, &options) != 0)
+    {
+        return 1;
+    }
+    if (numParticles <= 0)
+    {
+        printf("Invalid particle count: %d\n", numParticles);
+        return 1;
+    }
+
+    SweepSet *sets = NULL;
+    int numSets = readSweepTable(tablePath, &sets);
+    if (numSets < 0)
+    {
+        return 1;
+    }
+    for (int s = 0; s < numSets; s++)
+    {
+        printf("Set %d: dt %g T %g D %g b %g gamma %g, increments %d\n", s, sets[s].deltaT, sets[s].timeConst, sets[s].diffCon, sets[s].bSpin, sets[s].gamma, sets[s].increments);
+    }
+    printf("Seed: %llu\n", (unsigned long long)options.seed);
+
+    if (rejectAutoCores(cores, "--sweep"))
+    {
+        freeSweepSets(sets, numSets);
+        return 1;
+    }
+    setCores(atoi(cores));
+    applyPlacement(&options);
+
+    int numStreams = getSweepStreams(numSets, numParticles);
+    RngStream *rng_streams = allocate_rng_streams(numStreams);
+    if (rng_streams == NULL)
     {
         perror("Failed to allocate memory, returning");
-        fflush(stdout);
-        
-        free(rng_states);
-        exit(0);
+        freeSweepSets(sets, numSets);
+        return 1;
     }
+    initialize_rng_streams(rng_streams, numStreams, options.seed);
 
-    // Set unique states for each thread, used for randomness
-    initialize_rng_states(coresToUse, rng_states);
+    double startTime = omp_get_wtime();
+    int result = runSweep(sets, numSets, numParticles, rng_streams);
+    if (result == 0)
+    {
+        printf("Sweep of %d sets completed in %.2f seconds\n", numSets, omp_get_wtime() - startTime);
+        result = writeSweepCSV(outputPath, sets, numSets, numParticles);
+    }
 
-    printf("All initialization successful. Running.\n");
+    free(rng_streams);
+    freeSweepSets(sets, numSets);
+    return (result == 0) ? 0 : 1;
+}
 
-    // Calculate step break to send data back to python
-    int totalSteps = increments / step;
-    int remainder = increments % step;
-    
-    // Open shared memory
-    int fd;
-    ParticleStruct* particleList = initializeParticles(numParticles, &fd);
-    if (particleList == NULL)
+// Walk one block aligned range of a run's walkers and write its mergeable counts and moment sums
+static int shardMain(int argc, char *argv[])
+{
+    float deltaT = atof(argv[2]);
+    float timeConst = atof(argv[3]);
+    float diffCon = atof(argv[4]);
+    float bSpin = atof(argv[5]);
+    float gamma = atof(argv[6]);
+    int64_t firstParticle = strtoll(argv[7], NULL, 10); // Global index, walkers of the whole run may not fit an int
+    int numParticles = atoi(argv[8]);
+    const char *cores = argv[9];
+    const char *outputPath = argv[10];
+
+    RunOptions options;
+    if (parseOptions(argc, argv, 11, &options) != 0 || rejectAutoCores(cores, "--shard"))
     {
-        perror("Failed to init particles. Returning.\n");
-        fflush(stdout);
-        close(fd);        
-        free(rng_states);
-        exit(0);
+        return 1;
+    }
+    setCores(atoi(cores));
+    applyPlacement(&options);
+
+    ShardResult shard;
+    if (createShard(&shard, deltaT, timeConst, diffCon, bSpin, gamma, firstParticle, numParticles, WINDOW_INCREMENTS, options.seed) != 0)
+    {
+        freeShard(&shard);
+        return 1;
     }
-    if (particleList->count != numParticles)
+    printf("Shard of %d walkers from %lld, increments %d, seed %llu\n", numParticles, (long long)firstParticle,
+           shard.header.increments, (unsigned long long)options.seed);
+
+    double startTime = omp_get_wtime();
+    int result = runShard(&shard);
+    if (result == 0)
     {
-        printf("Size mismatch, expected %d, got %d. Returning. \n", numParticles, particleList->count);
-        munmap(particleList, getSize(numParticles));
-        close(fd);        
-        free(rng_states);
-        exit(0);
+        printf("Shard completed in %.2f seconds\n", omp_get_wtime() - startTime);
+        result = writeShard(outputPath, &shard);
     }
+    freeShard(&shard);
+    return (result == 0) ? 0 : 1;
+}
+
+// Time a kernel on a private block and print one JSON line for benchmark.py
+static int benchMain(int argc, char *argv[])
+{
+    BenchConfig config;
+    config.numParticles = atoi(argv[2]);
+    int coresToUse = atoi(argv[3]);
+    config.window = atoi(argv[4]);
+    config.windows = atoi(argv[5]);
+    config.warmup = atoi(argv[6]);
+    config.repeats = atoi(argv[7]);
 
-    usleep(100000);
-    // For each increment defined
-    for (int g = 0; g < totalSteps; g++)
+    RunOptions options;
+    if (parseOptions(argc, argv, 8, &options) != 0)
     {
-        // Perform this step's iterations
-        if (moveParticles(particleList, moveProb, jumpProb, rng_states, step) != 0)
+        return 1;
+    }
+    config.mode = options.mode;
+    config.kernel = options.kernel;
+    config.seed = options.seed;
+    config.numa = options.numa;
+    setCores(coresToUse);
+    applyPlacement(&options);
+
+    double *seconds = (config.repeats > 0) ? malloc((size_t)config.repeats * sizeof(double)) : NULL;
+    if (seconds == NULL || runBenchmark(&config, seconds) != 0)
+    {
+        printf("Benchmark failed. Returning.\n");
+        free(seconds);
+        return 1;
+    }
+
+    const char *kernel = (config.mode == MODE_LATTICE) ? "lattice" : (config.kernel == KERNEL_SIMD) ? "simd" : "scalar";
+    printf("{\"kernel\": \"%s\", \"particles\": %d, \"threads\": %d, \"window\": %d, \"windows\": %d, \"warmup\": %d, \"seconds\": [",
+           kernel, config.numParticles, omp_get_max_threads(), config.window, config.windows, config.warmup);
+    for (int r = 0; r < config.repeats; r++)
+    {
+        printf("%s%.9g", (r > 0) ? ", " : "", seconds[r]);
+    }
+    printf("]}\n");
+    free(seconds);
+    return 0;
+}
+
+// Stay resident, rebuilding and rerunning the simulation whenever Python sends a reset
+static int serverMain(int argc, char *argv[])
+{
+    const char *cores = argv[2];
+    // Auto calibrates for the walkers of every reset
+    int autoCores = (strcmp(cores, "auto") == 0);
+
+    // Only --notify, --stats, --numa and --retune apply, every reset brings its own settings
+    RunOptions serverOptions;
+    if (parseOptions(argc, argv, 3, &serverOptions) != 0)
+    {
+        return 1;
+    }
+    if (!autoCores)
+    {
+        setCores(atoi(cores));
+        applyPlacement(&serverOptions);
+    }
+
+    int controlFd;
+    ControlBlock *control = openControlBlock(&controlFd);
+    if (control == NULL)
+    {
+        return 1;
+    }
+    Notifier *notifier = NULL;
+    if (serverOptions.notify)
+    {
+        notifier = openNotifier();
+        if (notifier == NULL)
         {
-            printf("Move particles failed. Returning.\n");
-            fflush(stdout);
-            munmap(particleList, getSize(numParticles));
-            close(fd);
-            free(rng_states);
-            exit(1);
+            printf("Failed to open notification semaphores. Returning.\n");
+            closeControlBlock(control, controlFd);
+            return 1;
         }
-        // Microseconds
-        usleep(55000);
     }
 
-    // If step does not divide evenly, finish off iterations
-    if (remainder > 0)
+    Simulation sim;
+    memset(&sim, 0, sizeof(sim));
+    sim.fd = -1;
+    printf("Server ready.\n");
+
+    while (1)
     {
-        if (moveParticles(particleList, moveProb, jumpProb, rng_states, remainder) != 0)
+        waitForCommand(control, notifier);
+        uint32_t command = __atomic_load_n(&control->command, __ATOMIC_ACQUIRE);
+        if (control->action == CONTROL_QUIT)
+        {
+            acknowledgeCommand(control, command, 0);
+            break;
+        }
+        if (control->action == CONTROL_STOP)
         {
-            printf("Move particles failed. Returning.\n");
-            munmap(particleList, getSize(numParticles));
-            close(fd);
-            free(rng_states);
-            exit(0);
+            // Idle until the next reset, without the old run's memory
+            closeSimulation(&sim);
+            if (notifier != NULL)
+            {
+                drainReader(notifier);
+            }
+            acknowledgeCommand(control, command, 0);
+            continue;
         }
-        usleep(105000);
+
+        // Python has let go of the old block, so it can be resized
+        double resetStart = omp_get_wtime();
+        closeSimulation(&sim);
+        if (notifier != NULL)
+        {
+            drainReader(notifier);
+        }
+
+        RunOptions options = serverOptions;
+        options.seed = control->seed;
+        options.mode = control->mode;
+        options.kernel = control->kernel;
+        options.pace = control->pace;
+        if (autoCores)
+        {
+            chooseCores(cores, options.mode, options.kernel, control->numParticles, &options);
+            applyPlacement(&options);
+            // --retune renews the cache once, later resets reuse what it found
+            serverOptions.retune = 0;
+        }
+        int status = openSimulation(&sim, control->deltaT, control->timeConst, control->diffCon, control->bSpin, control->gamma, control->numParticles, &options, control->binWidth);
+        acknowledgeCommand(control, command, status);
+        if (status != 0)
+        {
+            continue;
+        }
+        printf("Reset in %.1f ms\n", (omp_get_wtime() - resetStart) * 1000);
+
+        if (runSimulation(&sim, notifier, control) < 0)
+        {
+            printf("Move particles failed. Waiting for a reset.\n");
+        }
+        writeStats(&sim);
     }
 
+    closeSimulation(&sim);
+    closeNotifier(notifier);
+    closeControlBlock(control, controlFd);
+    return 0;
+}
+
+int main(int argc, char *argv[]) {
+    setbuf(stdout, NULL);
+
+    if (argc >= 6 && strcmp(argv[1], "--sweep") == 0) {
+        return sweepMain(argc, argv);
+    }
+    if (argc >= 11 && strcmp(argv[1], "--shard") == 0) {
+        return shardMain(argc, argv);
+    }
+    if (argc >= 8 && strcmp(argv[1], "--bench") == 0) {
+        return benchMain(argc, argv);
+    }
+    if (argc >= 3 && strcmp(argv[1], "--server") == 0) {
+        return serverMain(argc, argv);
+    }
+    
+    if (argc < 8) {
+        printf("Usage: ./RWoperation.exe <deltaT> <timeConst> <diffCon> <bSpin> <gamma> <numParticles> <numCores> [--seed <seed>] [--mode particles|lattice] [--kernel scalar|simd] [--pace visual|max] [--notify] [--numa]\n");
+        printf("           [--bin-width <sites>] [--checkpoint <file>] [--checkpoint-every <windows>] [--resume <file> | --fork <file>]\n");
+        printf("           [--moments <increments>] [--moments-file <file>] [--stats <file>]\n");
+        printf("       ./RWoperation.exe --sweep <table.csv> <numParticles> <numCores> <output.csv> [--seed <seed>] [--numa]\n");
+        printf("       ./RWoperation.exe --shard <deltaT> <timeConst> <diffCon> <bSpin> <gamma> <firstParticle> <numParticles> <numCores> <output> [--seed <seed>] [--numa]\n");
+        printf("       ./RWoperation.exe --bench <numParticles> <numCores> <window> <windows> <warmupWindows> <repeats> [--mode particles|lattice] [--kernel scalar|simd] [--seed <seed>] [--numa]\n");
+        printf("       ./RWoperation.exe --server <numCores> [--notify] [--stats <file>] [--numa]\n");
+        printf("       numCores auto (runs and --server) picks the fastest calibrated thread count, cached per walker count [--retune]\n");
+        return 1;
+    }
+    
+    // Parameters
+    float deltaT = atof(argv[1]); // Delta t
+    float timeConst = atof(argv[2]); // Time Constant
+    float diffCon = atof(argv[3]); // Diffusion Constant
+    float bSpin = atof(argv[4]); // beta / bias
+    float gamma = atof(argv[5]); // GammaRWo
+    int numParticles = atoi(argv[6]); // Number of particles
+    const char *cores = argv[7]; // Cores to use in multithreading, or auto
+
+    // Optional settings
+    RunOptions options;
+    if (parseOptions(argc, argv, 8, &options) != 0)
+    {
+        return 1;
+    }
+    chooseCores(cores, options.mode, options.kernel, numParticles, &options);
+    applyPlacement(&options);
+
+    Simulation sim;
+    if (openSimulation(&sim, deltaT, timeConst, diffCon, bSpin, gamma, numParticles, &options, options.binWidth) != 0)
+    {
+        return 1;
+    }
+
+    Notifier *notifier = NULL;
+    if (options.notify)
+    {
+        notifier = openNotifier();
+        if (notifier == NULL)
+        {
+            printf("Failed to open notification semaphores. Returning.\n");
+            closeSimulation(&sim);
+            return 1;
+        }
+    }
+
+    // A checkpointed run saves its state before stopping on a signal. Without
+    // SA_RESTART the signal also breaks a wait on the reader's semaphore.
+    if (options.checkpointPath != NULL)
+    {
+        struct sigaction action;
+        memset(&action, 0, sizeof(action));
+        action.sa_handler = requestStop;
+        sigemptyset(&action.sa_mask);
+        sigaction(SIGINT, &action, NULL);
+        sigaction(SIGTERM, &action, NULL);
+    }
+
+    int result = runSimulation(&sim, notifier, NULL);
+    if (result == WINDOW_INTERRUPTED)
+    {
+        printf("Stopped at increment %d of %d, saved to %s\n", sim.done, sim.increments, options.checkpointPath);
+    }
+    else if (result != 0)
+    {
+        printf("Move particles failed. Returning.\n");
+    }
+    writeStats(&sim);
+
     // Dont close semaphore in case this is ran again. Python can clsoe.
-    munmap(particleList, getSize(numParticles));
-    close(fd);
-    free(rng_states);
+    closeSimulation(&sim);
+    closeNotifier(notifier);
     //printf("Total time: %.2f seconds\n", omp_get_wtime() - startTime);
-    return 0;
-}
\ No newline at end of file
+    return (result == 0) ? 0 : 1;
+}
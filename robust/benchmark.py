@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+import cache
+
+# Built with `make`, next to this file
+EXECUTABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RWoperation")
+# RWoperation options selecting each kernel
+KERNEL_OPTIONS = {
+    'scalar': ['--kernel', 'scalar'],
+    'simd': ['--kernel', 'simd'],
+    'lattice': ['--mode', 'lattice'],
+}
+# Slowdown counted as a regression, against the baseline or against fewer threads
+DEFAULT_TOLERANCE = 0.1
+
+
+def runKernel(kernel, particles, threads, window, windows, warmup, repeats, executable=EXECUTABLE_PATH, numa=False):
+    """
+    This function times one kernel configuration with RWoperation --bench. Each repetition runs windows
+    kernel calls of window increments after warmup untimed calls.
+
+    Input: kernel name (see KERNEL_OPTIONS), walkers, threads, increments per call, calls per repetition,
+    warm-up calls, repetitions, executable, whether to pin threads and use huge pages (--numa)
+
+    Output: dict of the configuration, threads actually used, seconds per repetition and the median
+    rate in particle-steps per second
+    """
+    command = [executable, '--bench', str(particles), str(threads), str(window), str(windows), str(warmup),
+               str(repeats)] + KERNEL_OPTIONS[kernel] + (['--numa'] if numa else [])
+    result = subprocess.run(command, capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"{' '.join(command)} failed: {result.stdout.strip()}")
+
+    measured = json.loads(lines[-1])
+    steps = particles * window * windows
+    return {
+        'kernel': kernel,
+        'particles': particles,
+        'threads': threads,
+        'threadsUsed': measured['threads'],
+        'window': window,
+        'windows': windows,
+        'numa': numa,
+        'seconds': measured['seconds'],
+        'rate': steps / statistics.median(measured['seconds']),
+    }
+
+
+def scalingPoints(mode, particles, threads):
+    """
+    This function lists the (walkers, threads) pairs of a scaling study. Strong scaling runs every walker
+    count at every thread count, weak scaling gives every thread the same walkers.
+
+    Input: 'strong' or 'weak', walker counts (per thread when weak), thread counts
+
+    Output: list of (walkers, threads)
+    """
+    if mode == 'strong':
+        return [(count, thread) for count in particles for thread in threads]
+    if mode == 'weak':
+        return [(count * thread, thread) for count in particles for thread in threads]
+    raise ValueError(f"Unknown scaling mode: {mode}")
+
+
+def runSuite(kernels, particles, threads, windowSizes, mode='strong', steps=1000, warmup=2, repeats=5, executable=EXECUTABLE_PATH, numa=False):
+    """
+    This function runs the whole benchmark grid: every kernel, scaling point and window size, each
+    walking steps increments per repetition.
+
+    Input: kernel names, walker counts, thread counts, increments per call, 'strong' or 'weak',
+    increments per repetition, warm-up calls, repetitions, executable, NUMA placement
+
+    Output: report dict with the machine, the kernel build and a list of results from runKernel
+    """
+    results = []
+    for kernel in kernels:
+        for count, thread in scalingPoints(mode, particles, threads):
+            for window in windowSizes:
+                result = runKernel(kernel, count, thread, window, max(1, steps // window), warmup, repeats, executable, numa)
+                # Walkers per thread tell weak scaling series apart
+                result['series'] = count // thread if mode == 'weak' else count
+                results.append(result)
+                print(f"{kernel} {count} walkers, {result['threadsUsed']} threads, window {window}: {result['rate']:.4g} particle-steps/s")
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'processor': platform.processor() or platform.machine(),
+        'cores': os.cpu_count(),
+        'kernelVersion': cache.kernelVersion(executable),
+        'mode': mode,
+        'numa': numa,
+        'steps': steps,
+        'results': results,
+    }
+
+
+def _resultKey(result):
+    """Fields identifying the same measurement in two reports."""
+    return (result['kernel'], result['particles'], result['threadsUsed'], result['window'], result.get('numa', False))
+
+
+def checkRegressions(report, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    This function finds scaling regressions: configurations more than tolerance slower than in the
+    baseline, and thread counts slower than fewer threads on the same series (negative scaling).
+
+    Input: report from runSuite, optional baseline report, allowed slowdown as a fraction
+
+    Output: list of messages, empty when nothing regressed
+    """
+    messages = []
+    series = {}
+    for result in report['results']:
+        key = (result['kernel'], result.get('series', result['particles']), result['window'])
+        series.setdefault(key, []).append(result)
+    for (kernel, count, window), points in series.items():
+        points = sorted(points, key=lambda result: result['threadsUsed'])
+        for fewer, more in zip(points, points[1:]):
+            if more['threadsUsed'] > fewer['threadsUsed'] and more['rate'] < fewer['rate'] * (1 - tolerance):
+                messages.append(f"Negative scaling: {kernel}, {count} walkers, window {window}: {more['threadsUsed']} threads "
+                                f"run at {more['rate']:.4g} particle-steps/s, {fewer['threadsUsed']} threads at {fewer['rate']:.4g}")
+
+    if baseline is not None:
+        previous = {_resultKey(result): result for result in baseline['results']}
+        for result in report['results']:
+            old = previous.get(_resultKey(result))
+            if old is not None and result['rate'] < old['rate'] * (1 - tolerance):
+                messages.append(f"Regression: {result['kernel']}, {result['particles']} walkers, {result['threadsUsed']} threads, "
+                                f"window {result['window']}: {result['rate']:.4g} particle-steps/s, baseline {old['rate']:.4g}")
+    return messages
+
+
+def formatTimingTable(report):
+    """
+    This function renders a report in the style of timing.md: wall time for the increments actually
+    run (window * windows, whole windows only) per walker count and core count, plus the rate.
+
+    Input: report from runSuite
+
+    Output: markdown text
+    """
+    placement = ", NUMA placement" if report.get('numa') else ""
+    lines = [f"## {report['host']} ({report['cores']} cores), {report['date']}", f"{report['mode'].capitalize()} scaling{placement}", ""]
+    sections = {}
+    for result in report['results']:
+        sections.setdefault((result['kernel'], result['window'], result['particles']), []).append(result)
+    for (kernel, window, count), results in sections.items():
+        steps = window * results[0]['windows']
+        lines.append(f"# {kernel} kernel, {count:,} Walkers and {steps:,} Steps, window {window}")
+        for result in sorted(results, key=lambda result: result['threadsUsed']):
+            cores = result['threadsUsed']
+            seconds = count * result['window'] * result['windows'] / result['rate']
+            lines.append(f"{cores} {'core' if cores == 1 else 'cores'} - {seconds:.2f} seconds ({result['rate']:.3g} particle-steps/s)")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    This function is the command line: run the grid, write the JSON report, optionally append a
+    timing.md section, and exit with status 1 if anything regressed.
+
+    Input: command line arguments (sys.argv if None)
+
+    Output: exit status
+    """
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the RWoperation kernels")
+    parser.add_argument('--kernels', nargs='+', default=list(KERNEL_OPTIONS), choices=list(KERNEL_OPTIONS))
+    parser.add_argument('--particles', nargs='+', type=int, default=[100000, 1000000], help="walkers, per thread with --mode weak")
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--windows', nargs='+', type=int, default=[10], help="increments per kernel call")
+    parser.add_argument('--mode', choices=('strong', 'weak'), default='strong')
+    parser.add_argument('--steps', type=int, default=1000, help="increments per repetition")
+    parser.add_argument('--warmup', type=int, default=2, help="untimed kernel calls first")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--executable', default=EXECUTABLE_PATH)
+    parser.add_argument('--numa', action='store_true', help="pin threads and back the block with huge pages")
+    parser.add_argument('--output', default="benchmark.json")
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--timing', help="markdown file to append a timing section to, such as timing.md")
+    args = parser.parse_args(argv)
+
+    report = runSuite(args.kernels, args.particles, args.threads, args.windows, args.mode, args.steps,
+                      args.warmup, args.repeats, args.executable, args.numa)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    report['tolerance'] = args.tolerance
+    report['regressions'] = checkRegressions(report, baseline, args.tolerance)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    if args.timing is not None:
+        with open(args.timing, 'a') as file:
+            file.write("\n" + formatTimingTable(report))
+
+    for message in report['regressions']:
+        print(message)
+    return 1 if report['regressions'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Finished runs, one directory per key
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "randomwalks")
+# Least recently used entries are removed once the cache grows past this
+CACHE_LIMIT = 1 << 30
+# Arrays stored with an entry
+ARRAYS_NAME = "arrays.npz"
+
+_kernelVersions = {}
+
+
+def kernelVersion(executable):
+    """
+    This function identifies the simulator build by the SHA-256 of its executable, so a rebuilt kernel
+    never reuses results of the old one. Hashes are remembered per path, size and modification time.
+
+    Input: path to the executable
+
+    Output: hex digest
+    """
+    stat = os.stat(executable)
+    signature = (os.path.abspath(executable), stat.st_size, stat.st_mtime_ns)
+    if signature not in _kernelVersions:
+        digest = hashlib.sha256()
+        with open(executable, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        _kernelVersions[signature] = digest.hexdigest()
+    return _kernelVersions[signature]
+
+
+def cacheKey(params, executable):
+    """
+    This function builds the content address of a run. Floats are rounded to float32 first, the precision
+    the simulator parses them at, so 0.1 and 0.10000000149 share an entry.
+
+    Input: dict of everything that changes the result (parameters, particles, seed, mode...), executable
+
+    Output: hex key
+    """
+    normalized = {name: float(np.float32(value)) if isinstance(value, float) else value for name, value in params.items()}
+    normalized['kernel version'] = kernelVersion(executable)
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def lookupResult(key, directory=CACHE_DIR):
+    """
+    This function finds a cached run and marks it as recently used.
+
+    Input: key from cacheKey, cache directory
+
+    Output: path of the entry directory, or None on a miss
+    """
+    entry = os.path.join(directory, key)
+    if not os.path.isdir(entry):
+        return None
+    os.utime(entry)
+    return entry
+
+
+def loadArrays(entry):
+    """
+    This function reads the arrays stored with an entry.
+
+    Input: entry directory from lookupResult
+
+    Output: dict of arrays
+    """
+    with np.load(os.path.join(entry, ARRAYS_NAME)) as arrays:
+        return dict(arrays)
+
+
+def storeResult(key, files=(), arrays=None, directory=CACHE_DIR, limit=CACHE_LIMIT):
+    """
+    This function adds a run to the cache. The entry is assembled in a temporary directory and renamed
+    into place, so readers never see half an entry, then old entries are evicted down to the limit.
+
+    Input: key from cacheKey, files to copy in under their own names, dict of arrays to store, cache
+    directory, size limit in bytes
+
+    Output: path of the entry directory
+    """
+    os.makedirs(directory, exist_ok=True)
+    entry = os.path.join(directory, key)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=directory)
+    try:
+        for path in files:
+            shutil.copyfile(path, os.path.join(staging, os.path.basename(path)))
+        if arrays is not None:
+            np.savez(os.path.join(staging, ARRAYS_NAME), **arrays)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(staging, entry)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    evictResults(directory, limit)
+    return entry
+
+
+def evictResults(directory=CACHE_DIR, limit=CACHE_LIMIT):
+    """
+    This function removes least recently used entries until the cache fits the limit.
+
+    Input: cache directory, size limit in bytes
+
+    Output: number of entries removed
+    """
+    entries = []
+    for name in os.listdir(directory):
+        entry = os.path.join(directory, name)
+        if name.startswith('.') or not os.path.isdir(entry):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+        entries.append((os.path.getmtime(entry), size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, entry in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
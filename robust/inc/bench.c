@@ -0,0 +1,116 @@
+#include <stdio.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include "helper.h"
+#include "lattice.h"
+#include "simd.h"
+#include "histogram.h"
+#include "server.h"
+#include "bench.h"
+
+// Kernels are timed exactly as a server runs them: same block layout with a
+// histogram region, same streams and scratch, one call per window. Only the
+// block is private, so a benchmark never disturbs a GUI on the same machine.
+
+// Everything a benchmark allocates
+typedef struct {
+    ParticleStruct *block;
+    RngStream *rng_streams;
+    SimdStream *simd_streams;
+    LatticeState *lattice;
+    HistogramScratch *histogram;
+} BenchState;
+
+static void freeBenchState(BenchState *state)
+{
+    if (state->block != NULL) {
+        munmap(state->block, getMappedSize(state->block));
+    }
+    free(state->rng_streams);
+    free(state->simd_streams);
+    freeLatticeState(state->lattice);
+    freeHistogramScratch(state->histogram);
+}
+
+// Run the warm-up calls, then time each repetition of windows calls
+static int timeWindows(const BenchConfig *config, BenchState *state, double *seconds)
+{
+    float moveProb = moveProbCalc(BENCH_DIFFUSION, BENCH_DRIFT, BENCH_DELTA_T);
+    float jumpProb = BENCH_GAMMA * BENCH_DELTA_T;
+    int calls = config->warmup + config->repeats * config->windows;
+
+    for (int call = 0; call < calls; call++)
+    {
+        int timed = call - config->warmup;
+        if (timed >= 0 && timed % config->windows == 0) {
+            seconds[timed / config->windows] = omp_get_wtime();
+        }
+
+        int status;
+        if (state->lattice != NULL) {
+            status = advanceLattice(state->block, state->lattice, moveProb, jumpProb, state->rng_streams, config->window);
+        } else if (state->simd_streams != NULL) {
+            status = moveParticlesSimd(state->block, moveProb, jumpProb, state->simd_streams, config->window, state->histogram);
+        } else {
+            status = moveParticles(state->block, moveProb, jumpProb, state->rng_streams, config->window, state->histogram, NULL, 0);
+        }
+        if (status != 0) {
+            return -1;
+        }
+
+        if (timed >= 0 && timed % config->windows == config->windows - 1) {
+            seconds[timed / config->windows] = omp_get_wtime() - seconds[timed / config->windows];
+        }
+    }
+    return 0;
+}
+
+int runBenchmark(const BenchConfig *config, double *seconds)
+{
+    if (config->numParticles <= 0 || config->window <= 0 || config->windows <= 0 || config->warmup < 0 || config->repeats <= 0)
+    {
+        printf("Invalid benchmark: %d walkers, window %d, %d windows, warm-up %d, %d repeats\n", config->numParticles,
+               config->window, config->windows, config->warmup, config->repeats);
+        return -1;
+    }
+
+    int latticeMode = (config->mode == MODE_LATTICE);
+    int simd = (!latticeMode && config->kernel == KERNEL_SIMD);
+    int calls = config->warmup + config->repeats * config->windows;
+    // Every walker must stay on the lattice for all the increments of all calls
+    int sites = getLatticeSites(calls * config->window + 1);
+    int numStreams = latticeMode ? getNumStreams(sites) : getNumStreams(config->numParticles);
+
+    BenchState state = {0};
+    state.block = createPrivateBlock(config->numParticles, latticeMode ? LAYOUT_LATTICE : LAYOUT_COMPACT, sites, 1, config->numa);
+    state.rng_streams = allocate_rng_streams(numStreams);
+    if (simd) {
+        state.simd_streams = allocate_simd_streams(numStreams);
+    }
+    if (state.block != NULL) {
+        if (latticeMode) {
+            state.lattice = createLatticeState(state.block);
+        } else {
+            state.histogram = createHistogramScratch(state.block, omp_get_max_threads());
+        }
+    }
+
+    int result = -1;
+    if (state.block == NULL || state.rng_streams == NULL || (simd && state.simd_streams == NULL)
+        || (latticeMode ? state.lattice == NULL : state.histogram == NULL))
+    {
+        perror("Failed to allocate benchmark, returning");
+    }
+    else
+    {
+        initialize_rng_streams(state.rng_streams, numStreams, config->seed);
+        if (simd) {
+            initialize_simd_streams(state.simd_streams, numStreams, config->seed);
+        }
+        result = timeWindows(config, &state, seconds);
+    }
+    freeBenchState(&state);
+    return result;
+}
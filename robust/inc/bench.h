@@ -0,0 +1,31 @@
+#ifndef BENCH_H_INCLUDED
+#define BENCH_H_INCLUDED
+
+#include <stdint.h>
+#include "helper.h"
+
+// Fixed physics for every benchmark, so rates stay comparable between runs.
+// Gamma is nonzero so both the jump and the move branch are exercised.
+#define BENCH_DELTA_T 0.01f
+#define BENCH_DIFFUSION 1.0f
+#define BENCH_DRIFT 0.5f
+#define BENCH_GAMMA 1.0f
+
+typedef struct {
+    int mode;         // MODE_PARTICLES or MODE_LATTICE
+    int kernel;       // KERNEL_SCALAR or KERNEL_SIMD, particles only
+    int numParticles;
+    int window;       // Increments per kernel call, like one published window
+    int windows;      // Kernel calls per timed repetition
+    int warmup;       // Kernel calls before the first repetition
+    int repeats;
+    int numa;         // Huge pages for the block, threads are pinned by the caller
+    uint64_t seed;
+} BenchConfig;
+
+// Time the kernel on a private block with a histogram region, as a server
+// runs it. Fills seconds[repeats] with the wall time of each repetition.
+// Returns 0 or -1.
+int runBenchmark(const BenchConfig *config, double *seconds);
+
+#endif
@@ -0,0 +1,128 @@
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include "helper.h"
+#include "histogram.h"
+#include "checkpoint.h"
+
+// Offset of the stream array in a checkpoint file
+size_t getCheckpointStreamOffset(const CheckpointHeader *info)
+{
+    size_t offset = sizeof(CheckpointHeader) + info->bodyBytes;
+    // Keep the uint64 stream words aligned for readers mapping the file
+    return (offset + 7) & ~(size_t)7;
+}
+
+// Write through a temporary file so a kill mid-write leaves the last checkpoint intact
+int writeCheckpoint(const char *path, CheckpointHeader *info, const ParticleStruct *sharedData, const void *streams)
+{
+    memcpy(info->magic, CHECKPOINT_MAGIC, 4);
+    info->version = CHECKPOINT_VERSION;
+    info->bodyBytes = getBodySize(sharedData) - sizeof(ParticleStruct);
+    size_t size = getCheckpointStreamOffset(info) + info->streamBytes;
+
+    size_t pathLength = strlen(path);
+    char *tempPath = malloc(pathLength + 5);
+    if (tempPath == NULL) {
+        perror("Failed to allocate checkpoint path");
+        return -1;
+    }
+    memcpy(tempPath, path, pathLength);
+    memcpy(tempPath + pathLength, ".tmp", 5);
+
+    int fd = open(tempPath, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if (fd == -1)
+    {
+        perror("Failed to open checkpoint");
+        free(tempPath);
+        return -1;
+    }
+    if (ftruncate(fd, (off_t)size) == -1)
+    {
+        perror("Failed to size checkpoint");
+        close(fd);
+        unlink(tempPath);
+        free(tempPath);
+        return -1;
+    }
+    char *file = mmap(0, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (file == MAP_FAILED)
+    {
+        perror("Failed to map checkpoint");
+        close(fd);
+        unlink(tempPath);
+        free(tempPath);
+        return -1;
+    }
+
+    memcpy(file, info, sizeof(CheckpointHeader));
+    memcpy(file + sizeof(CheckpointHeader), (const char *)sharedData + sizeof(ParticleStruct), info->bodyBytes);
+    memcpy(file + getCheckpointStreamOffset(info), streams, info->streamBytes);
+
+    int result = msync(file, size, MS_SYNC);
+    munmap(file, size);
+    close(fd);
+    if (result == 0) {
+        result = rename(tempPath, path);
+    }
+    if (result != 0)
+    {
+        perror("Failed to write checkpoint");
+        unlink(tempPath);
+    }
+    free(tempPath);
+    return (result == 0) ? 0 : -1;
+}
+
+// Map a checkpoint read only and check it, NULL on error
+void* mapCheckpoint(const char *path, CheckpointHeader *info, size_t *size)
+{
+    int fd = open(path, O_RDONLY);
+    if (fd == -1)
+    {
+        perror("Failed to open checkpoint");
+        return NULL;
+    }
+    struct stat st;
+    if (fstat(fd, &st) == -1 || (size_t)st.st_size < sizeof(CheckpointHeader))
+    {
+        printf("Checkpoint %s is too short\n", path);
+        close(fd);
+        return NULL;
+    }
+    *size = (size_t)st.st_size;
+    void *checkpoint = mmap(0, *size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (checkpoint == MAP_FAILED)
+    {
+        perror("Failed to map checkpoint");
+        return NULL;
+    }
+
+    memcpy(info, checkpoint, sizeof(CheckpointHeader));
+    if (memcmp(info->magic, CHECKPOINT_MAGIC, 4) != 0 || info->version != CHECKPOINT_VERSION)
+    {
+        printf("%s is not a version %d checkpoint\n", path, CHECKPOINT_VERSION);
+        munmap(checkpoint, *size);
+        return NULL;
+    }
+    if (getCheckpointStreamOffset(info) + info->streamBytes > *size)
+    {
+        printf("Checkpoint %s is truncated\n", path);
+        munmap(checkpoint, *size);
+        return NULL;
+    }
+    return checkpoint;
+}
+
+void unmapCheckpoint(void *checkpoint, size_t size)
+{
+    if (checkpoint != NULL) {
+        munmap(checkpoint, size);
+    }
+}
@@ -0,0 +1,48 @@
+#ifndef CHECKPOINT_H_INCLUDED
+#define CHECKPOINT_H_INCLUDED
+
+#include <stdint.h>
+#include <stddef.h>
+#include "helper.h"
+
+// Checkpoint file: this header, the shared block body (particles or lattice
+// counts, no histogram), then the raw stream array of the kernel in use
+#define CHECKPOINT_MAGIC "RWCK"
+#define CHECKPOINT_VERSION 1
+
+// Windows between checkpoints unless --checkpoint-every says otherwise
+#define DEFAULT_CHECKPOINT_EVERY 100
+
+typedef struct {
+    char magic[4];
+    uint32_t version;
+    int layout;
+    int kernel;
+    int count;
+    int sites;
+    int increments;      // Increments the run was asked for
+    int done;            // Increments already applied to the saved state
+    float deltaT;
+    float timeConst;
+    float diffCon;
+    float bSpin;
+    float gamma;
+    int numStreams;
+    uint64_t seed;
+    uint64_t bodyBytes;   // Bytes after the ParticleStruct header
+    uint64_t streamBytes; // numStreams RngStream or SimdStream entries
+} CheckpointHeader;
+
+// Offset of the stream array in a checkpoint file
+size_t getCheckpointStreamOffset(const CheckpointHeader *info);
+
+// Write info, the body of sharedData and the streams through a memory
+// mapped temporary file, then rename it over path. Returns 0 or -1.
+int writeCheckpoint(const char *path, CheckpointHeader *info, const ParticleStruct *sharedData, const void *streams);
+
+// Map a checkpoint read only and check it, NULL on error
+void* mapCheckpoint(const char *path, CheckpointHeader *info, size_t *size);
+
+void unmapCheckpoint(void *checkpoint, size_t size);
+
+#endif
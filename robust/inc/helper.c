@@ -8,18 +8,43 @@
 #include <sys/stat.h>
 #include <unistd.h> 
 #include <errno.h>
+#include <string.h>
 #include "pcg_basic.h"
 #include "helper.h"
+#include "histogram.h"
+#include "checkpoint.h"
+#include "moments.h"
+#include "profile.h"
 
 #define SHM_NAME "/particle_shm"
 #ifndef HELPER_H
 #define HELPER_H
 
-// Calculate size of the shared memory block based on particles
-size_t getSize(int numParts)
+// Calculate size of the shared memory block based on particles and layout
+size_t getSize(int numParts, int layout)
 {
-    size_t size = sizeof(int) + sizeof(int) + 4 + numParts * sizeof(Particle);
-    return size;
+    if (layout == LAYOUT_COMPACT)
+    {
+        return sizeof(ParticleStruct) + numParts * sizeof(int32_t) + getLaneBytes(numParts);
+    }
+    return sizeof(ParticleStruct) + numParts * sizeof(Particle);
+}
+
+// Bytes needed to hold one lane bit per particle
+size_t getLaneBytes(int numParts)
+{
+    return ((size_t)numParts + 7) / 8;
+}
+
+// View the compact layout of a shared memory block as an arena
+// Positions follow the header, lane bits follow the positions
+ParticleArena getArena(ParticleStruct *sharedData)
+{
+    ParticleArena arena;
+    arena.count = sharedData->count;
+    arena.x = (int32_t *)((char *)sharedData + sizeof(ParticleStruct));
+    arena.lanes = (uint8_t *)(arena.x + arena.count);
+    return arena;
 }
 
 // Calculate probability for a move
@@ -45,131 +70,332 @@ float moveDistanceCalc(float diffusionConstant, float deltaT)
     return sqrt(2 * diffusionConstant * deltaT);
 }
 
-// Initialize particles within shared memory
-ParticleStruct* initializeParticles(int numParts, int* fd)
-{
-    // Try to open existing shared memory
-    *fd = shm_open(SHM_NAME,O_RDWR, 0666);
-    if (*fd == -1) 
-    {
-        perror("shm_open failed");
-        close(*fd);
-        return NULL;
-    }
-
-    // Map shared memory
-    size_t size = getSize(numParts);
-    void* shared_data = mmap(0, size, PROT_READ | PROT_WRITE, MAP_SHARED, *fd, 0);
-    if (shared_data == MAP_FAILED) 
-    {
-        perror("mmap failed");
-        close(*fd);
-        return NULL;
-    }
-    ParticleStruct* result = (ParticleStruct*)shared_data;
-    if (result->read != 1)
-    {
-        return NULL;
-    }
-    if (result->count != numParts) {
-        printf("Count mismatch: expected %d, got %d\n", numParts, result->count); 
-        fflush(stdout);
-        munmap(result, size);
-        close(*fd);
-        return NULL;
-    }
-
-    // Set read flag
-    result->read = 0;
-    
-    // Return the pointer to the shared memory
-    return result;
-}
-
 // Move particles in a given step
-int moveParticles(ParticleStruct *sharedData, float moveProb, float jumpProb, pcg32_random_t *rng_states, int step)
+// Moment samples are taken at every multiple of moments->every after first increments
+int moveParticles(ParticleStruct *sharedData, float moveProb, float jumpProb, RngStream *rng_streams, int step, HistogramScratch *histogram, MomentLog *moments, int first)
 {
     if (sharedData == NULL) {
         printf("Error: sharedData is NULL\n"); fflush(stdout);
         return -1;
     }
-    if (rng_states == NULL) {
-        printf("Error: rng_states is NULL\n"); fflush(stdout);
+    if (rng_streams == NULL) {
+        printf("Error: rng_streams is NULL\n"); fflush(stdout);
         return -1;
     }
-    if (sharedData->read != 1) {
-        //printf("Read value is not 1, cannot access.\n"); fflush(stdout);
-        return 0;
-    }
     if (sharedData->count <= 0) {
         printf("Invalid particle count: %d\n", sharedData->count); fflush(stdout);
         return -1;
     }
 
-    // For iterations in step
-    for (int k = 0; k < step; k++)
+    int count = sharedData->count;
+    int numBlocks = getNumStreams(count);
+
+    int layout = sharedData->layout;
+    int bins = sharedData->histBins;
+
+    beginSnapshot(sharedData);
+
+    // One parallel region for the whole window. The static schedule hands each
+    // thread a contiguous run of blocks unless setBlockSchedule picked smaller
+    // chunks, and each block carries its own stream. Blocks are a multiple of
+    // 8 particles, so no two threads share a lane byte.
+    #pragma omp parallel
     {
-        // For each particle, parallelized portion
-        #pragma omp parallel for
-        for (int i = 0; i < sharedData->count; i++)
-        {
-            // Get current thread
-            int thread_id = omp_get_thread_num();
-            // Calculate jump varaible
-            uint32_t rand_val = pcg32_random_r(&rng_states[thread_id]);
-            float jumpRand = (float)(rand_val & 0x7FFFFFFF) / (float)0x7FFFFFFF;
-            // If jump is satisfied, move particle to other line
-            if (jumpRand < jumpProb)
+        // Final positions are counted while they are still in registers
+        int64_t *localHist = beginThreadHistogram(histogram, bins);
+        MomentSums *localMoments = beginThreadMoments(moments);
+        int firstSample = (moments != NULL) ? getFirstSample(moments, first) : 0;
+        // Work counters, NULL when nothing is profiled
+        ThreadCounters *counters = beginThreadCounters();
+        double started = (counters != NULL) ? omp_get_wtime() : 0;
+        double walked = started;
+
+        if (layout == LAYOUT_COMPACT)
+        {
+            ParticleArena arena = getArena(sharedData);
+
+            #pragma omp for schedule(runtime)
+            for (int block = 0; block < numBlocks; block++)
             {
-                sharedData->particles[i].y = (sharedData->particles[i].y == 0) ? 1 : 0;
-                continue;
+                int start = block * RNG_BLOCK_SIZE;
+                int end = (start + RNG_BLOCK_SIZE < count) ? start + RNG_BLOCK_SIZE : count;
+
+                // Keep the RNG state local until the block is done
+                pcg32_random_t rng = rng_streams[block].rng;
+
+                // Eight particles per lane byte, byte written back once
+                for (int byte = start / 8; byte * 8 < end; byte++)
+                {
+                    uint8_t bits = arena.lanes[byte];
+                    for (int bit = 0; bit < 8 && byte * 8 + bit < end; bit++)
+                    {
+                        int i = byte * 8 + bit;
+                        int lane = (bits >> bit) & 1;
+                        if (localMoments != NULL) {
+                            walkSampled(&arena.x[i], &lane, moveProb, jumpProb, &rng, step, firstSample, moments->every, localMoments);
+                        } else {
+                            walkParticle(&arena.x[i], &lane, moveProb, jumpProb, &rng, step);
+                        }
+                        bits = (uint8_t)((bits & ~(1u << bit)) | ((unsigned)lane << bit));
+                        if (localHist != NULL) {
+                            localHist[lane * bins + histogramBin(sharedData, arena.x[i])]++;
+                        }
+                    }
+                    arena.lanes[byte] = bits;
+                }
+
+                // Save the RNG state for the next window
+                rng_streams[block].rng = rng;
+                if (counters != NULL) {
+                    walked = countBlock(counters, end - start, step);
+                }
             }
-            else
+        }
+        else
+        {
+            Particle *particles = sharedData->particles;
+
+            #pragma omp for schedule(runtime)
+            for (int block = 0; block < numBlocks; block++)
             {
-                
-                // Thread safe random number for x-axis
-                uint32_t rand_val1 = pcg32_random_r(&rng_states[thread_id]);
-                float moveRand = (float)(rand_val1 & 0x7FFFFFFF) / (float)0x7FFFFFFF;
-                // Flip probability if on the bottom line
-                float localMoveProb = (sharedData->particles[i].y == 0) ? 1 - moveProb : moveProb;
-                
-                if (moveRand > localMoveProb)
+                int start = block * RNG_BLOCK_SIZE;
+                int end = (start + RNG_BLOCK_SIZE < count) ? start + RNG_BLOCK_SIZE : count;
+
+                // Keep the RNG state local until the block is done
+                pcg32_random_t rng = rng_streams[block].rng;
+
+                for (int i = start; i < end; i++)
                 {
-                    // Move one discrete increment positive
-                    sharedData->particles[i].x += 1;
+                    // Work on a local copy of the particle, write it back once
+                    int32_t x = (int32_t)particles[i].x;
+                    int lane = (particles[i].y != 0);
+                    if (localMoments != NULL) {
+                        walkSampled(&x, &lane, moveProb, jumpProb, &rng, step, firstSample, moments->every, localMoments);
+                    } else {
+                        walkParticle(&x, &lane, moveProb, jumpProb, &rng, step);
+                    }
+                    particles[i].y = (float)lane;
+                    particles[i].x = (float)x;
+                    if (localHist != NULL) {
+                        localHist[lane * bins + histogramBin(sharedData, x)]++;
+                    }
                 }
-                else
-                {
-                    // Negative x
-                    sharedData->particles[i].x -= 1;
+
+                // Save the RNG state for the next window
+                rng_streams[block].rng = rng;
+                if (counters != NULL) {
+                    walked = countBlock(counters, end - start, step);
                 }
             }
         }
+
+        double merging = (counters != NULL) ? omp_get_wtime() : 0;
+        if (histogram != NULL) {
+            mergeHistograms(sharedData, histogram);
+        }
+        if (localMoments != NULL) {
+            mergeMoments(moments, localMoments);
+        }
+        if (counters != NULL) {
+            endThreadCounters(counters, started, walked, merging);
+        }
+    }
+    publishSnapshot(sharedData);
+
+    if (moments != NULL) {
+        return publishMoments(moments, first, step);
     }
-    sharedData->read = 0;
     return 0;
 }
 
-// Initialize states for each thread for unique RNG generation
-void initialize_rng_states(int num_threads, pcg32_random_t *rng_states) {
-    // Open OMP block
-    #pragma omp parallel
+// Static chunks for the runtime schedule of the particle loops
+void setBlockSchedule(int chunk)
+{
+    // Chunks below one give the default even split
+    omp_set_schedule(omp_sched_static, chunk);
+}
+
+// Number of RNG streams (particle blocks) needed for a particle count
+int getNumStreams(int numParts)
+{
+    return (numParts + RNG_BLOCK_SIZE - 1) / RNG_BLOCK_SIZE;
+}
+
+// Allocate cache line aligned RNG streams
+RngStream* allocate_rng_streams(int numStreams)
+{
+    if (numStreams <= 0) {
+        return NULL;
+    }
+    return aligned_alloc(CACHE_LINE, numStreams * sizeof(RngStream));
+}
+
+// Seed every particle block with its own slice of one pcg32 stream
+// Block n starts n * RNG_BLOCK_STRIDE draws into the stream picked by the seed,
+// so the output depends only on the seed, never on the number of threads
+void initialize_rng_streams(RngStream *rng_streams, int numStreams, uint64_t seed)
+{
+    initialize_rng_stream_range(rng_streams, numStreams, seed, 0);
+}
+
+// Seed streams for the blocks starting at firstBlock, the streams a run with
+// more particles would give those blocks
+void initialize_rng_stream_range(RngStream *rng_streams, int numStreams, uint64_t seed, uint64_t firstBlock)
+{
+    #pragma omp parallel for schedule(static)
+    for (int block = 0; block < numStreams; block++)
     {
-        // Get thread number
-        int thread_id = omp_get_thread_num();
-        if (thread_id >= num_threads) {
-            printf("Error: thread_id %d is out of bounds\n", thread_id);
-            exit(1);
-        }
-        // Ensure that rng_states[thread_id] is a valid pointer before accessing it
-        unsigned long long seed = (thread_id + 1) * 123456789ULL;
-        //printf("Thread %d initializing RNG state\nSeed: %llx\n", thread_id, seed);
-        #pragma omp barrier
-        pcg32_srandom_r(&rng_states[thread_id], seed, thread_id);
-        #pragma omp barrier
+        pcg32_srandom_r(&rng_streams[block].rng, seed, seed);
+        pcg32_advance_r(&rng_streams[block].rng, (firstBlock + block) * RNG_BLOCK_STRIDE);
     }
 }
 
+// Parse optional "--name value" arguments starting at argv[first]
+int parseOptions(int argc, char *argv[], int first, RunOptions *options)
+{
+    options->seed = DEFAULT_SEED;
+    options->mode = MODE_PARTICLES;
+    options->kernel = KERNEL_SCALAR;
+    options->pace = PACE_VISUAL;
+    options->notify = 0;
+    options->checkpointPath = NULL;
+    options->checkpointEvery = DEFAULT_CHECKPOINT_EVERY;
+    options->resumePath = NULL;
+    options->fork = 0;
+    options->momentsEvery = 0;
+    options->momentsPath = NULL;
+    options->statsPath = NULL;
+    options->numa = 0;
+    options->retune = 0;
+    options->binWidth = 1;
+
+    for (int i = first; i < argc; i++)
+    {
+        if (strcmp(argv[i], "--seed") == 0 && i + 1 < argc)
+        {
+            options->seed = strtoull(argv[++i], NULL, 10);
+        }
+        else if (strcmp(argv[i], "--mode") == 0 && i + 1 < argc)
+        {
+            i++;
+            if (strcmp(argv[i], "particles") == 0)
+            {
+                options->mode = MODE_PARTICLES;
+            }
+            else if (strcmp(argv[i], "lattice") == 0)
+            {
+                options->mode = MODE_LATTICE;
+            }
+            else
+            {
+                printf("Unknown mode: %s\n", argv[i]);
+                return -1;
+            }
+        }
+        else if (strcmp(argv[i], "--kernel") == 0 && i + 1 < argc)
+        {
+            i++;
+            if (strcmp(argv[i], "scalar") == 0)
+            {
+                options->kernel = KERNEL_SCALAR;
+            }
+            else if (strcmp(argv[i], "simd") == 0)
+            {
+                options->kernel = KERNEL_SIMD;
+            }
+            else
+            {
+                printf("Unknown kernel: %s\n", argv[i]);
+                return -1;
+            }
+        }
+        else if (strcmp(argv[i], "--pace") == 0 && i + 1 < argc)
+        {
+            i++;
+            if (strcmp(argv[i], "visual") == 0)
+            {
+                options->pace = PACE_VISUAL;
+            }
+            else if (strcmp(argv[i], "max") == 0)
+            {
+                options->pace = PACE_MAX;
+            }
+            else
+            {
+                printf("Unknown pace: %s\n", argv[i]);
+                return -1;
+            }
+        }
+        else if (strcmp(argv[i], "--notify") == 0)
+        {
+            options->notify = 1;
+        }
+        else if (strcmp(argv[i], "--numa") == 0)
+        {
+            options->numa = 1;
+        }
+        else if (strcmp(argv[i], "--retune") == 0)
+        {
+            options->retune = 1;
+        }
+        else if (strcmp(argv[i], "--bin-width") == 0 && i + 1 < argc)
+        {
+            options->binWidth = atoi(argv[++i]);
+            if (options->binWidth <= 0)
+            {
+                printf("Invalid bin width: %s\n", argv[i]);
+                return -1;
+            }
+        }
+        else if (strcmp(argv[i], "--checkpoint") == 0 && i + 1 < argc)
+        {
+            options->checkpointPath = argv[++i];
+        }
+        else if (strcmp(argv[i], "--checkpoint-every") == 0 && i + 1 < argc)
+        {
+            options->checkpointEvery = atoi(argv[++i]);
+            if (options->checkpointEvery <= 0)
+            {
+                printf("Invalid checkpoint interval: %s\n", argv[i]);
+                return -1;
+            }
+        }
+        else if (strcmp(argv[i], "--moments") == 0 && i + 1 < argc)
+        {
+            options->momentsEvery = atoi(argv[++i]);
+            if (options->momentsEvery <= 0)
+            {
+                printf("Invalid moment interval: %s\n", argv[i]);
+                return -1;
+            }
+        }
+        else if (strcmp(argv[i], "--moments-file") == 0 && i + 1 < argc)
+        {
+            options->momentsPath = argv[++i];
+        }
+        else if (strcmp(argv[i], "--stats") == 0 && i + 1 < argc)
+        {
+            options->statsPath = argv[++i];
+        }
+        else if ((strcmp(argv[i], "--resume") == 0 || strcmp(argv[i], "--fork") == 0) && i + 1 < argc)
+        {
+            options->fork = (strcmp(argv[i], "--fork") == 0);
+            options->resumePath = argv[++i];
+        }
+        else
+        {
+            printf("Unknown option: %s\n", argv[i]);
+            return -1;
+        }
+    }
+    if (options->momentsPath != NULL && options->momentsEvery == 0)
+    {
+        printf("--moments-file needs --moments <increments>\n");
+        return -1;
+    }
+    return 0;
+}
+
 // Round a float value to a number of decimal places
 float roundValue(float number, int decimals)
 {
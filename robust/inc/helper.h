@@ -1,3 +1,6 @@
+#ifndef HELPER_H_INCLUDED
+#define HELPER_H_INCLUDED
+
 #include <stdio.h>
 #include <math.h>
 #include <omp.h>
@@ -13,19 +16,137 @@
 
 #define SHM_NAME "/particle_shm"
 
+// Particles that share one RNG stream. Threads always own whole blocks,
+// so the draws a particle sees never depend on the thread count.
+#define RNG_BLOCK_SIZE 1024
+// Draws reserved for each block inside the seeded stream (2^40)
+#define RNG_BLOCK_STRIDE (1ULL << 40)
+#define DEFAULT_SEED 123456789ULL
+#define CACHE_LINE 64
+
+// Shared memory layouts, the header says which one the segment holds
+#define LAYOUT_PARTICLES 0 // Array of Particle {y, x} floats
+#define LAYOUT_COMPACT 1   // int32 positions, then one lane bit per particle
+#define LAYOUT_LATTICE 2   // int64 walker count per site, bottom lane then top
+
 
 typedef struct {
     float y;
     float x;
 } Particle;
 
+// Live counters of the run, updated by the simulator after every window
+typedef struct {
+    uint64_t increments;    // Increments done so far
+    uint64_t particleSteps; // Walker increments done so far
+    double elapsedSeconds;  // Wall time since the run started
+    double computeSeconds;  // Inside the kernel
+    double blockedSeconds;  // Waiting for Python to take a snapshot
+    double sleepSeconds;    // Visual pacing sleeps
+    double rate;            // Particle-steps per second of wall time over the last window
+    double reserved;
+} RunStats;
+
 typedef struct {
     int read;
     int count;
-    int padding[4];
+    int layout;
+    int sites;      // Sites per lane, lattice layout only
+    int histBins;   // Bins per lane in the histogram region, 0 disables it
+    int histWidth;  // Lattice sites per bin
+    int histOrigin; // x of the first site in bin 0
+    uint32_t sequence; // Snapshot seqlock, odd while a snapshot is being written
+    RunStats stats;
     Particle particles[];
 } ParticleStruct;
 
+// Direct view of a compact particle arena
+typedef struct {
+    int32_t *x;
+    uint8_t *lanes;
+    int count;
+} ParticleArena;
+
+// One RNG stream padded out to its own cache line
+typedef struct {
+    pcg32_random_t rng;
+    char padding[CACHE_LINE - sizeof(pcg32_random_t)];
+} __attribute__((aligned(CACHE_LINE))) RngStream;
+
+typedef struct HistogramScratch HistogramScratch;
+typedef struct MomentLog MomentLog;
+
+// Optional settings given after the positional arguments
+typedef struct {
+    uint64_t seed;
+    int mode;
+    int kernel;
+    int pace;
+    int notify;
+    const char *checkpointPath; // Save state here, NULL for no checkpoints
+    int checkpointEvery;        // Windows between checkpoints
+    const char *resumePath;     // Start from this checkpoint, NULL for a fresh run
+    int fork;                   // Run new parameters from resumePath instead of finishing it
+    int momentsEvery;           // Increments between moment samples, 0 for none
+    const char *momentsPath;    // Moment time series file, NULL for the ring only
+    const char *statsPath;      // End of run JSON summary, NULL for none
+    int numa;                   // Pin threads, give the arena fresh huge pages first touched by its threads
+    int retune;                 // Calibrate numCores auto again instead of using the cached winner
+    int binWidth;               // Lattice sites per histogram bin of a single run's block
+} RunOptions;
+
+// Simulation engines selected with --mode
+#define MODE_PARTICLES 0 // Move every walker
+#define MODE_LATTICE 1   // Evolve walker counts per lattice site
+
+// Particle kernels selected with --kernel
+#define KERNEL_SCALAR 0 // Reference kernel, moveParticles
+#define KERNEL_SIMD 1   // Branchless kernel, moveParticlesSimd
+
+// Publish pacing selected with --pace
+#define PACE_VISUAL 0 // Wait for Python to take each snapshot, sleep between windows
+#define PACE_MAX 1    // Never block, Python reads the newest complete snapshot
+
+// Run one particle through step iterations, keeping everything in registers
+static inline void walkParticle(int32_t *x, int *lane, float moveProb, float jumpProb, pcg32_random_t *rng, int step)
+{
+    int32_t localX = *x;
+    int localLane = *lane;
+
+    for (int k = 0; k < step; k++)
+    {
+        // Calculate jump varaible
+        uint32_t rand_val = pcg32_random_r(rng);
+        float jumpRand = (float)(rand_val & 0x7FFFFFFF) / (float)0x7FFFFFFF;
+        // If jump is satisfied, move particle to other line
+        if (jumpRand < jumpProb)
+        {
+            localLane = !localLane;
+            continue;
+        }
+
+        // Random number for x-axis
+        uint32_t rand_val1 = pcg32_random_r(rng);
+        float moveRand = (float)(rand_val1 & 0x7FFFFFFF) / (float)0x7FFFFFFF;
+        // Flip probability if on the bottom line
+        float localMoveProb = (localLane == 0) ? 1 - moveProb : moveProb;
+
+        if (moveRand > localMoveProb)
+        {
+            // Move one discrete increment positive
+            localX += 1;
+        }
+        else
+        {
+            // Negative x
+            localX -= 1;
+        }
+    }
+
+    *x = localX;
+    *lane = localLane;
+}
+
 
 // Calculate probability for a move
 float moveProbCalc(float D, float b, float dt);
@@ -33,19 +154,42 @@ float moveProbCalc(float D, float b, float dt);
 // Move distance calculation
 float moveDistanceCalc(float diffusionConstant, float deltaT);
 
-// Initialize particles within shared memory
-ParticleStruct* initializeParticles(int numParts, int* fd);
+// Calculate size of the shared memory block based on particles and layout
+size_t getSize(int numParts, int layout);
 
-// Calculate size of the shared memory block based on particles
-size_t getSize(int numParts);
+// Bytes needed to hold one lane bit per particle
+size_t getLaneBytes(int numParts);
+
+// View the compact layout of a shared memory block as an arena
+ParticleArena getArena(ParticleStruct *sharedData);
+
+// Blocks of particles go to threads in chunks of chunk blocks, or one even
+// run per thread for 0. Applies to the particle kernels and to filling a
+// block, so walkers are first touched by the thread that moves them.
+void setBlockSchedule(int chunk);
 
 // Move particles in a given step
-int moveParticles(ParticleStruct *sharedData, float moveProb, float jumpProb, pcg32_random_t *rng_states, int step);
+int moveParticles(ParticleStruct *sharedData, float moveProb, float jumpProb, RngStream *rng_streams, int step, HistogramScratch *histogram, MomentLog *moments, int first);
+
+// Number of RNG streams (particle blocks) needed for a particle count
+int getNumStreams(int numParts);
+
+// Allocate cache line aligned RNG streams
+RngStream* allocate_rng_streams(int numStreams);
 
-// Initialize states for each thread for unique RNG generation
-void initialize_rng_states(int num_threads, pcg32_random_t *rng_states);
+// Seed every particle block with its own slice of one pcg32 stream
+void initialize_rng_streams(RngStream *rng_streams, int numStreams, uint64_t seed);
+
+// Seed streams for the blocks starting at firstBlock, the streams a run with
+// more particles would give those blocks
+void initialize_rng_stream_range(RngStream *rng_streams, int numStreams, uint64_t seed, uint64_t firstBlock);
+
+// Parse optional "--name value" arguments starting at argv[first]
+int parseOptions(int argc, char *argv[], int first, RunOptions *options);
 
 // Round a float value to a number of decimal places
 float roundValue(float number, int decimals);
 
-void cleanup_shared_memory(int fd, ParticleStruct* shared, size_t size);
\ No newline at end of file
+void cleanup_shared_memory(int fd, ParticleStruct* shared, size_t size);
+
+#endif
\ No newline at end of file
@@ -0,0 +1,159 @@
+#include <stdio.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include "helper.h"
+#include "lattice.h"
+#include "histogram.h"
+
+// Kernels count each particle into a per-thread histogram while its final
+// position for the window is still in registers, then the rows are summed
+// into a fixed-size region after the particle data. Readers only touch
+// 2 * histBins counts, however many particles there are.
+//
+// The region holds two slots so the kernel never waits on a reader.
+// Snapshot g goes to slot g & 1 and the header sequence is a seqlock:
+// it is odd (2g - 1) while snapshot g is written and even (2g) once it is
+// complete. Readers copy slot (sequence / 2) & 1, which is never the slot
+// being written, and keep the copy if the sequence has not reached
+// 2g + 3, when snapshot g + 2 starts overwriting it.
+
+// Bytes before the histogram region: header plus particle or lattice data
+size_t getBodySize(const ParticleStruct *header)
+{
+    size_t size;
+    if (header->layout == LAYOUT_LATTICE) {
+        size = getLatticeSize(header->sites);
+    } else {
+        size = getSize(header->count, header->layout);
+    }
+    // Keep the int64 counts aligned
+    return (size + 7) & ~(size_t)7;
+}
+
+// Size of the whole shared memory block described by a header
+size_t getMappedSize(const ParticleStruct *header)
+{
+    size_t bins = (header->histBins > 0) ? (size_t)header->histBins : 0;
+    return getBodySize(header) + 2 * 2 * bins * sizeof(int64_t);
+}
+
+// Histogram slot the next snapshot is written to, NULL when disabled
+int64_t* getHistogram(ParticleStruct *sharedData)
+{
+    if (sharedData->histBins <= 0) {
+        return NULL;
+    }
+    uint32_t slot = ((sharedData->sequence >> 1) + 1) & 1;
+    int64_t *region = (int64_t *)((char *)sharedData + getBodySize(sharedData));
+    return region + (size_t)slot * 2 * sharedData->histBins;
+}
+
+// Mark the back slot as being written, readers keep using the front slot
+void beginSnapshot(ParticleStruct *sharedData)
+{
+    uint32_t sequence = sharedData->sequence;
+    if ((sequence & 1) == 0) {
+        __atomic_store_n(&sharedData->sequence, sequence + 1, __ATOMIC_RELEASE);
+    }
+}
+
+// Make the back slot the newest complete snapshot and clear the read flag
+void publishSnapshot(ParticleStruct *sharedData)
+{
+    uint32_t sequence = sharedData->sequence;
+    if (sequence & 1) {
+        // Slot contents must be visible before the even sequence
+        __atomic_store_n(&sharedData->sequence, sequence + 1, __ATOMIC_RELEASE);
+    }
+    __atomic_store_n(&sharedData->read, 0, __ATOMIC_RELEASE);
+}
+
+// Allocate zeroed scratch for a mapped block, NULL when the histogram is disabled
+HistogramScratch* createHistogramScratch(ParticleStruct *sharedData, int threads)
+{
+    if (sharedData->histBins <= 0 || sharedData->histWidth <= 0 || threads <= 0) {
+        return NULL;
+    }
+    HistogramScratch *scratch = malloc(sizeof(HistogramScratch));
+    if (scratch == NULL) {
+        return NULL;
+    }
+    int perLine = CACHE_LINE / sizeof(int64_t);
+    scratch->threads = threads;
+    scratch->stride = ((2 * sharedData->histBins + perLine - 1) / perLine) * perLine;
+    scratch->counts = aligned_alloc(CACHE_LINE, (size_t)threads * scratch->stride * sizeof(int64_t));
+    if (scratch->counts == NULL) {
+        free(scratch);
+        return NULL;
+    }
+    memset(scratch->counts, 0, (size_t)threads * scratch->stride * sizeof(int64_t));
+    return scratch;
+}
+
+void freeHistogramScratch(HistogramScratch *scratch)
+{
+    if (scratch == NULL) {
+        return;
+    }
+    free(scratch->counts);
+    free(scratch);
+}
+
+// This thread's zeroed scratch row, call inside a parallel region
+int64_t* beginThreadHistogram(HistogramScratch *scratch, int bins)
+{
+    int thread_id = omp_get_thread_num();
+    if (scratch == NULL || thread_id >= scratch->threads) {
+        return NULL;
+    }
+    int64_t *row = scratch->counts + (size_t)thread_id * scratch->stride;
+    memset(row, 0, 2 * (size_t)bins * sizeof(int64_t));
+    return row;
+}
+
+// Sum every thread's row into the shared region. Call from every thread
+// of the parallel region that filled the rows, it splits the bins.
+void mergeHistograms(ParticleStruct *sharedData, HistogramScratch *scratch)
+{
+    int64_t *shared = getHistogram(sharedData);
+    int entries = 2 * sharedData->histBins;
+    int threads = omp_get_num_threads();
+    if (threads > scratch->threads) {
+        threads = scratch->threads;
+    }
+
+    #pragma omp for schedule(static)
+    for (int i = 0; i < entries; i++)
+    {
+        int64_t total = 0;
+        for (int t = 0; t < threads; t++) {
+            total += scratch->counts[(size_t)t * scratch->stride + i];
+        }
+        shared[i] = total;
+    }
+}
+
+// Coarsen the occupied lattice sites lo..hi into the shared region
+void binLattice(ParticleStruct *sharedData, const int64_t *siteCounts, int lo, int hi)
+{
+    int64_t *shared = getHistogram(sharedData);
+    if (shared == NULL) {
+        return;
+    }
+    int bins = sharedData->histBins;
+    int sites = sharedData->sites;
+    int center = sites / 2;
+    memset(shared, 0, 2 * (size_t)bins * sizeof(int64_t));
+    for (int lane = 0; lane < 2; lane++)
+    {
+        for (int j = lo; j <= hi; j++)
+        {
+            int64_t n = siteCounts[lane * sites + j];
+            if (n != 0) {
+                shared[lane * bins + histogramBin(sharedData, j - center)] += n;
+            }
+        }
+    }
+}
@@ -0,0 +1,56 @@
+#ifndef HISTOGRAM_H_INCLUDED
+#define HISTOGRAM_H_INCLUDED
+
+#include <stdint.h>
+#include <stddef.h>
+#include "helper.h"
+
+// Per-thread (x, lane) counts, merged into the shared histogram region
+struct HistogramScratch {
+    int threads;     // Threads the scratch was sized for
+    int stride;      // int64 entries per thread, padded to whole cache lines
+    int64_t *counts; // threads * stride, bottom lane bins then top lane bins
+};
+
+// Bin holding lattice site x, out of range sites land in the edge bins
+static inline int histogramBin(const ParticleStruct *sharedData, int32_t x)
+{
+    int64_t offset = (int64_t)x - sharedData->histOrigin;
+    if (offset < 0) {
+        return 0;
+    }
+    int64_t bin = offset / sharedData->histWidth;
+    return (bin < sharedData->histBins) ? (int)bin : sharedData->histBins - 1;
+}
+
+// Bytes before the histogram region: header plus particle or lattice data
+size_t getBodySize(const ParticleStruct *header);
+
+// Size of the whole shared memory block described by a header
+size_t getMappedSize(const ParticleStruct *header);
+
+// Histogram slot the next snapshot is written to, NULL when disabled
+int64_t* getHistogram(ParticleStruct *sharedData);
+
+// Mark the back slot as being written, readers keep using the front slot
+void beginSnapshot(ParticleStruct *sharedData);
+
+// Make the back slot the newest complete snapshot and clear the read flag
+void publishSnapshot(ParticleStruct *sharedData);
+
+// Allocate zeroed scratch for a mapped block, NULL when the histogram is disabled
+HistogramScratch* createHistogramScratch(ParticleStruct *sharedData, int threads);
+
+void freeHistogramScratch(HistogramScratch *scratch);
+
+// This thread's zeroed scratch row, call inside a parallel region
+int64_t* beginThreadHistogram(HistogramScratch *scratch, int bins);
+
+// Sum every thread's row into the shared region. Call from every thread
+// of the parallel region that filled the rows, it splits the bins.
+void mergeHistograms(ParticleStruct *sharedData, HistogramScratch *scratch);
+
+// Coarsen the occupied lattice sites lo..hi into the shared region
+void binLattice(ParticleStruct *sharedData, const int64_t *siteCounts, int lo, int hi);
+
+#endif
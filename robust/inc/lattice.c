@@ -0,0 +1,258 @@
+#include <stdio.h>
+#include <math.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include "pcg_basic.h"
+#include "helper.h"
+#include "profile.h"
+#include "lattice.h"
+#include "histogram.h"
+
+// Walkers never interact, so the whole state is a count per (x, lane) site.
+// Every increment splits each site's count into jumpers, right movers and
+// left movers with binomial draws, so cost follows the occupied range and
+// not the number of walkers.
+
+// Uniform double in [0, 1) with 53 random bits
+static inline double uniformDouble(pcg32_random_t *rng)
+{
+    uint64_t a = pcg32_random_r(rng) >> 5;
+    uint64_t b = pcg32_random_r(rng) >> 6;
+    return (a * 67108864.0 + b) * (1.0 / 9007199254740992.0);
+}
+
+// Number of successes in n trials with probability p
+// Inversion for small means, BTRS (Hormann 1993) otherwise
+static int64_t binomialSample(pcg32_random_t *rng, int64_t n, double p)
+{
+    if (n <= 0 || p <= 0.0) {
+        return 0;
+    }
+    if (p >= 1.0) {
+        return n;
+    }
+    if (p > 0.5) {
+        return n - binomialSample(rng, n, 1.0 - p);
+    }
+
+    double q = 1.0 - p;
+    if (n * p < 10.0)
+    {
+        // Walk the cumulative distribution
+        double s = p / q;
+        double a = (n + 1) * s;
+        double r = exp(n * log1p(-p));
+        double u = uniformDouble(rng);
+        int64_t x = 0;
+        while (u > r && x < n)
+        {
+            u -= r;
+            x++;
+            r *= (a / x) - s;
+        }
+        return x;
+    }
+
+    double spq = sqrt(n * p * q);
+    double b = 1.15 + 2.53 * spq;
+    double a = -0.0873 + 0.0248 * b + 0.01 * p;
+    double c = n * p + 0.5;
+    double vr = 0.92 - 4.2 / b;
+    double alpha = (2.83 + 5.1 / b) * spq;
+    double lpq = log(p / q);
+    double m = floor((n + 1) * p);
+    double h = lgamma(m + 1) + lgamma(n - m + 1);
+
+    for (;;)
+    {
+        double u = uniformDouble(rng) - 0.5;
+        double v = uniformDouble(rng);
+        double us = 0.5 - fabs(u);
+        double k = floor((2 * a / us + b) * u + c);
+        if (k < 0 || k > n) {
+            continue;
+        }
+        if (us >= 0.07 && v <= vr) {
+            return (int64_t)k;
+        }
+        v = log(v * alpha / (a / (us * us) + b));
+        if (v <= h - lgamma(k + 1) - lgamma(n - k + 1) + (k - m) * lpq) {
+            return (int64_t)k;
+        }
+    }
+}
+
+// Sites per lane needed so no walker can leave the lattice in time
+int getLatticeSites(int increments)
+{
+    return 2 * increments + 1;
+}
+
+// Calculate size of a lattice shared memory block
+size_t getLatticeSize(int sites)
+{
+    return sizeof(ParticleStruct) + 2 * (size_t)sites * sizeof(int64_t);
+}
+
+// Walker counts in a lattice block, bottom lane first, site sites / 2 is x = 0
+int64_t* getLatticeCounts(ParticleStruct *sharedData)
+{
+    return (int64_t *)((char *)sharedData + sizeof(ParticleStruct));
+}
+
+// Allocate scratch for a mapped lattice, NULL on failure
+LatticeState* createLatticeState(ParticleStruct *sharedData)
+{
+    LatticeState *state = malloc(sizeof(LatticeState));
+    if (state == NULL) {
+        return NULL;
+    }
+    int sites = sharedData->sites;
+    state->sites = sites;
+    state->jumps = calloc(2 * (size_t)sites, sizeof(int64_t));
+    state->rights = calloc(2 * (size_t)sites, sizeof(int64_t));
+    state->lefts = calloc(2 * (size_t)sites, sizeof(int64_t));
+    if (state->jumps == NULL || state->rights == NULL || state->lefts == NULL)
+    {
+        freeLatticeState(state);
+        return NULL;
+    }
+
+    // Find the occupied range once, afterwards it is tracked per increment
+    int64_t *counts = getLatticeCounts(sharedData);
+    state->lo = sites;
+    state->hi = -1;
+    for (int j = 0; j < sites; j++)
+    {
+        if (counts[j] != 0 || counts[sites + j] != 0)
+        {
+            if (j < state->lo) state->lo = j;
+            state->hi = j;
+        }
+    }
+    return state;
+}
+
+void freeLatticeState(LatticeState *state)
+{
+    if (state == NULL) {
+        return;
+    }
+    free(state->jumps);
+    free(state->rights);
+    free(state->lefts);
+    free(state);
+}
+
+// Advance the site counts through step increments
+int advanceLattice(ParticleStruct *sharedData, LatticeState *state, float moveProb, float jumpProb, RngStream *rng_streams, int step)
+{
+    if (sharedData == NULL || state == NULL || rng_streams == NULL) {
+        printf("Error: lattice not initialized\n"); fflush(stdout);
+        return -1;
+    }
+
+    int sites = state->sites;
+    int64_t *counts = getLatticeCounts(sharedData);
+    int64_t *jumps = state->jumps;
+    int64_t *rights = state->rights;
+    int64_t *lefts = state->lefts;
+    // Chance of a +1 move for each lane, matching moveParticles
+    double rightProb[2] = { moveProb, 1.0 - moveProb };
+    // Occupied range found while gathering, shared by all threads
+    int occupiedLo = sites;
+    int occupiedHi = -1;
+
+    // One parallel region for the whole window
+    #pragma omp parallel
+    {
+        // Work counters, NULL when nothing is profiled. Phases of an increment
+        // interleave, so the whole region counts as walking.
+        ThreadCounters *counters = beginThreadCounters();
+        double started = (counters != NULL) ? omp_get_wtime() : 0;
+        int64_t split = 0;
+
+        for (int k = 0; k < step && state->hi >= state->lo; k++)
+        {
+            int lo = state->lo;
+            int hi = state->hi;
+
+            // Split every occupied site. Sites are grouped in blocks with
+            // one stream each, so the draws never depend on the thread count.
+            #pragma omp for schedule(static)
+            for (int block = lo / RNG_BLOCK_SIZE; block <= hi / RNG_BLOCK_SIZE; block++)
+            {
+                pcg32_random_t rng = rng_streams[block].rng;
+                int start = (block * RNG_BLOCK_SIZE > lo) ? block * RNG_BLOCK_SIZE : lo;
+                int end = (block * RNG_BLOCK_SIZE + RNG_BLOCK_SIZE - 1 < hi) ? block * RNG_BLOCK_SIZE + RNG_BLOCK_SIZE - 1 : hi;
+
+                for (int lane = 0; lane < 2; lane++)
+                {
+                    for (int j = start; j <= end; j++)
+                    {
+                        int64_t n = counts[lane * sites + j];
+                        split += n;
+                        int64_t jumpers = binomialSample(&rng, n, jumpProb);
+                        int64_t right = binomialSample(&rng, n - jumpers, rightProb[lane]);
+                        jumps[lane * sites + j] = jumpers;
+                        rights[lane * sites + j] = right;
+                        lefts[lane * sites + j] = n - jumpers - right;
+                    }
+                }
+                rng_streams[block].rng = rng;
+            }
+
+            // Gather the moves into the new counts, one site wider each side
+            int newLo = (lo > 0) ? lo - 1 : 0;
+            int newHi = (hi < sites - 1) ? hi + 1 : sites - 1;
+            #pragma omp single
+            {
+                occupiedLo = sites;
+                occupiedHi = -1;
+            }
+
+            #pragma omp for schedule(static) reduction(min:occupiedLo) reduction(max:occupiedHi)
+            for (int j = newLo; j <= newHi; j++)
+            {
+                for (int lane = 0; lane < 2; lane++)
+                {
+                    int other = 1 - lane;
+                    int64_t n = 0;
+                    if (j - 1 >= lo && j - 1 <= hi) n += rights[lane * sites + j - 1];
+                    if (j + 1 >= lo && j + 1 <= hi) n += lefts[lane * sites + j + 1];
+                    if (j >= lo && j <= hi) n += jumps[other * sites + j];
+                    counts[lane * sites + j] = n;
+                    if (n != 0)
+                    {
+                        if (j < occupiedLo) occupiedLo = j;
+                        if (j > occupiedHi) occupiedHi = j;
+                    }
+                }
+            }
+
+            // Shrink the range to the occupied sites before the next increment
+            #pragma omp single
+            {
+                state->lo = occupiedLo;
+                state->hi = occupiedHi;
+            }
+        }
+
+        if (counters != NULL) {
+            counters->particleSteps += split;
+            double now = omp_get_wtime();
+            endThreadCounters(counters, started, now, now);
+        }
+    }
+
+    // Publish coarsened counts for readers of the histogram region
+    beginSnapshot(sharedData);
+    binLattice(sharedData, counts, state->lo, state->hi);
+    publishSnapshot(sharedData);
+    return 0;
+}
@@ -0,0 +1,36 @@
+#ifndef LATTICE_H_INCLUDED
+#define LATTICE_H_INCLUDED
+
+#include <stdint.h>
+#include <stddef.h>
+#include "pcg_basic.h"
+#include "helper.h"
+
+// Scratch and bookkeeping for the lattice engine
+typedef struct {
+    int sites;       // Sites per lane
+    int lo;          // Lowest occupied site, either lane
+    int hi;          // Highest occupied site, either lane
+    int64_t *jumps;  // Walkers switching lanes this increment, 2 * sites
+    int64_t *rights; // Walkers moving +1 this increment, 2 * sites
+    int64_t *lefts;  // Walkers moving -1 this increment, 2 * sites
+} LatticeState;
+
+// Sites per lane needed so no walker can leave the lattice in time
+int getLatticeSites(int increments);
+
+// Calculate size of a lattice shared memory block
+size_t getLatticeSize(int sites);
+
+// Walker counts in a lattice block, bottom lane first, site sites / 2 is x = 0
+int64_t* getLatticeCounts(ParticleStruct *sharedData);
+
+// Allocate scratch for a mapped lattice, NULL on failure
+LatticeState* createLatticeState(ParticleStruct *sharedData);
+
+void freeLatticeState(LatticeState *state);
+
+// Advance the site counts through step increments
+int advanceLattice(ParticleStruct *sharedData, LatticeState *state, float moveProb, float jumpProb, RngStream *rng_streams, int step);
+
+#endif
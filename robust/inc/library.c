@@ -0,0 +1,76 @@
+#include <stdio.h>
+#include <math.h>
+#include <omp.h>
+#include <stdint.h>
+#include "pcg_basic.h"
+#include "helper.h"
+#include "library.h"
+
+// Same per block streams and walkParticle as the executable, so a whole run
+// advanced in one call matches the particles of an RWoperation --sweep row
+// seeded from that row's first block.
+
+int rwStreamCount(int numParts)
+{
+    return getNumStreams(numParts);
+}
+
+int rwSeedStreams(uint64_t *streams, int numParts, uint64_t seed, uint64_t firstBlock)
+{
+    // pcg32_random_t is the same {state, inc} pair
+    pcg32_random_t *rng = (pcg32_random_t *)streams;
+    int numStreams = getNumStreams(numParts);
+    if (numStreams == 0) {
+        return 0;
+    }
+
+    // Seed padded streams as RWoperation does, then pack them into the pairs
+    RngStream *seeded = allocate_rng_streams(numStreams);
+    if (seeded == NULL) {
+        return -1;
+    }
+    initialize_rng_stream_range(seeded, numStreams, seed, firstBlock);
+    for (int block = 0; block < numStreams; block++)
+    {
+        rng[block] = seeded[block].rng;
+    }
+    free(seeded);
+    return 0;
+}
+
+int rwIncrements(float deltaT, float timeConst, float bSpin)
+{
+    return (int)floor((timeConst / deltaT) * (1 + fabsf(bSpin)));
+}
+
+int rwAdvance(int32_t *x, uint8_t *lanes, int numParts, uint64_t *streams,
+              float deltaT, float diffCon, float bSpin, float gamma, int steps, int threads)
+{
+    if (x == NULL || lanes == NULL || streams == NULL || numParts < 0 || steps < 0) {
+        return -1;
+    }
+
+    pcg32_random_t *rng = (pcg32_random_t *)streams;
+    float moveProb = moveProbCalc(diffCon, bSpin, deltaT);
+    float jumpProb = gamma * deltaT;
+    int numBlocks = getNumStreams(numParts);
+    int team = (threads > 0) ? threads : omp_get_max_threads();
+
+    #pragma omp parallel for schedule(static) num_threads(team)
+    for (int block = 0; block < numBlocks; block++)
+    {
+        int start = block * RNG_BLOCK_SIZE;
+        int end = (start + RNG_BLOCK_SIZE < numParts) ? start + RNG_BLOCK_SIZE : numParts;
+
+        // Keep the RNG state local until the block is done
+        pcg32_random_t local = rng[block];
+        for (int i = start; i < end; i++)
+        {
+            int lane = (lanes[i] != 0);
+            walkParticle(&x[i], &lane, moveProb, jumpProb, &local, steps);
+            lanes[i] = (uint8_t)lane;
+        }
+        rng[block] = local;
+    }
+    return 0;
+}
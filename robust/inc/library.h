@@ -0,0 +1,26 @@
+#ifndef LIBRARY_H_INCLUDED
+#define LIBRARY_H_INCLUDED
+
+#include <stdint.h>
+
+// Entry points of librw.so, called from walker.py through ctypes.
+// Walkers are caller owned arrays: int32 x and one uint8 lane (0 or 1) per walker.
+// Generator state is one {state, inc} uint64 pair per block of RNG_BLOCK_SIZE walkers.
+
+// Number of generator pairs needed for numParts walkers
+int rwStreamCount(int numParts);
+
+// Seed the generator pairs the same way RWoperation seeds its blocks, for the
+// blocks starting at firstBlock (row r of a --sweep starts at r * rwStreamCount).
+// Returns 0, or -1 when the streams cannot be allocated
+int rwSeedStreams(uint64_t *streams, int numParts, uint64_t seed, uint64_t firstBlock);
+
+// Increments RWoperation runs for dt, T and b
+int rwIncrements(float deltaT, float timeConst, float bSpin);
+
+// Walk every walker steps increments in place, threads <= 0 uses the OpenMP default.
+// Returns 0, or -1 on bad arguments.
+int rwAdvance(int32_t *x, uint8_t *lanes, int numParts, uint64_t *streams,
+              float deltaT, float diffCon, float bSpin, float gamma, int steps, int threads);
+
+#endif
@@ -0,0 +1,164 @@
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <omp.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include "helper.h"
+#include "moments.h"
+
+// Samples falling inside a window of step increments after first
+static int samplesInWindow(int first, int step, int every)
+{
+    return (first + step) / every - first / every;
+}
+
+MomentLog* createMomentLog(int every, int maxStep, int threads, const char *path)
+{
+    MomentLog *log = calloc(1, sizeof(MomentLog));
+    if (log == NULL) {
+        return NULL;
+    }
+    log->fd = -1;
+    log->every = every;
+    log->slots = maxStep / every + 1;
+    log->threads = threads;
+    log->sums = calloc((size_t)log->slots, sizeof(MomentSums));
+    log->scratch = calloc((size_t)threads * log->slots, sizeof(MomentSums));
+    if (log->sums == NULL || log->scratch == NULL)
+    {
+        perror("Failed to allocate moment sums");
+        closeMomentLog(log);
+        return NULL;
+    }
+
+    log->ringSize = sizeof(MomentRingHeader) + MOMENT_RING_CAPACITY * sizeof(MomentRecord);
+    log->fd = shm_open(MOMENT_SHM_NAME, O_CREAT | O_RDWR, 0666);
+    if (log->fd == -1 || ftruncate(log->fd, (off_t)log->ringSize) == -1)
+    {
+        perror("Failed to create moment ring");
+        closeMomentLog(log);
+        return NULL;
+    }
+    void *ring = mmap(0, log->ringSize, PROT_READ | PROT_WRITE, MAP_SHARED, log->fd, 0);
+    if (ring == MAP_FAILED)
+    {
+        perror("Failed to map moment ring");
+        closeMomentLog(log);
+        return NULL;
+    }
+    log->ring = ring;
+    log->ring->capacity = MOMENT_RING_CAPACITY;
+    log->ring->recordSize = sizeof(MomentRecord);
+    log->ring->every = (uint32_t)every;
+    __atomic_store_n(&log->ring->written, 0, __ATOMIC_RELEASE);
+
+    if (path != NULL)
+    {
+        log->file = fopen(path, "wb");
+        uint32_t header[3] = { MOMENT_FILE_VERSION, sizeof(MomentRecord), (uint32_t)every };
+        if (log->file == NULL || fwrite(MOMENT_FILE_MAGIC, 1, 4, log->file) != 4 || fwrite(header, sizeof(header), 1, log->file) != 1)
+        {
+            perror("Failed to open moment file");
+            closeMomentLog(log);
+            return NULL;
+        }
+    }
+    return log;
+}
+
+void closeMomentLog(MomentLog *log)
+{
+    if (log == NULL) {
+        return;
+    }
+    if (log->file != NULL) {
+        fclose(log->file);
+    }
+    if (log->ring != NULL) {
+        munmap(log->ring, log->ringSize);
+    }
+    if (log->fd >= 0) {
+        close(log->fd);
+    }
+    free(log->sums);
+    free(log->scratch);
+    free(log);
+}
+
+MomentSums* beginThreadMoments(MomentLog *log)
+{
+    int thread_id = omp_get_thread_num();
+    if (log == NULL || thread_id >= log->threads) {
+        return NULL;
+    }
+    MomentSums *local = log->scratch + (size_t)thread_id * log->slots;
+    memset(local, 0, (size_t)log->slots * sizeof(MomentSums));
+    return local;
+}
+
+void mergeMoments(MomentLog *log, const MomentSums *local)
+{
+    #pragma omp critical(mergeMoments)
+    for (int slot = 0; slot < log->slots; slot++)
+    {
+        for (int lane = 0; lane < 2; lane++)
+        {
+            log->sums[slot].count[lane] += local[slot].count[lane];
+            log->sums[slot].sum[lane] += local[slot].sum[lane];
+            log->sums[slot].sumSquares[lane] += local[slot].sumSquares[lane];
+            log->sums[slot].sumCubes[lane] += local[slot].sumCubes[lane];
+        }
+    }
+}
+
+// Central moments from exact power sums, the variance numerator stays exact
+static void fillRecord(MomentRecord *record, const MomentSums *sums)
+{
+    for (int lane = 0; lane < 2; lane++)
+    {
+        int64_t n = sums->count[lane];
+        record->count[lane] = n;
+        if (n == 0)
+        {
+            record->mean[lane] = record->variance[lane] = record->third[lane] = 0;
+            continue;
+        }
+        long double mean = (long double)sums->sum[lane] / n;
+        __int128 spread = (__int128)n * sums->sumSquares[lane] - (__int128)sums->sum[lane] * sums->sum[lane];
+        record->mean[lane] = (double)mean;
+        record->variance[lane] = (double)((long double)spread / ((long double)n * n));
+        record->third[lane] = (double)((long double)sums->sumCubes[lane] / n
+                                       - 3 * mean * ((long double)sums->sumSquares[lane] / n)
+                                       + 2 * mean * mean * mean);
+    }
+}
+
+int publishMoments(MomentLog *log, int first, int step)
+{
+    int samples = samplesInWindow(first, step, log->every);
+    uint64_t written = log->ring->written;
+    MomentRecord *records = (MomentRecord *)(log->ring + 1);
+    int result = 0;
+
+    for (int slot = 0; slot < samples; slot++)
+    {
+        MomentRecord record;
+        record.increment = ((int64_t)first / log->every + slot + 1) * log->every;
+        fillRecord(&record, &log->sums[slot]);
+
+        records[written % log->ring->capacity] = record;
+        // Readers only trust records below the count
+        __atomic_store_n(&log->ring->written, ++written, __ATOMIC_RELEASE);
+        if (log->file != NULL && fwrite(&record, sizeof(record), 1, log->file) != 1)
+        {
+            perror("Failed to write moments");
+            result = -1;
+        }
+    }
+    memset(log->sums, 0, (size_t)log->slots * sizeof(MomentSums));
+    return result;
+}
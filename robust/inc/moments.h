@@ -0,0 +1,108 @@
+#ifndef MOMENTS_H_INCLUDED
+#define MOMENTS_H_INCLUDED
+
+#include <stdio.h>
+#include <stdint.h>
+#include "pcg_basic.h"
+#include "helper.h"
+
+// Ring of moment samples other processes can follow while a run goes
+#define MOMENT_SHM_NAME "/particle_moments"
+#define MOMENT_RING_CAPACITY 4096
+
+// Moment time series file: magic, version, record size, sample interval, then records
+#define MOMENT_FILE_MAGIC "RWMS"
+#define MOMENT_FILE_VERSION 1
+
+// One sample, bottom lane first. Moments are in lattice steps.
+typedef struct {
+    int64_t increment;   // Increments applied when the sample was taken
+    int64_t count[2];
+    double mean[2];
+    double variance[2];
+    double third[2];     // Third central moment
+} MomentRecord;
+
+// Head of the ring segment, records follow
+typedef struct {
+    uint64_t written;    // Records ever appended, stored after each record is complete
+    uint32_t capacity;   // Record i lives in slot i % capacity
+    uint32_t recordSize;
+    uint32_t every;      // Increments between samples
+    uint32_t reserved;
+} MomentRingHeader;
+
+// Exact power sums of one sample, integers so the result never depends on the thread count
+typedef struct {
+    int64_t count[2];
+    int64_t sum[2];
+    __int128 sumSquares[2];
+    __int128 sumCubes[2];
+} MomentSums;
+
+struct MomentLog {
+    int every;            // Increments between samples
+    int slots;            // Samples one window can hold
+    int threads;          // Threads the scratch was sized for
+    MomentSums *sums;     // slots shared sums
+    MomentSums *scratch;  // threads * slots thread local sums
+    MomentRingHeader *ring;
+    size_t ringSize;
+    int fd;
+    FILE *file;           // Optional time series, NULL if none
+};
+
+static inline void addMoment(MomentSums *sums, int lane, int32_t x)
+{
+    int64_t square = (int64_t)x * x;
+    sums->count[lane]++;
+    sums->sum[lane] += x;
+    sums->sumSquares[lane] += square;
+    sums->sumCubes[lane] += (__int128)square * x;
+}
+
+// Walk one particle like walkParticle, stopping every increments to add it to
+// the next local sample. The first sample of the window comes after
+// firstSample increments, see getFirstSample.
+static inline void walkSampled(int32_t *x, int *lane, float moveProb, float jumpProb, pcg32_random_t *rng, int step, int firstSample, int every, MomentSums *local)
+{
+    int slot = 0;
+    int untilSample = firstSample;
+    for (int k = 0; k < step; )
+    {
+        int run = (untilSample < step - k) ? untilSample : step - k;
+        walkParticle(x, lane, moveProb, jumpProb, rng, run);
+        k += run;
+        untilSample -= run;
+        if (untilSample == 0)
+        {
+            addMoment(&local[slot++], *lane, *x);
+            untilSample = every;
+        }
+    }
+}
+
+// Increments from the start of a window to its first sample, when the
+// particles had first increments before it
+static inline int getFirstSample(const MomentLog *log, int first)
+{
+    return log->every - first % log->every;
+}
+
+// Create the ring segment and open the optional file for windows of up to
+// maxStep increments. NULL on failure.
+MomentLog* createMomentLog(int every, int maxStep, int threads, const char *path);
+
+// Flush the file and unmap the ring, which stays for readers
+void closeMomentLog(MomentLog *log);
+
+// Zeroed local sums of the calling thread, NULL if it has none
+MomentSums* beginThreadMoments(MomentLog *log);
+
+// Add the calling thread's local sums to the shared sums
+void mergeMoments(MomentLog *log, const MomentSums *local);
+
+// Turn the samples of a window into records, append them and clear the sums
+int publishMoments(MomentLog *log, int first, int step);
+
+#endif
@@ -0,0 +1,75 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <semaphore.h>
+#include "notify.h"
+
+// Open both semaphores, NULL if Python did not create them
+Notifier* openNotifier(void)
+{
+    Notifier *notifier = malloc(sizeof(Notifier));
+    if (notifier == NULL) {
+        return NULL;
+    }
+    notifier->ready = sem_open(READY_SEM_NAME, 0);
+    notifier->consumed = sem_open(CONSUMED_SEM_NAME, 0);
+    if (notifier->ready == SEM_FAILED || notifier->consumed == SEM_FAILED) {
+        perror("sem_open failed");
+        if (notifier->ready != SEM_FAILED) {
+            sem_close(notifier->ready);
+        }
+        if (notifier->consumed != SEM_FAILED) {
+            sem_close(notifier->consumed);
+        }
+        free(notifier);
+        return NULL;
+    }
+    return notifier;
+}
+
+void closeNotifier(Notifier *notifier)
+{
+    if (notifier == NULL) {
+        return;
+    }
+    // Python owns the names and unlinks them
+    sem_close(notifier->ready);
+    sem_close(notifier->consumed);
+    free(notifier);
+}
+
+// Wake the reader, posts are merged while it has not woken yet
+void signalSnapshot(Notifier *notifier)
+{
+    int pending = 0;
+    if (sem_getvalue(notifier->ready, &pending) == 0 && pending > 0) {
+        return;
+    }
+    sem_post(notifier->ready);
+}
+
+// Block until the reader has taken the last snapshot
+int waitForReader(Notifier *notifier, volatile sig_atomic_t *stop)
+{
+    while (sem_wait(notifier->consumed) != 0)
+    {
+        if (errno != EINTR) {
+            perror("sem_wait failed");
+            return -1;
+        }
+        // The reader may never come back, let the caller stop now
+        if (stop != NULL && *stop) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+// Drop reader posts left over from an earlier run
+void drainReader(Notifier *notifier)
+{
+    while (sem_trywait(notifier->consumed) == 0)
+    {
+    }
+}
@@ -0,0 +1,32 @@
+#ifndef NOTIFY_H_INCLUDED
+#define NOTIFY_H_INCLUDED
+
+#include <signal.h>
+#include <semaphore.h>
+
+// Named semaphores created by Python before it starts RWoperation
+#define READY_SEM_NAME "/particle_ready"       // Posted by C when a snapshot is published
+#define CONSUMED_SEM_NAME "/particle_consumed" // Posted by Python when it has read one
+
+typedef struct {
+    sem_t *ready;
+    sem_t *consumed;
+} Notifier;
+
+// Open both semaphores, NULL if Python did not create them
+Notifier* openNotifier(void);
+
+void closeNotifier(Notifier *notifier);
+
+// Wake the reader, posts are merged while it has not woken yet
+void signalSnapshot(Notifier *notifier);
+
+// Block until the reader has taken the last snapshot. A signal handler that
+// sets *stop (stop may be NULL) ends the wait early.
+// Returns 0, 1 if stopped, -1 on error.
+int waitForReader(Notifier *notifier, volatile sig_atomic_t *stop);
+
+// Drop reader posts left over from an earlier run
+void drainReader(Notifier *notifier);
+
+#endif
@@ -114,3 +114,40 @@ uint32_t pcg32_boundedrand(uint32_t bound)
     return pcg32_boundedrand_r(&pcg32_global, bound);
 }
 
+
+// pcg32_advance(delta)
+// pcg32_advance_r(rng, delta):
+//     Multi-step advance function (jump-ahead, jump-back).
+//
+//     The method used here is based on Brown, "Random Number Generation
+//     with Arbitrary Stride,", Transactions of the American Nuclear
+//     Society (Nov. 1994).  The algorithm is very similar to fast
+//     exponentiation.
+
+static uint64_t pcg_advance_lcg_64(uint64_t state, uint64_t delta,
+                                   uint64_t cur_mult, uint64_t cur_plus)
+{
+    uint64_t acc_mult = 1u;
+    uint64_t acc_plus = 0u;
+    while (delta > 0) {
+        if (delta & 1) {
+            acc_mult *= cur_mult;
+            acc_plus = acc_plus * cur_mult + cur_plus;
+        }
+        cur_plus = (cur_mult + 1) * cur_plus;
+        cur_mult *= cur_mult;
+        delta /= 2;
+    }
+    return acc_mult * state + acc_plus;
+}
+
+void pcg32_advance_r(pcg32_random_t* rng, uint64_t delta)
+{
+    rng->state = pcg_advance_lcg_64(rng->state, delta,
+                                    6364136223846793005ULL, rng->inc);
+}
+
+void pcg32_advance(uint64_t delta)
+{
+    pcg32_advance_r(&pcg32_global, delta);
+}
@@ -71,6 +71,14 @@ uint32_t pcg32_random_r(pcg32_random_t* rng);
 uint32_t pcg32_boundedrand(uint32_t bound);
 uint32_t pcg32_boundedrand_r(pcg32_random_t* rng, uint32_t bound);
 
+// pcg32_advance(delta)
+// pcg32_advance_r(rng, delta):
+//     Multi-step advance function (jump-ahead, jump-back).  Takes
+//     O(log delta) time, so skipping far into a stream is cheap.
+
+void pcg32_advance(uint64_t delta);
+void pcg32_advance_r(pcg32_random_t* rng, uint64_t delta);
+
 #if __cplusplus
 }
 #endif
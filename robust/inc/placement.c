@@ -0,0 +1,155 @@
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <omp.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sched.h>
+#include <sys/mman.h>
+#include "placement.h"
+
+// Add the allowed CPUs of a sysfs list such as "0-11,24-35" to cpus
+static int parseCpuList(const char *list, const cpu_set_t *allowed, int *cpus, int max)
+{
+    int found = 0;
+    const char *p = list;
+    while (*p != '\0' && *p != '\n')
+    {
+        char *end;
+        long first = strtol(p, &end, 10);
+        long last = first;
+        if (end == p) {
+            break;
+        }
+        if (*end == '-') {
+            p = end + 1;
+            last = strtol(p, &end, 10);
+        }
+        for (long cpu = first; cpu <= last && cpu < CPU_SETSIZE && found < max; cpu++)
+        {
+            if (CPU_ISSET(cpu, allowed)) {
+                cpus[found++] = (int)cpu;
+            }
+        }
+        p = (*end == ',') ? end + 1 : end;
+    }
+    return found;
+}
+
+// Allowed CPUs of each NUMA node, from sysfs. Returns the number of nodes
+// found, 0 if sysfs has no node information.
+static int readNodes(const cpu_set_t *allowed, int **nodeCpus, int *nodeSizes, int maxNodes)
+{
+    int nodes = 0;
+    for (int node = 0; node < maxNodes; node++)
+    {
+        char path[64];
+        char list[4096];
+        snprintf(path, sizeof(path), "/sys/devices/system/node/node%d/cpulist", node);
+        FILE *file = fopen(path, "r");
+        if (file == NULL) {
+            break;
+        }
+        int read = (fgets(list, sizeof(list), file) != NULL);
+        fclose(file);
+        if (!read) {
+            break;
+        }
+        nodeSizes[nodes] = parseCpuList(list, allowed, nodeCpus[nodes], MAX_PLACEMENT_CPUS);
+        if (nodeSizes[nodes] > 0) {
+            nodes++;
+        }
+    }
+    return nodes;
+}
+
+// Allowed CPUs in pinning order: one from each node in turn
+static int spreadCpus(int *order)
+{
+    cpu_set_t allowed;
+    if (sched_getaffinity(0, sizeof(allowed), &allowed) != 0) {
+        perror("sched_getaffinity failed");
+        return -1;
+    }
+
+    enum { MAX_NODES = 64 };
+    int *nodeCpus[MAX_NODES];
+    int nodeSizes[MAX_NODES];
+    int *storage = malloc((size_t)MAX_NODES * MAX_PLACEMENT_CPUS * sizeof(int));
+    if (storage == NULL) {
+        perror("Failed to allocate placement");
+        return -1;
+    }
+    for (int node = 0; node < MAX_NODES; node++) {
+        nodeCpus[node] = storage + (size_t)node * MAX_PLACEMENT_CPUS;
+    }
+
+    int count = 0;
+    int nodes = readNodes(&allowed, nodeCpus, nodeSizes, MAX_NODES);
+    if (nodes == 0)
+    {
+        // No node information, one node of every allowed CPU
+        for (int cpu = 0; cpu < CPU_SETSIZE && count < MAX_PLACEMENT_CPUS; cpu++)
+        {
+            if (CPU_ISSET(cpu, &allowed)) {
+                order[count++] = cpu;
+            }
+        }
+    }
+    else
+    {
+        for (int index = 0; count < MAX_PLACEMENT_CPUS; index++)
+        {
+            int added = 0;
+            for (int node = 0; node < nodes && count < MAX_PLACEMENT_CPUS; node++)
+            {
+                if (index < nodeSizes[node]) {
+                    order[count++] = nodeCpus[node][index];
+                    added = 1;
+                }
+            }
+            if (!added) {
+                break;
+            }
+        }
+    }
+    free(storage);
+    return count;
+}
+
+int pinThreads(void)
+{
+    int *order = malloc(MAX_PLACEMENT_CPUS * sizeof(int));
+    if (order == NULL) {
+        perror("Failed to allocate placement");
+        return -1;
+    }
+    int numCpus = spreadCpus(order);
+    if (numCpus <= 0) {
+        free(order);
+        return -1;
+    }
+
+    int pinned = 0;
+    #pragma omp parallel reduction(+:pinned)
+    {
+        // More threads than CPUs share them in the same order
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        CPU_SET(order[omp_get_thread_num() % numCpus], &set);
+        if (sched_setaffinity(0, sizeof(set), &set) == 0) {
+            pinned++;
+        }
+    }
+    free(order);
+    return pinned;
+}
+
+void adviseHugePages(void *addr, size_t size)
+{
+#ifdef MADV_HUGEPAGE
+    madvise(addr, size, MADV_HUGEPAGE);
+#else
+    (void)addr;
+    (void)size;
+#endif
+}
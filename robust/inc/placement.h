@@ -0,0 +1,19 @@
+#ifndef PLACEMENT_H_INCLUDED
+#define PLACEMENT_H_INCLUDED
+
+#include <stddef.h>
+
+// Most CPUs placement looks at
+#define MAX_PLACEMENT_CPUS 4096
+
+// Pin every OpenMP thread to its own CPU, spreading threads round robin over
+// the NUMA nodes so each socket's memory bandwidth is used. Threads keep their
+// CPU for later parallel regions of the same size. Returns the number of
+// threads pinned, or -1 if the allowed CPUs could not be read.
+int pinThreads(void);
+
+// Ask for transparent huge pages on a mapping before it is first touched,
+// ignored where the kernel does not support them
+void adviseHugePages(void *addr, size_t size);
+
+#endif
@@ -0,0 +1,108 @@
+#include <stdio.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include "helper.h"
+#include "profile.h"
+
+Profile *activeProfile = NULL;
+
+static const char *phaseNames[PHASE_COUNT] = { "compute", "blocked", "sleep", "checkpoint" };
+
+Profile* createProfile(int threads, int particles, const char *kernel)
+{
+    Profile *profile = calloc(1, sizeof(Profile));
+    if (profile == NULL) {
+        return NULL;
+    }
+    profile->counters = aligned_alloc(CACHE_LINE, (size_t)threads * sizeof(ThreadCounters));
+    if (profile->counters == NULL) {
+        free(profile);
+        return NULL;
+    }
+    memset(profile->counters, 0, (size_t)threads * sizeof(ThreadCounters));
+    profile->threads = threads;
+    profile->particles = particles;
+    profile->kernel = kernel;
+    profile->startTime = omp_get_wtime();
+    profile->lastWindow = profile->startTime;
+    return profile;
+}
+
+void freeProfile(Profile *profile)
+{
+    if (profile == NULL) {
+        return;
+    }
+    if (activeProfile == profile) {
+        activeProfile = NULL;
+    }
+    free(profile->counters);
+    free(profile);
+}
+
+void addPhase(Profile *profile, int phase, double start)
+{
+    if (profile != NULL) {
+        profile->phaseSeconds[phase] += omp_get_wtime() - start;
+    }
+}
+
+void recordWindow(Profile *profile, ParticleStruct *sharedData, int step)
+{
+    if (profile == NULL) {
+        return;
+    }
+    double now = omp_get_wtime();
+    int64_t windowSteps = (int64_t)profile->particles * step;
+    profile->increments += step;
+    profile->particleSteps += windowSteps;
+
+    // Python reads these without the seqlock, every field is one aligned word
+    RunStats *stats = &sharedData->stats;
+    stats->increments = profile->increments;
+    stats->particleSteps = profile->particleSteps;
+    stats->elapsedSeconds = now - profile->startTime;
+    stats->computeSeconds = profile->phaseSeconds[PHASE_COMPUTE];
+    stats->blockedSeconds = profile->phaseSeconds[PHASE_BLOCKED];
+    stats->sleepSeconds = profile->phaseSeconds[PHASE_SLEEP];
+    stats->rate = (now > profile->lastWindow) ? windowSteps / (now - profile->lastWindow) : 0;
+    profile->lastWindow = now;
+}
+
+int writeProfileSummary(const char *path, const Profile *profile)
+{
+    FILE *file = fopen(path, "w");
+    if (file == NULL)
+    {
+        perror("Failed to open stats output");
+        return -1;
+    }
+
+    double elapsed = omp_get_wtime() - profile->startTime;
+    double compute = profile->phaseSeconds[PHASE_COMPUTE];
+    fprintf(file, "{\n  \"kernel\": \"%s\",\n  \"particles\": %d,\n  \"increments\": %lld,\n  \"particleSteps\": %lld,\n",
+            profile->kernel, profile->particles, (long long)profile->increments, (long long)profile->particleSteps);
+    fprintf(file, "  \"elapsedSeconds\": %.9g,\n  \"rate\": %.9g,\n  \"computeRate\": %.9g,\n  \"phases\": {",
+            elapsed, (elapsed > 0) ? profile->particleSteps / elapsed : 0, (compute > 0) ? profile->particleSteps / compute : 0);
+    for (int phase = 0; phase < PHASE_COUNT; phase++)
+    {
+        fprintf(file, "%s\"%s\": %.9g", (phase > 0) ? ", " : "", phaseNames[phase], profile->phaseSeconds[phase]);
+    }
+    fprintf(file, "},\n  \"threads\": [");
+    for (int t = 0; t < profile->threads; t++)
+    {
+        const ThreadCounters *counters = &profile->counters[t];
+        fprintf(file, "%s\n    {\"walk\": %.9g, \"wait\": %.9g, \"merge\": %.9g, \"particleSteps\": %llu}", (t > 0) ? "," : "",
+                counters->walkSeconds, counters->waitSeconds, counters->mergeSeconds, (unsigned long long)counters->particleSteps);
+    }
+    fprintf(file, "\n  ]\n}\n");
+
+    if (fclose(file) != 0)
+    {
+        perror("Failed to write stats output");
+        return -1;
+    }
+    return 0;
+}
@@ -0,0 +1,81 @@
+#ifndef PROFILE_H_INCLUDED
+#define PROFILE_H_INCLUDED
+
+#include <stdint.h>
+#include <omp.h>
+#include "helper.h"
+
+// Phases of a run timed by the main thread
+#define PHASE_COMPUTE 0    // Inside the kernel, publishing included
+#define PHASE_BLOCKED 1    // Waiting for Python to take a snapshot
+#define PHASE_SLEEP 2      // Visual pacing sleeps
+#define PHASE_CHECKPOINT 3 // Saving checkpoints
+#define PHASE_COUNT 4
+
+// Work of one thread inside the particle kernels, on its own cache line.
+// Drawing random numbers and updating walkers is one register loop, so it
+// is timed as one walk phase.
+typedef struct {
+    double walkSeconds;    // Walking this thread's blocks
+    double waitSeconds;    // Idle at the barrier after the walk, load imbalance
+    double mergeSeconds;   // Merging histogram and moment rows
+    uint64_t particleSteps;
+} __attribute__((aligned(CACHE_LINE))) ThreadCounters;
+
+typedef struct {
+    int threads;              // Threads the counters were sized for
+    int particles;            // Walkers each increment moves
+    const char *kernel;       // Kernel name for the summary
+    ThreadCounters *counters; // One per thread
+    double phaseSeconds[PHASE_COUNT];
+    double startTime;
+    double lastWindow;        // End of the last window, for the live rate
+    int64_t increments;
+    int64_t particleSteps;
+} Profile;
+
+// Profile the kernels report to, NULL when nothing is profiled
+extern Profile *activeProfile;
+
+// Counters of the calling thread, NULL when nothing is profiled
+static inline ThreadCounters* beginThreadCounters(void)
+{
+    Profile *profile = activeProfile;
+    int thread_id = omp_get_thread_num();
+    if (profile == NULL || thread_id >= profile->threads) {
+        return NULL;
+    }
+    return &profile->counters[thread_id];
+}
+
+// Count a finished block and return when it finished
+static inline double countBlock(ThreadCounters *counters, int particles, int step)
+{
+    counters->particleSteps += (uint64_t)particles * step;
+    return omp_get_wtime();
+}
+
+// Split the time since start into walk, barrier wait and merge
+static inline void endThreadCounters(ThreadCounters *counters, double start, double walked, double merging)
+{
+    counters->walkSeconds += walked - start;
+    counters->waitSeconds += merging - walked;
+    counters->mergeSeconds += omp_get_wtime() - merging;
+}
+
+// Zeroed profile for up to threads threads, started now. NULL on failure.
+Profile* createProfile(int threads, int particles, const char *kernel);
+
+// Free a profile, deactivating it first if the kernels report to it
+void freeProfile(Profile *profile);
+
+// Time spent in a phase since start, start from omp_get_wtime
+void addPhase(Profile *profile, int phase, double start);
+
+// Count a finished window and copy the totals into the shared header
+void recordWindow(Profile *profile, ParticleStruct *sharedData, int step);
+
+// Write the run's phases, totals and per-thread counters as JSON. Returns 0 or -1.
+int writeProfileSummary(const char *path, const Profile *profile);
+
+#endif
@@ -0,0 +1,210 @@
+#include <stdio.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <semaphore.h>
+#include "helper.h"
+#include "lattice.h"
+#include "histogram.h"
+#include "notify.h"
+#include "server.h"
+#include "placement.h"
+
+// A resident server keeps its thread pool and process across GUI resets.
+// Python writes the parameters and bumps command; the server stops the
+// current run between windows, rebuilds the shared block itself, writes
+// status and then ack. Python leaves the shared block alone until ack
+// matches, since the block may be resized.
+
+// Map the control block, NULL if Python did not create it
+ControlBlock* openControlBlock(int *fd)
+{
+    *fd = shm_open(CONTROL_SHM_NAME, O_RDWR, 0666);
+    if (*fd == -1) {
+        perror("shm_open control block failed");
+        return NULL;
+    }
+    ControlBlock *control = mmap(0, sizeof(ControlBlock), PROT_READ | PROT_WRITE, MAP_SHARED, *fd, 0);
+    if (control == MAP_FAILED) {
+        perror("mmap control block failed");
+        close(*fd);
+        return NULL;
+    }
+    return control;
+}
+
+void closeControlBlock(ControlBlock *control, int fd)
+{
+    if (control != NULL) {
+        munmap(control, sizeof(ControlBlock));
+    }
+    if (fd >= 0) {
+        close(fd);
+    }
+}
+
+// Nonzero when Python has written a command the server has not applied yet
+int controlPending(ControlBlock *control)
+{
+    return __atomic_load_n(&control->command, __ATOMIC_ACQUIRE) != control->ack;
+}
+
+// Sleep until a command is pending, waking on the reader semaphore if there is one
+void waitForCommand(ControlBlock *control, Notifier *notifier)
+{
+    while (!controlPending(control))
+    {
+        if (notifier == NULL) {
+            usleep(1000);
+            continue;
+        }
+        // Python posts consumed after writing a command, the timeout only covers lost posts
+        struct timespec deadline;
+        clock_gettime(CLOCK_REALTIME, &deadline);
+        deadline.tv_nsec += 50000000;
+        if (deadline.tv_nsec >= 1000000000) {
+            deadline.tv_sec++;
+            deadline.tv_nsec -= 1000000000;
+        }
+        sem_timedwait(notifier->consumed, &deadline);
+    }
+}
+
+// Report the result of a command back to Python
+void acknowledgeCommand(ControlBlock *control, uint32_t command, int status)
+{
+    control->status = status;
+    __atomic_store_n(&control->ack, command, __ATOMIC_RELEASE);
+}
+
+// Header of a block of numParts walkers, the sizes all follow from it
+static void setBlockHeader(ParticleStruct *header, int numParts, int layout, int sites, int binWidth)
+{
+    memset(header, 0, sizeof(*header));
+    header->count = numParts;
+    header->layout = layout;
+    header->sites = (layout == LAYOUT_LATTICE) ? sites : 0;
+    header->histBins = (sites + binWidth - 1) / binWidth;
+    header->histWidth = binWidth;
+    header->histOrigin = -(sites / 2);
+}
+
+// Write the header and the starting walkers into a freshly mapped block
+static void fillBlock(ParticleStruct *result, const ParticleStruct *header, size_t size)
+{
+    int numParts = header->count;
+    int sites = header->sites;
+    memcpy(result, header, sizeof(ParticleStruct));
+
+    // Each thread clears and fills its own share of the body and histogram
+    size_t bodyBytes = getBodySize(header) - sizeof(ParticleStruct);
+    size_t totalBytes = size - sizeof(ParticleStruct);
+    char *body = (char *)result + sizeof(ParticleStruct);
+    if (header->layout == LAYOUT_LATTICE)
+    {
+        #pragma omp parallel for schedule(static)
+        for (size_t chunk = 0; chunk < totalBytes; chunk += 1 << 16) {
+            size_t n = (totalBytes - chunk < (1 << 16)) ? totalBytes - chunk : (1 << 16);
+            memset(body + chunk, 0, n);
+        }
+        // Same split as the particle layouts: odd walkers on top, all at x = 0
+        int64_t *counts = getLatticeCounts(result);
+        counts[sites / 2] = numParts - numParts / 2;
+        counts[sites + sites / 2] = numParts / 2;
+    }
+    else
+    {
+        ParticleArena arena = getArena(result);
+        size_t laneBytes = getLaneBytes(numParts);
+
+        // Positions by block, so each thread touches the walkers it will move
+        int numBlocks = getNumStreams(numParts);
+        #pragma omp parallel for schedule(runtime)
+        for (int block = 0; block < numBlocks; block++)
+        {
+            int start = block * RNG_BLOCK_SIZE;
+            int end = (start + RNG_BLOCK_SIZE < numParts) ? start + RNG_BLOCK_SIZE : numParts;
+            memset(arena.x + start, 0, (size_t)(end - start) * sizeof(int32_t));
+            memset(arena.lanes + start / 8, 0xAA, (size_t)(end - start + 7) / 8);
+        }
+        // Bits past the last particle stay clear
+        if (numParts % 8) {
+            arena.lanes[laneBytes - 1] &= (uint8_t)((1u << (numParts % 8)) - 1);
+        }
+        // Alignment padding and the histogram slots
+        size_t used = (size_t)numParts * sizeof(int32_t) + laneBytes;
+        memset(body + used, 0, bodyBytes - used);
+        memset(body + bodyBytes, 0, totalBytes - bodyBytes);
+    }
+
+    // Nothing published yet and nothing left for the reader to release,
+    // the same handshake as a block prepared by Python
+    result->sequence = 0;
+    result->read = 1;
+}
+
+ParticleStruct* createSharedBlock(int numParts, int layout, int sites, int binWidth, int numa, int *fd)
+{
+    if (numParts <= 0 || sites <= 0 || binWidth <= 0) {
+        printf("Invalid block: %d particles, %d sites, bin width %d\n", numParts, sites, binWidth);
+        return NULL;
+    }
+
+    ParticleStruct header;
+    setBlockHeader(&header, numParts, layout, sites, binWidth);
+    size_t size = getMappedSize(&header);
+
+    *fd = shm_open(SHM_NAME, O_CREAT | O_RDWR, 0666);
+    if (*fd == -1) {
+        perror("shm_open failed");
+        return NULL;
+    }
+    // Pages left from the last run stay wherever its threads touched them
+    if ((numa && ftruncate(*fd, 0) == -1) || ftruncate(*fd, size) == -1) {
+        perror("ftruncate failed");
+        close(*fd);
+        *fd = -1;
+        return NULL;
+    }
+    ParticleStruct *result = mmap(0, size, PROT_READ | PROT_WRITE, MAP_SHARED, *fd, 0);
+    if (result == MAP_FAILED) {
+        perror("mmap failed");
+        close(*fd);
+        *fd = -1;
+        return NULL;
+    }
+    if (numa) {
+        adviseHugePages(result, size);
+    }
+    fillBlock(result, &header, size);
+    return result;
+}
+
+ParticleStruct* createPrivateBlock(int numParts, int layout, int sites, int binWidth, int numa)
+{
+    if (numParts <= 0 || sites <= 0 || binWidth <= 0) {
+        printf("Invalid block: %d particles, %d sites, bin width %d\n", numParts, sites, binWidth);
+        return NULL;
+    }
+
+    ParticleStruct header;
+    setBlockHeader(&header, numParts, layout, sites, binWidth);
+    size_t size = getMappedSize(&header);
+    ParticleStruct *result = mmap(0, size, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+    if (result == MAP_FAILED) {
+        perror("mmap failed");
+        return NULL;
+    }
+    if (numa) {
+        adviseHugePages(result, size);
+    }
+    fillBlock(result, &header, size);
+    return result;
+}
@@ -0,0 +1,58 @@
+#ifndef SERVER_H_INCLUDED
+#define SERVER_H_INCLUDED
+
+#include <stdint.h>
+#include "helper.h"
+#include "notify.h"
+
+// Control block Python writes commands into, created by Python before it starts the server
+#define CONTROL_SHM_NAME "/particle_ctl"
+
+// Commands
+#define CONTROL_RESET 0 // Rebuild the shared block from the parameters below and run
+#define CONTROL_QUIT 1  // Stop the server
+#define CONTROL_STOP 2  // Drop the current run and wait for the next command
+
+typedef struct {
+    uint32_t command;  // Bumped by Python once every field below is written
+    uint32_t ack;      // Last command the server has applied
+    int action;        // CONTROL_RESET, CONTROL_QUIT or CONTROL_STOP
+    int status;        // 0 if the last command succeeded, written before ack
+    float deltaT;
+    float timeConst;
+    float diffCon;
+    float bSpin;
+    float gamma;
+    int numParticles;
+    int mode;
+    int kernel;
+    int pace;
+    int binWidth;      // Lattice sites per histogram bin
+    uint64_t seed;
+} ControlBlock;
+
+// Map the control block, NULL if Python did not create it
+ControlBlock* openControlBlock(int *fd);
+
+void closeControlBlock(ControlBlock *control, int fd);
+
+// Nonzero when Python has written a command the server has not applied yet
+int controlPending(ControlBlock *control);
+
+// Sleep until a command is pending, waking on the reader semaphore if there is one
+void waitForCommand(ControlBlock *control, Notifier *notifier);
+
+// Report the result of a command back to Python
+void acknowledgeCommand(ControlBlock *control, uint32_t command, int status);
+
+// Create or resize the shared block and fill it in parallel: every walker at x = 0,
+// odd walkers on the top line, the histogram covering sites lattice sites.
+// With numa the old pages are dropped first and huge pages requested, so each
+// thread first touches fresh pages for the blocks it will move.
+ParticleStruct* createSharedBlock(int numParts, int layout, int sites, int binWidth, int numa, int *fd);
+
+// Same block in private anonymous memory, for runs nothing else reads.
+// Release with munmap and getMappedSize. numa requests huge pages.
+ParticleStruct* createPrivateBlock(int numParts, int layout, int sites, int binWidth, int numa);
+
+#endif
@@ -0,0 +1,201 @@
+#include <stdio.h>
+#include <math.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include "pcg_basic.h"
+#include "helper.h"
+#include "moments.h"
+#include "shard.h"
+
+// A shard walks one block aligned range of a run's walkers. Every block is
+// seeded as block firstParticle / RNG_BLOCK_SIZE + n of the whole run, walker
+// i starts on lane i & 1, and the walk is cut into the windows a single run
+// publishes, so each walker draws the same numbers as in that run and the
+// merged shards of a run are exactly the run done in one process.
+
+int createShard(ShardResult *shard, float deltaT, float timeConst, float diffCon, float bSpin, float gamma,
+                int64_t firstParticle, int numParticles, int window, uint64_t seed)
+{
+    memset(shard, 0, sizeof(*shard));
+    if (firstParticle < 0 || firstParticle % RNG_BLOCK_SIZE != 0 || numParticles <= 0)
+    {
+        printf("Shard walkers must start at a multiple of %d, got %lld walkers from %lld\n",
+               RNG_BLOCK_SIZE, (long long)numParticles, (long long)firstParticle);
+        return -1;
+    }
+    if (window <= 0)
+    {
+        printf("Invalid shard window: %d\n", window);
+        return -1;
+    }
+
+    ShardHeader *header = &shard->header;
+    memcpy(header->magic, SHARD_MAGIC, 4);
+    header->version = SHARD_VERSION;
+    header->deltaT = deltaT;
+    header->timeConst = timeConst;
+    header->diffCon = diffCon;
+    header->bSpin = bSpin;
+    header->gamma = gamma;
+    // Same behavior calculations as a single run
+    header->increments = (int)floor((timeConst / deltaT) * (1 + fabsf(bSpin)));
+    header->seed = seed;
+    header->firstParticle = firstParticle;
+    header->numParticles = numParticles;
+    header->window = window;
+
+    shard->counts = calloc(2 * (2 * (size_t)header->increments + 1), sizeof(int64_t));
+    if (shard->counts == NULL)
+    {
+        perror("Failed to allocate shard counts");
+        return -1;
+    }
+    return 0;
+}
+
+void freeShard(ShardResult *shard)
+{
+    free(shard->counts);
+    shard->counts = NULL;
+}
+
+int runShard(ShardResult *shard)
+{
+    const ShardHeader *header = &shard->header;
+    int numParticles = (int)header->numParticles;
+    int numStreams = getNumStreams(numParticles);
+    RngStream *rng_streams = allocate_rng_streams(numStreams);
+    if (rng_streams == NULL)
+    {
+        perror("Failed to allocate memory, returning");
+        return -1;
+    }
+    initialize_rng_stream_range(rng_streams, numStreams, header->seed, (uint64_t)header->firstParticle / RNG_BLOCK_SIZE);
+
+    int increments = header->increments;
+    int window = header->window;
+    int sites = 2 * increments + 1;
+    float moveProb = moveProbCalc(header->diffCon, header->bSpin, header->deltaT);
+    float jumpProb = header->gamma * header->deltaT;
+
+    // One row of counts per thread, padded to whole cache lines, summed at the end
+    int threads = omp_get_max_threads();
+    int perLine = CACHE_LINE / sizeof(int64_t);
+    size_t stride = ((2 * (size_t)sites + perLine - 1) / perLine) * perLine;
+    int64_t *rows = aligned_alloc(CACHE_LINE, (size_t)threads * stride * sizeof(int64_t));
+    if (rows == NULL)
+    {
+        perror("Failed to allocate shard counts");
+        free(rng_streams);
+        return -1;
+    }
+
+    #pragma omp parallel num_threads(threads)
+    {
+        // Integer sums, so the merged moments never depend on the thread count
+        MomentSums local;
+        memset(&local, 0, sizeof(local));
+        // Zeroed by its own thread, so the row's pages sit near it
+        int64_t *localCounts = rows + (size_t)omp_get_thread_num() * stride;
+        memset(localCounts, 0, 2 * (size_t)sites * sizeof(int64_t));
+
+        #pragma omp for schedule(static)
+        for (int block = 0; block < numStreams; block++)
+        {
+            int start = block * RNG_BLOCK_SIZE;
+            int end = (start + RNG_BLOCK_SIZE < numParticles) ? start + RNG_BLOCK_SIZE : numParticles;
+            pcg32_random_t rng = rng_streams[block].rng;
+
+            // The shard starts on a block, so local and global parity agree
+            int32_t x[RNG_BLOCK_SIZE];
+            int lanes[RNG_BLOCK_SIZE];
+            for (int i = start; i < end; i++)
+            {
+                x[i - start] = 0;
+                lanes[i - start] = i & 1;
+            }
+
+            // Every walker of the block takes one window's increments before
+            // the next window, the order moveParticles draws in
+            for (int done = 0; done < increments; done += window)
+            {
+                int step = (increments - done < window) ? increments - done : window;
+                for (int i = 0; i < end - start; i++) {
+                    walkParticle(&x[i], &lanes[i], moveProb, jumpProb, &rng, step);
+                }
+            }
+
+            for (int i = 0; i < end - start; i++)
+            {
+                localCounts[lanes[i] * sites + x[i] + increments]++;
+                addMoment(&local, lanes[i], x[i]);
+            }
+        }
+
+        #pragma omp critical(mergeShardMoments)
+        for (int lane = 0; lane < 2; lane++)
+        {
+            shard->sums.count[lane] += local.count[lane];
+            shard->sums.sum[lane] += local.sum[lane];
+            shard->sums.sumSquares[lane] += local.sumSquares[lane];
+            shard->sums.sumCubes[lane] += local.sumCubes[lane];
+        }
+
+        // Every row is complete after the barrier ending the block loop,
+        // and only the threads of this team filled one
+        int team = omp_get_num_threads();
+        #pragma omp for schedule(static)
+        for (int i = 0; i < 2 * sites; i++)
+        {
+            int64_t total = 0;
+            for (int t = 0; t < team; t++) {
+                total += rows[(size_t)t * stride + i];
+            }
+            shard->counts[i] = total;
+        }
+    }
+
+    free(rows);
+    free(rng_streams);
+    return 0;
+}
+
+int writeShard(const char *path, const ShardResult *shard)
+{
+    size_t pathLength = strlen(path);
+    char *tempPath = malloc(pathLength + 5);
+    if (tempPath == NULL) {
+        perror("Failed to allocate shard path");
+        return -1;
+    }
+    memcpy(tempPath, path, pathLength);
+    memcpy(tempPath + pathLength, ".tmp", 5);
+
+    FILE *file = fopen(tempPath, "wb");
+    if (file == NULL)
+    {
+        perror("Failed to open shard output");
+        free(tempPath);
+        return -1;
+    }
+    size_t numCounts = 2 * (2 * (size_t)shard->header.increments + 1);
+    int result = (fwrite(&shard->header, sizeof(ShardHeader), 1, file) == 1
+                  && fwrite(&shard->sums, sizeof(MomentSums), 1, file) == 1
+                  && fwrite(shard->counts, sizeof(int64_t), numCounts, file) == numCounts) ? 0 : -1;
+    if (fclose(file) != 0) {
+        result = -1;
+    }
+    if (result == 0) {
+        result = rename(tempPath, path);
+    }
+    if (result != 0)
+    {
+        perror("Failed to write shard output");
+        unlink(tempPath);
+    }
+    free(tempPath);
+    return (result == 0) ? 0 : -1;
+}
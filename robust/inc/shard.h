@@ -0,0 +1,51 @@
+#ifndef SHARD_H_INCLUDED
+#define SHARD_H_INCLUDED
+
+#include <stdint.h>
+#include "helper.h"
+#include "moments.h"
+
+// Shard file: this header, the shard's moment sums, then the final (x, lane)
+// counts, bottom lane first, x from -increments to increments. Counts and
+// sums of shards of one run add up to the counts and sums of the whole run.
+#define SHARD_MAGIC "RWSH"
+#define SHARD_VERSION 2
+
+typedef struct {
+    char magic[4];
+    uint32_t version;
+    float deltaT;
+    float timeConst;
+    float diffCon;
+    float bSpin;
+    float gamma;
+    int increments;
+    uint64_t seed;
+    int64_t firstParticle; // Global index of the shard's first walker, a multiple of RNG_BLOCK_SIZE
+    int64_t numParticles;
+    int32_t window;        // Increments per window, walked in the same pieces as a single run
+    int32_t reserved;
+} ShardHeader;
+
+typedef struct {
+    ShardHeader header;
+    MomentSums sums;
+    int64_t *counts; // 2 * (2 * increments + 1)
+} ShardResult;
+
+// Fill in the header and allocate zeroed counts. Returns 0, or -1 if the
+// range does not start on a block or the counts do not fit in memory.
+int createShard(ShardResult *shard, float deltaT, float timeConst, float diffCon, float bSpin, float gamma,
+                int64_t firstParticle, int numParticles, int window, uint64_t seed);
+
+void freeShard(ShardResult *shard);
+
+// Walk the shard's walkers from x = 0 with the streams of their global
+// blocks, window by window, counting where they end up
+int runShard(ShardResult *shard);
+
+// Write the shard through a temporary file renamed over path, so a
+// coordinator never reads half a shard. Returns 0 or -1.
+int writeShard(const char *path, const ShardResult *shard);
+
+#endif
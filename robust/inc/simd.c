@@ -0,0 +1,180 @@
+#include <stdio.h>
+#include <math.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include "pcg_basic.h"
+#include "helper.h"
+#include "simd.h"
+#include "histogram.h"
+#include "profile.h"
+
+// The scalar kernel in helper.c is the reference. This one draws both
+// numbers every increment, compares raw uint32 draws against precomputed
+// thresholds and updates with arithmetic instead of branches, so the
+// compiler can keep SIMD_WIDTH particles and generators in vector registers.
+
+// One pcg32 step on a bare state, same output as pcg32_random_r
+static inline uint32_t pcgStep(uint64_t *state, uint64_t inc)
+{
+    uint64_t oldstate = *state;
+    *state = oldstate * 6364136223846793005ULL + inc;
+    uint32_t xorshifted = (uint32_t)(((oldstate >> 18u) ^ oldstate) >> 27u);
+    uint32_t rot = (uint32_t)(oldstate >> 59u);
+    return (xorshifted >> rot) | (xorshifted << ((-rot) & 31));
+}
+
+// Allocate cache line aligned SIMD streams, one per particle block
+SimdStream* allocate_simd_streams(int numStreams)
+{
+    if (numStreams <= 0) {
+        return NULL;
+    }
+    return aligned_alloc(CACHE_LINE, numStreams * sizeof(SimdStream));
+}
+
+// Split each block's slice of the seeded stream into SIMD_WIDTH lanes
+// Lane s of block n starts at n * RNG_BLOCK_STRIDE + s * RNG_BLOCK_STRIDE / SIMD_WIDTH
+void initialize_simd_streams(SimdStream *simd_streams, int numStreams, uint64_t seed)
+{
+    #pragma omp parallel for schedule(static)
+    for (int block = 0; block < numStreams; block++)
+    {
+        for (int s = 0; s < SIMD_WIDTH; s++)
+        {
+            pcg32_random_t rng;
+            pcg32_srandom_r(&rng, seed, seed);
+            pcg32_advance_r(&rng, (uint64_t)block * RNG_BLOCK_STRIDE + (uint64_t)s * (RNG_BLOCK_STRIDE / SIMD_WIDTH));
+            simd_streams[block].state[s] = rng.state;
+            simd_streams[block].inc = rng.inc;
+        }
+    }
+}
+
+// Raw 32 bit draws below the threshold happen with probability prob
+uint32_t probThreshold(float prob)
+{
+    if (prob <= 0) {
+        return 0;
+    }
+    if (prob >= 1) {
+        return UINT32_MAX;
+    }
+    return (uint32_t)((double)prob * 4294967296.0);
+}
+
+// Branchless move of a compact layout, SIMD_WIDTH particles at a time
+int moveParticlesSimd(ParticleStruct *sharedData, float moveProb, float jumpProb, SimdStream *simd_streams, int step, HistogramScratch *histogram)
+{
+    if (sharedData == NULL) {
+        printf("Error: sharedData is NULL\n"); fflush(stdout);
+        return -1;
+    }
+    if (simd_streams == NULL) {
+        printf("Error: simd_streams is NULL\n"); fflush(stdout);
+        return -1;
+    }
+    if (sharedData->layout != LAYOUT_COMPACT) {
+        printf("SIMD kernel needs the compact layout, got %d\n", sharedData->layout); fflush(stdout);
+        return -1;
+    }
+    if (sharedData->count <= 0) {
+        printf("Invalid particle count: %d\n", sharedData->count); fflush(stdout);
+        return -1;
+    }
+
+    ParticleArena arena = getArena(sharedData);
+    int count = arena.count;
+    int numBlocks = getNumStreams(count);
+
+    // Chance of a jump, and of a +1 move on each lane, matching moveParticles
+    uint32_t jumpThreshold = probThreshold(jumpProb);
+    uint32_t rightThreshold[2] = { probThreshold(moveProb), probThreshold(1.0f - moveProb) };
+
+    int bins = sharedData->histBins;
+
+    beginSnapshot(sharedData);
+
+    #pragma omp parallel
+    {
+        // Final positions are counted while they are still in registers
+        int64_t *localHist = beginThreadHistogram(histogram, bins);
+        // Work counters, NULL when nothing is profiled
+        ThreadCounters *counters = beginThreadCounters();
+        double started = (counters != NULL) ? omp_get_wtime() : 0;
+        double walked = started;
+
+        #pragma omp for schedule(runtime)
+        for (int block = 0; block < numBlocks; block++)
+        {
+            int start = block * RNG_BLOCK_SIZE;
+            int end = (start + RNG_BLOCK_SIZE < count) ? start + RNG_BLOCK_SIZE : count;
+
+            // Generator lanes stay in registers for the whole block
+            uint64_t state[SIMD_WIDTH];
+            uint64_t inc = simd_streams[block].inc;
+            for (int s = 0; s < SIMD_WIDTH; s++) {
+                state[s] = simd_streams[block].state[s];
+            }
+
+            // Groups line up with lane bytes since SIMD_WIDTH is 8
+            for (int group = start; group < end; group += SIMD_WIDTH)
+            {
+                int used = (end - group < SIMD_WIDTH) ? end - group : SIMD_WIDTH;
+                int32_t x[SIMD_WIDTH];
+                uint32_t lane[SIMD_WIDTH];
+                uint8_t bits = arena.lanes[group / 8];
+                for (int s = 0; s < SIMD_WIDTH; s++)
+                {
+                    x[s] = (s < used) ? arena.x[group + s] : 0;
+                    lane[s] = (bits >> s) & 1u;
+                }
+
+                for (int k = 0; k < step; k++)
+                {
+                    #pragma omp simd
+                    for (int s = 0; s < SIMD_WIDTH; s++)
+                    {
+                        uint32_t jumpDraw = pcgStep(&state[s], inc);
+                        uint32_t moveDraw = pcgStep(&state[s], inc);
+                        int32_t jump = jumpDraw < jumpThreshold;
+                        uint32_t threshold = lane[s] ? rightThreshold[1] : rightThreshold[0];
+                        int32_t direction = 2 * (int32_t)(moveDraw < threshold) - 1;
+                        // A jump switches lanes and skips the move
+                        x[s] += (1 - jump) * direction;
+                        lane[s] ^= (uint32_t)jump;
+                    }
+                }
+
+                bits = 0;
+                for (int s = 0; s < used; s++)
+                {
+                    arena.x[group + s] = x[s];
+                    bits |= (uint8_t)(lane[s] << s);
+                    if (localHist != NULL) {
+                        localHist[lane[s] * bins + histogramBin(sharedData, x[s])]++;
+                    }
+                }
+                arena.lanes[group / 8] = bits;
+            }
+
+            for (int s = 0; s < SIMD_WIDTH; s++) {
+                simd_streams[block].state[s] = state[s];
+            }
+            if (counters != NULL) {
+                walked = countBlock(counters, end - start, step);
+            }
+        }
+
+        double merging = (counters != NULL) ? omp_get_wtime() : 0;
+        if (histogram != NULL) {
+            mergeHistograms(sharedData, histogram);
+        }
+        if (counters != NULL) {
+            endThreadCounters(counters, started, walked, merging);
+        }
+    }
+
+    publishSnapshot(sharedData);
+    return 0;
+}
@@ -0,0 +1,29 @@
+#ifndef SIMD_H_INCLUDED
+#define SIMD_H_INCLUDED
+
+#include <stdint.h>
+#include "pcg_basic.h"
+#include "helper.h"
+
+// Particles advanced side by side, one pcg32 lane each
+#define SIMD_WIDTH 8
+
+// SIMD_WIDTH pcg32 states from one block's stream, sharing its increment
+typedef struct {
+    uint64_t state[SIMD_WIDTH];
+    uint64_t inc;
+} __attribute__((aligned(CACHE_LINE))) SimdStream;
+
+// Allocate cache line aligned SIMD streams, one per particle block
+SimdStream* allocate_simd_streams(int numStreams);
+
+// Split each block's slice of the seeded stream into SIMD_WIDTH lanes
+void initialize_simd_streams(SimdStream *simd_streams, int numStreams, uint64_t seed);
+
+// Raw 32 bit draws below the threshold happen with probability prob
+uint32_t probThreshold(float prob);
+
+// Branchless move of a compact layout, SIMD_WIDTH particles at a time
+int moveParticlesSimd(ParticleStruct *sharedData, float moveProb, float jumpProb, SimdStream *simd_streams, int step, HistogramScratch *histogram);
+
+#endif
@@ -0,0 +1,196 @@
+#include <stdio.h>
+#include <math.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include "pcg_basic.h"
+#include "helper.h"
+#include "sweep.h"
+
+// A sweep only needs where each particle ends up, so nothing is published
+// between increments. Every particle starts at x = 0 in registers, walks all
+// of its set's increments and is counted straight into that set's histogram.
+// Sets own consecutive runs of RNG blocks, and blocks from every set are
+// scheduled over one thread pool, longest sets first.
+
+// Read a dt,T,D,b,gamma table, one parameter set per line. Returns the
+// number of sets and allocates *sets, or -1 on error.
+int readSweepTable(const char *path, SweepSet **sets)
+{
+    FILE *file = fopen(path, "r");
+    if (file == NULL) {
+        perror("Failed to open sweep table");
+        return -1;
+    }
+
+    int numSets = 0;
+    int capacity = 16;
+    SweepSet *result = malloc(capacity * sizeof(SweepSet));
+    if (result == NULL) {
+        fclose(file);
+        return -1;
+    }
+
+    char line[256];
+    int lineNumber = 0;
+    while (fgets(line, sizeof(line), file) != NULL)
+    {
+        lineNumber++;
+        SweepSet set;
+        memset(&set, 0, sizeof(set));
+        // Header, comments and blank lines do not parse as five numbers
+        if (sscanf(line, "%f,%f,%f,%f,%f", &set.deltaT, &set.timeConst, &set.diffCon, &set.bSpin, &set.gamma) != 5) {
+            continue;
+        }
+        if (set.deltaT <= 0 || set.timeConst <= 0) {
+            printf("Sweep table line %d: dt and T must be positive\n", lineNumber);
+            free(result);
+            fclose(file);
+            return -1;
+        }
+
+        // Same behavior calculations as a single run
+        set.increments = (int)floor((set.timeConst / set.deltaT) * (1 + fabsf(set.bSpin)));
+        set.moveProb = moveProbCalc(set.diffCon, set.bSpin, set.deltaT);
+        set.jumpProb = set.gamma * set.deltaT;
+
+        if (numSets == capacity) {
+            capacity *= 2;
+            SweepSet *grown = realloc(result, capacity * sizeof(SweepSet));
+            if (grown == NULL) {
+                free(result);
+                fclose(file);
+                return -1;
+            }
+            result = grown;
+        }
+        result[numSets++] = set;
+    }
+    fclose(file);
+
+    if (numSets == 0) {
+        printf("Sweep table %s has no parameter sets\n", path);
+        free(result);
+        return -1;
+    }
+
+    for (int s = 0; s < numSets; s++)
+    {
+        result[s].counts = calloc(2 * (2 * (size_t)result[s].increments + 1), sizeof(int64_t));
+        if (result[s].counts == NULL) {
+            freeSweepSets(result, s);
+            return -1;
+        }
+    }
+
+    *sets = result;
+    return numSets;
+}
+
+void freeSweepSets(SweepSet *sets, int numSets)
+{
+    if (sets == NULL) {
+        return;
+    }
+    for (int s = 0; s < numSets; s++) {
+        free(sets[s].counts);
+    }
+    free(sets);
+}
+
+// Number of RNG streams a sweep uses, every set gets its own blocks
+int getSweepStreams(int numSets, int numParticles)
+{
+    return numSets * getNumStreams(numParticles);
+}
+
+// Walk numParticles particles for every set, all sets sharing one thread pool
+int runSweep(SweepSet *sets, int numSets, int numParticles, RngStream *rng_streams)
+{
+    if (sets == NULL || rng_streams == NULL || numSets <= 0 || numParticles <= 0) {
+        printf("Error: sweep not initialized\n"); fflush(stdout);
+        return -1;
+    }
+
+    int *order = malloc(numSets * sizeof(int));
+    if (order == NULL) {
+        return -1;
+    }
+    // Longest sets first, so the biggest blocks are not left for the end
+    for (int s = 0; s < numSets; s++)
+    {
+        int j = s;
+        while (j > 0 && sets[order[j - 1]].increments < sets[s].increments) {
+            order[j] = order[j - 1];
+            j--;
+        }
+        order[j] = s;
+    }
+
+    int blocksPerSet = getNumStreams(numParticles);
+    int totalBlocks = numSets * blocksPerSet;
+
+    // Blocks differ in cost by their set's increments, so hand them out dynamically.
+    // Each block keeps its own stream, so the result never depends on the schedule.
+    #pragma omp parallel for schedule(dynamic)
+    for (int task = 0; task < totalBlocks; task++)
+    {
+        int s = order[task / blocksPerSet];
+        int block = task % blocksPerSet;
+        SweepSet *set = &sets[s];
+        int sites = 2 * set->increments + 1;
+        int start = block * RNG_BLOCK_SIZE;
+        int end = (start + RNG_BLOCK_SIZE < numParticles) ? start + RNG_BLOCK_SIZE : numParticles;
+
+        // Set s owns streams s * blocksPerSet onward
+        pcg32_random_t rng = rng_streams[s * blocksPerSet + block].rng;
+
+        for (int i = start; i < end; i++)
+        {
+            // Odd particles start on the top line, as in a single run
+            int32_t x = 0;
+            int lane = i & 1;
+            walkParticle(&x, &lane, set->moveProb, set->jumpProb, &rng, set->increments);
+            #pragma omp atomic
+            set->counts[lane * sites + x + set->increments]++;
+        }
+
+        rng_streams[s * blocksPerSet + block].rng = rng;
+    }
+
+    free(order);
+    return 0;
+}
+
+// Write set,y,x,frequency rows for every occupied site of every set
+int writeSweepCSV(const char *path, const SweepSet *sets, int numSets, int numParticles)
+{
+    FILE *file = fopen(path, "w");
+    if (file == NULL) {
+        perror("Failed to open sweep output");
+        return -1;
+    }
+
+    fprintf(file, "set,y,x,frequency\n");
+    for (int s = 0; s < numSets; s++)
+    {
+        int sites = 2 * sets[s].increments + 1;
+        for (int lane = 0; lane < 2; lane++)
+        {
+            for (int j = 0; j < sites; j++)
+            {
+                int64_t n = sets[s].counts[lane * sites + j];
+                if (n != 0) {
+                    fprintf(file, "%d,%d,%d,%.9g\n", s, lane, j - sets[s].increments, (double)n / numParticles);
+                }
+            }
+        }
+    }
+
+    if (fclose(file) != 0) {
+        perror("Failed to write sweep output");
+        return -1;
+    }
+    return 0;
+}
@@ -0,0 +1,35 @@
+#ifndef SWEEP_H_INCLUDED
+#define SWEEP_H_INCLUDED
+
+#include <stdint.h>
+#include "helper.h"
+
+// One row of a sweep table and its final (x, lane) counts
+typedef struct {
+    float deltaT;
+    float timeConst;
+    float diffCon;
+    float bSpin;
+    float gamma;
+    int increments;
+    float moveProb;
+    float jumpProb;
+    int64_t *counts; // 2 * (2 * increments + 1), bottom lane first, site increments is x = 0
+} SweepSet;
+
+// Read a dt,T,D,b,gamma table, one parameter set per line. Returns the
+// number of sets and allocates *sets, or -1 on error.
+int readSweepTable(const char *path, SweepSet **sets);
+
+void freeSweepSets(SweepSet *sets, int numSets);
+
+// Number of RNG streams a sweep uses, every set gets its own blocks
+int getSweepStreams(int numSets, int numParticles);
+
+// Walk numParticles particles for every set, all sets sharing one thread pool
+int runSweep(SweepSet *sets, int numSets, int numParticles, RngStream *rng_streams);
+
+// Write set,y,x,frequency rows for every occupied site of every set
+int writeSweepCSV(const char *path, const SweepSet *sets, int numSets, int numParticles);
+
+#endif
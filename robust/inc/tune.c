@@ -0,0 +1,185 @@
+#include <stdio.h>
+#include <omp.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include "helper.h"
+#include "bench.h"
+#include "tune.h"
+
+// Every walker count from 2^bucket up to 2^(bucket + 1) shares a cache entry
+static int walkerBucket(int numParticles)
+{
+    int bucket = 0;
+    while ((numParticles >> (bucket + 1)) > 0) {
+        bucket++;
+    }
+    return bucket;
+}
+
+// Cache file under the home directory, with its directories created. Returns 0 or -1.
+static int tuneCachePath(char *path, size_t size)
+{
+    const char *home = getenv("HOME");
+    if (home == NULL) {
+        return -1;
+    }
+    snprintf(path, size, "%s/.cache", home);
+    mkdir(path, 0755);
+    snprintf(path, size, "%s/.cache/randomwalks", home);
+    mkdir(path, 0755);
+    snprintf(path, size, "%s/%s", home, TUNE_CACHE_FILE);
+    return 0;
+}
+
+// Newest cached winner for this machine, bucket and placement. Returns 0, or -1 if there is none.
+static int lookupTune(const char *path, const char *host, int bucket, const char *kernel, const char *placement, int procs, TuneResult *result)
+{
+    FILE *file = fopen(path, "r");
+    if (file == NULL) {
+        return -1;
+    }
+
+    int found = -1;
+    char line[512];
+    while (fgets(line, sizeof(line), file) != NULL)
+    {
+        char lineHost[256];
+        char lineKernel[16];
+        char linePlacement[16];
+        int lineBucket;
+        int lineProcs;
+        TuneResult entry;
+        if (sscanf(line, "%255s %d %15s %15s %d %d %d %lf", lineHost, &lineBucket, lineKernel, linePlacement, &lineProcs,
+                   &entry.threads, &entry.chunk, &entry.rate) == 8
+            && strcmp(lineHost, host) == 0 && lineBucket == bucket && strcmp(lineKernel, kernel) == 0
+            && strcmp(linePlacement, placement) == 0 && lineProcs == procs && entry.threads > 0 && entry.threads <= procs && entry.chunk >= 0)
+        {
+            // Appended later, so it replaces earlier entries
+            *result = entry;
+            found = 0;
+        }
+    }
+    fclose(file);
+    return found;
+}
+
+// Calibration rate of one setting in particle-steps per second, 0 if the benchmark failed
+static double measure(int kernel, int numParticles, int numa, int threads, int chunk)
+{
+    BenchConfig config = {
+        .mode = MODE_PARTICLES,
+        .kernel = kernel,
+        .numParticles = numParticles,
+        .window = TUNE_WINDOW,
+        .windows = 1,
+        .warmup = 1,
+        .repeats = TUNE_REPEATS,
+        .numa = numa,
+        .seed = DEFAULT_SEED,
+    };
+    double seconds[TUNE_REPEATS];
+    omp_set_num_threads(threads);
+    setBlockSchedule(chunk);
+    if (runBenchmark(&config, seconds) != 0) {
+        return 0;
+    }
+
+    double fastest = seconds[0];
+    for (int r = 1; r < TUNE_REPEATS; r++) {
+        if (seconds[r] < fastest) fastest = seconds[r];
+    }
+    double rate = (double)numParticles * TUNE_WINDOW / fastest;
+    printf("Calibration: %d threads, chunk %d: %.4g particle-steps/s\n", threads, chunk, rate);
+    return rate;
+}
+
+// Time powers of two threads up to every core with the even split, then
+// smaller chunks at the winning thread count
+static int calibrate(int kernel, int numParticles, int numa, int procs, TuneResult *best)
+{
+    memset(best, 0, sizeof(*best));
+    for (int threads = 1; ; threads = (threads * 2 < procs) ? threads * 2 : procs)
+    {
+        double rate = measure(kernel, numParticles, numa, threads, 0);
+        if (rate > best->rate)
+        {
+            best->threads = threads;
+            best->rate = rate;
+        }
+        if (threads >= procs) {
+            break;
+        }
+    }
+    if (best->threads == 0) {
+        return -1;
+    }
+
+    // Interleaved chunks can balance threads better, at the cost of
+    // scattering each thread's walkers. Only chunks below the even share differ.
+    static const int chunks[] = { 1, 4, 16 };
+    double evenRate = best->rate;
+    int numBlocks = getNumStreams(numParticles);
+    for (size_t c = 0; c < sizeof(chunks) / sizeof(chunks[0]) && best->threads > 1; c++)
+    {
+        if (chunks[c] * best->threads >= numBlocks) {
+            continue;
+        }
+        double rate = measure(kernel, numParticles, numa, best->threads, chunks[c]);
+        if (rate > evenRate * (1 + TUNE_MARGIN) && rate > best->rate)
+        {
+            best->chunk = chunks[c];
+            best->rate = rate;
+        }
+    }
+    return 0;
+}
+
+int autotune(int kernel, int numParticles, int numa, int retune, TuneResult *best)
+{
+    if (numParticles <= 0)
+    {
+        printf("Invalid particle count: %d\n", numParticles);
+        return -1;
+    }
+
+    int procs = omp_get_num_procs();
+    int bucket = walkerBucket(numParticles);
+    const char *kernelName = (kernel == KERNEL_SIMD) ? "simd" : "scalar";
+    // Pinned threads and huge pages change the winner
+    const char *placement = numa ? "numa" : "default";
+    char host[256];
+    if (gethostname(host, sizeof(host)) != 0) {
+        strcpy(host, "unknown");
+    }
+    host[sizeof(host) - 1] = '\0';
+
+    char path[4096];
+    int cacheable = (tuneCachePath(path, sizeof(path)) == 0);
+    if (cacheable && !retune && lookupTune(path, host, bucket, kernelName, placement, procs, best) == 0)
+    {
+        printf("Calibrated before: %d threads, chunk %d for the %s kernel with 2^%d walkers\n", best->threads, best->chunk, kernelName, bucket);
+        return 0;
+    }
+
+    printf("Calibrating the %s kernel for %d walkers on %d cores\n", kernelName, numParticles, procs);
+    if (calibrate(kernel, numParticles, numa, procs, best) != 0)
+    {
+        return -1;
+    }
+
+    if (!cacheable) {
+        return 0;
+    }
+    FILE *file = fopen(path, "a");
+    if (file == NULL)
+    {
+        perror("Failed to save calibration");
+        return 0;
+    }
+    fprintf(file, "%s %d %s %s %d %d %d %.6g\n", host, bucket, kernelName, placement, procs, best->threads, best->chunk, best->rate);
+    fclose(file);
+    return 0;
+}
@@ -0,0 +1,26 @@
+#ifndef TUNE_H_INCLUDED
+#define TUNE_H_INCLUDED
+
+// Increments per calibration call, one published window
+#define TUNE_WINDOW 10
+// Timed calls per candidate, the fastest one counts
+#define TUNE_REPEATS 3
+// A smaller chunk has to beat the even split by this much to be kept
+#define TUNE_MARGIN 0.05
+// Winners per machine, next to the Python result cache
+#define TUNE_CACHE_FILE ".cache/randomwalks/autotune.txt"
+
+typedef struct {
+    int threads;
+    int chunk;   // Blocks per chunk for setBlockSchedule, 0 for the even split
+    double rate; // Particle-steps per second in calibration
+} TuneResult;
+
+// Fastest thread count and block chunk for numParticles walkers with a
+// particle kernel. Winners are cached per host, walker count bucket (power
+// of two), kernel, placement (numa or not) and available cores, so only the
+// first run of a bucket pays for the calibration, or every run with retune.
+// Leaves the thread count and schedule for the caller to set. Returns 0 or -1.
+int autotune(int kernel, int numParticles, int numa, int retune, TuneResult *best);
+
+#endif
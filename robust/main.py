@@ -1,8 +1,8 @@
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QHBoxLayout, QFormLayout, QGroupBox,
-    QLabel, QLineEdit, QSlider, QSpinBox, QPushButton
+    QLabel, QLineEdit, QSlider, QSpinBox, QPushButton, QCheckBox
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
 from pyqtgraph import PlotWidget # type: ignore
 import pyqtgraph as pg
 import sys
@@ -15,21 +15,81 @@ import threading
 import queue
 import time
 import math
+import numpy as np
 from datetime import datetime
+import solver
+import cache
+import reference
 
 SHM_NAME = "/particle_shm"
+# Commands for the resident simulator (matches server.h): command, ack, then
+# action, status, dt, T, D, b, gamma, particles, mode, kernel, pace, bin width, seed
+CONTROL_SHM_NAME = "/particle_ctl"
+CONTROL_SIZE = 64
+CONTROL_FIELDS = struct.Struct('<ii5f5iQ')
+CONTROL_RESET = 0
+CONTROL_QUIT = 1
+CONTROL_STOP = 2
+# Wakeups between the processes (matches notify.h)
+READY_SEM_NAME = "/particle_ready"        # Posted by C when a snapshot is published
+CONSUMED_SEM_NAME = "/particle_consumed"  # Posted here once a snapshot has been read
+
+# Header: read flag, count, layout, sites, histogram bins, sites per bin,
+# histogram origin, snapshot sequence, run stats (matches ParticleStruct)
+HEADER_SIZE = 96
+SEQUENCE_OFFSET = 28
+# Run stats: increments, particle-steps, then elapsed, compute, blocked and
+# sleep seconds and the rate over the last window (matches RunStats)
+STATS_OFFSET = 32
+STATS_FIELDS = struct.Struct('<QQddddd')
+# Histogram slots, snapshot g is written to slot g & 1 (matches histogram.c)
+HISTOGRAM_SLOTS = 2
+# Shared memory layouts (matches helper.h)
+LAYOUT_PARTICLES = 0  # {y, x} float pairs
+LAYOUT_COMPACT = 1    # int32 positions, then one lane bit per particle
+LAYOUT_LATTICE = 2    # int64 walker count per site, bottom lane then top
+# One Particle of the float layout (matches helper.h)
+PARTICLE_DTYPE = np.dtype([('y', '<f4'), ('x', '<f4')])
+# Run settings (matches helper.h)
+MODE_PARTICLES, MODE_LATTICE = 0, 1
+KERNEL_SCALAR, KERNEL_SIMD = 0, 1
+PACE_VISUAL, PACE_MAX = 0, 1
+# Increments per published snapshot (matches runSimulation)
+WINDOW_INCREMENTS = 10
 
 C_EXECUTABLE = "./RWoperation"
 
 class MainWindow(QMainWindow):
+    # Emitted from the waiter thread with its process, delivered to update_plot on the GUI thread
+    snapshot_ready = pyqtSignal(object)
+
     def __init__(self):
         super().__init__()
         self.x_vals = []
         self.y_vals = []
+        # Reused for every frame, grown when a frame needs more points
+        self.frame_x = None
+        self.frame_y = None
+        # Reference curve currently on screen
+        self.drawn_solution = None
+        # Smoothed draw time and interval between frames, in seconds
+        self.frame_time = None
+        self.frame_interval = None
+        self.last_frame_at = None
+        self.frame_reported_at = 0.0
         self.particle_count = 50000
         self.shm_fd = None
         self.shm = None
+        self.shm_buf = None
+        self.control = None
+        self.control_buf = None
+        self.last_snapshot = 0
+        # Key of the running configuration until its last snapshot is cached
+        self.cache_key = None
+        self.final_snapshot = 0
         self.process = None
+        self.ready_sem = None
+        self.consumed_sem = None
         self.output_queue = queue.Queue()
 
         self.setWindowTitle("Particle Simulation")
@@ -54,6 +114,7 @@ class MainWindow(QMainWindow):
         # Input widgets
         self.dt_input = QLineEdit("0.01")
         self.D_input = QLineEdit("1")
+        self.seed_input = QLineEdit("123456789")
         self.T_slider = QSpinBox()
         self.T_slider.setRange(10, 10000)
         self.T_slider.setValue(1)
@@ -73,6 +134,22 @@ class MainWindow(QMainWindow):
         self.particles_slider.setValue(self.particle_count)
         self.particles_value_label = QLabel(str(self.particle_count))  # Label to display particles value
 
+        # Evolve walker counts per site instead of individual walkers
+        self.lattice_checkbox = QCheckBox("Lattice engine")
+        # Lattice sites per histogram bin
+        self.bin_width_input = QSpinBox()
+        self.bin_width_input.setRange(1, 100)
+        self.bin_width_input.setValue(1)
+
+        # Branchless kernel instead of the scalar reference kernel
+        self.simd_checkbox = QCheckBox("SIMD kernel")
+        # Let the kernel run flat out and plot whichever snapshot is newest
+        self.max_pace_checkbox = QCheckBox("Max throughput")
+        # Draw the master equation distribution instead of the analytic curve
+        self.master_checkbox = QCheckBox("Master equation curve")
+        self.master_solution = None
+        self.master_curve = None
+
         # Connect sliders to update their labels
         self.b_slider.valueChanged.connect(self.update_b_label)
         self.g_slider.valueChanged.connect(self.update_g_label)
@@ -82,6 +159,7 @@ class MainWindow(QMainWindow):
         self.control_layout.addRow(QLabel("dt:"), self.dt_input)
         self.control_layout.addRow(QLabel("T:"), self.T_slider)
         self.control_layout.addRow(QLabel("D:"), self.D_input)
+        self.control_layout.addRow(QLabel("Seed:"), self.seed_input)
         
         b_layout = QHBoxLayout()
         b_layout.addWidget(self.b_slider)
@@ -100,16 +178,35 @@ class MainWindow(QMainWindow):
         particles_layout.addWidget(self.particles_value_label)
         self.control_layout.addRow(QLabel("Particles:"), QWidget())
         self.control_layout.addRow(particles_layout)
+        self.control_layout.addRow(QLabel("Bin width:"), self.bin_width_input)
+        self.control_layout.addRow(self.lattice_checkbox)
+        self.control_layout.addRow(self.simd_checkbox)
+        self.control_layout.addRow(self.max_pace_checkbox)
+        self.control_layout.addRow(self.master_checkbox)
+
+        self.frame_label = QLabel("-")
+        self.control_layout.addRow(QLabel("Frame:"), self.frame_label)
+        self.kernel_label = QLabel("-")
+        self.control_layout.addRow(QLabel("Kernel:"), self.kernel_label)
 
         self.reset_button = QPushButton("Reset Simulation")
         self.reset_button.clicked.connect(self.resetButton)
         self.control_layout.addRow(self.reset_button)
 
-        self.curve = self.graph_widget.plot(self.x_vals, self.y_vals, pen=None, symbol='+', symbolSize=5, symbolBrush='purple')
-        self.solCurve = self.graph_widget.plot([], [], pen=None, symbol='o', symbolSize=5, symbolBrush='y')
-        self.initialize_shared_memory()
-        self.timer = pg.QtCore.QTimer()
-        self.timer.timeout.connect(self.update_plot)
+        # One line per lane, symbols get slow once there are thousands of bins
+        self.top_curve = self.plot_line('purple')
+        self.bottom_curve = self.plot_line('purple')
+        self.top_solution = self.plot_line('y')
+        self.bottom_solution = self.plot_line('y')
+        self.snapshot_ready.connect(self.update_plot)
+
+    def plot_line(self, color):
+        """Add an empty line curve that only draws the visible range, decimated to screen resolution."""
+        line = self.graph_widget.plot(pen=pg.mkPen(color, width=1), connect='all', skipFiniteCheck=True)
+        line.setClipToView(True)
+        # Peak decimation keeps the minimum and maximum of every pixel column
+        line.setDownsampling(auto=True, method='peak')
+        return line
 
     def update_b_label(self, value):
         """Update the label for b slider with its current value."""
@@ -124,49 +221,92 @@ class MainWindow(QMainWindow):
         self.particles_value_label.setText(str(value))
 
     def resetButton(self):
-        """Handle reset button click: start simulation and let timer handle plotting."""
+        """Handle reset button click: start simulation and let snapshot notifications handle plotting."""
         self.last_particle_data = None
         self.reset_simulation()
-        # Milliseconds
-        self.timer.start(50)
-
-    def initialize_shared_memory(self):
-        # Set value and determine size of shared memory
-        self.particle_count = self.particles_slider.value()
-        size = 12 + self.particle_count * 8
-        # Map and set up connection to shared memory
-        self.shm = posix_ipc.SharedMemory(SHM_NAME, posix_ipc.O_CREAT | posix_ipc.O_RDWR, size=size)
-        self.shm_buf = mmap.mmap(self.shm.fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
 
-        # Place count in second 4 bytes
-        self.shm_buf[4:8] = struct.pack('i', self.particle_count)
-        # 3 integers: flag, count, buffer
-        offset = 12
-        # Pack structure
-        for i in range(self.particle_count):
-            self.shm_buf[offset:offset+4] = struct.pack('f', 0.0)
-            self.shm_buf[offset+4:offset+8] = struct.pack('f', float(i % 2))
-            # 2 integers inside each particle
-            offset += 8
-
-        self.shm_buf[0:4] = struct.pack('i', 1)
+    def map_shared_memory(self):
+        """Map the block the simulator built, sized from its header, and start reading from snapshot zero."""
+        self.shm = posix_ipc.SharedMemory(SHM_NAME)
+        header = mmap.mmap(self.shm.fd, HEADER_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        count, layout, sites, bins = struct.unpack('4i', header[4:20])
+        header.close()
+
+        if layout == LAYOUT_LATTICE:
+            # One int64 count per site and lane
+            body = HEADER_SIZE + 2 * sites * 8
+        else:
+            body = HEADER_SIZE + count * 4 + (count + 7) // 8
+        # Histogram region follows the body, 8 byte aligned
+        self.histogram_offset = (body + 7) & ~7
+        size = self.histogram_offset + HISTOGRAM_SLOTS * 2 * bins * 8
+        self.shm_buf = mmap.mmap(self.shm.fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.particle_count = count
+        self.last_snapshot = 0
 
     def read_output(self, pipe, label):
         for line in iter(pipe.readline, ''):
             self.output_queue.put(f"{label}: {line.strip()}")
         pipe.close()
 
-    def reset_simulation(self):
+    def start_server(self):
+        """Create the control block and semaphores and start RWoperation as a resident server."""
+        self.stop_server()
+        self.control = posix_ipc.SharedMemory(CONTROL_SHM_NAME, posix_ipc.O_CREAT, size=CONTROL_SIZE)
+        self.control_buf = mmap.mmap(self.control.fd, CONTROL_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.control_buf[:] = bytes(CONTROL_SIZE)
+        self.initialize_notifications()
+
+        # The server calibrates the thread count for each walker count once and caches it
+        command = [C_EXECUTABLE, "--server", "auto", "--notify"]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+
+        threading.Thread(target=self.read_output, args=(self.process.stdout, "C Output"), daemon=True).start()
+        threading.Thread(target=self.read_output, args=(self.process.stderr, "C Error"), daemon=True).start()
+        threading.Thread(target=self.wait_for_snapshots, args=(self.process, self.ready_sem), daemon=True).start()
+
+    def send_command(self, action, fields=(0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0), timeout=10):
+        """Write a command into the control block and wait for the server to apply it. Returns True if it succeeded."""
+        command = (struct.unpack('I', self.control_buf[0:4])[0] + 1) & 0xFFFFFFFF
+        self.control_buf[8:CONTROL_SIZE] = CONTROL_FIELDS.pack(action, 0, *fields)
+        # Publish the command only once every field is in place
+        self.control_buf[0:4] = struct.pack('I', command)
+        # Wake the server if it is waiting on a reader
+        self.consumed_sem.release()
+
+        deadline = time.monotonic() + timeout
+        while struct.unpack('I', self.control_buf[4:8])[0] != command:
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                return False
+            time.sleep(0.0005)
+        return struct.unpack('i', self.control_buf[12:16])[0] == 0
+
+    def stop_server(self):
+        """Ask a running server to quit, terminating it if it does not."""
         if self.process is not None and self.process.poll() is None:
-            self.process.terminate()
+            if self.control_buf is None or not self.send_command(CONTROL_QUIT, timeout=2):
+                self.process.terminate()
             try:
                 self.process.wait(timeout=2)
             except subprocess.TimeoutExpired:
                 self.process.kill()
-            print("Terminated previous C process.")
+            print("Stopped previous C process.")
 
-        self.cleanup_shared_memory()
-        self.initialize_shared_memory()
+        if self.control_buf is not None:
+            self.control_buf.close()
+            self.control_buf = None
+        if self.control is not None:
+            try:
+                posix_ipc.unlink_shared_memory(CONTROL_SHM_NAME)
+            except posix_ipc.ExistentialError:
+                pass
+            self.control = None
+        self.cleanup_notifications()
+
+    def reset_simulation(self):
+        if not os.path.exists(C_EXECUTABLE):
+            print(f"Error: {C_EXECUTABLE} not found. Please compile it first.")
+            return
 
         dt = self.dt_input.text()
         T = self.T_slider.value()
@@ -175,140 +315,281 @@ class MainWindow(QMainWindow):
         g = self.g_slider.value() / 100.0
         print(f"Gamma: {g}")
         particles = self.particles_slider.value()
-        cores = 20
-
-        if not os.path.exists(C_EXECUTABLE):
-            print(f"Error: {C_EXECUTABLE} not found. Please compile it first.")
+        seed = int(self.seed_input.text())
+
+        # Idle time between runs is not a frame interval
+        self.last_frame_at = None
+
+        # Parameters are fixed for the whole run, so the exact distribution is computed once
+        self.master_solution = None
+        self.master_curve = None
+        if self.master_checkbox.isChecked():
+            self.master_solution = solver.masterEquation(float(dt), T, float(D), b, g)
+            self.master_curve = self.masterCurve()
+
+        mode = MODE_LATTICE if self.lattice_checkbox.isChecked() else MODE_PARTICLES
+        kernel = KERNEL_SIMD if self.simd_checkbox.isChecked() else KERNEL_SCALAR
+        pace = PACE_MAX if self.max_pace_checkbox.isChecked() else PACE_VISUAL
+        fields = (float(dt), T, float(D), b, g, particles, mode, kernel, pace, self.bin_width_input.value(), seed)
+
+        # Pacing does not change the result, everything else does
+        self.cache_key = cache.cacheKey({'program': 'robust', 'dt': float(dt), 'T': T, 'D': float(D), 'b': b, 'gamma': g,
+                                         'particles': particles, 'seed': seed, 'mode': mode, 'kernel': kernel,
+                                         'bin width': self.bin_width_input.value()}, C_EXECUTABLE)
+        self.final_snapshot = math.ceil(solver.incrementsCalc(float(dt), T, b) / WINDOW_INCREMENTS)
+        cached = cache.lookupResult(self.cache_key)
+        if cached is not None:
+            # Let go of the old run so its late snapshots are not drawn over the cached one,
+            # and idle the server so it stops walking a run nobody reads
+            self.close_shared_memory()
+            if self.process is not None and self.process.poll() is None:
+                self.send_command(CONTROL_STOP)
+            frame = cache.loadArrays(cached)
+            self.plot_frame((frame['x'], frame['y']))
+            print("Final snapshot loaded from cache.")
             return
 
-        command = [C_EXECUTABLE, str(dt), str(T), str(D), str(b), str(g), str(particles), str(cores)]
-        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+        # The server outlives resets, it is only started the first time or after it died
+        if self.process is None or self.process.poll() is not None:
+            self.start_server()
 
-        threading.Thread(target=self.read_output, args=(self.process.stdout, "C Output"), daemon=True).start()
-        threading.Thread(target=self.read_output, args=(self.process.stderr, "C Error"), daemon=True).start()
+        # The server may resize the block, so let go of it until the reset is applied
+        self.close_shared_memory()
+        if not self.send_command(CONTROL_RESET, fields):
+            print("Simulation reset failed.")
+            return
+        self.map_shared_memory()
+        # Credit for the first window, the server dropped any left from the last run
+        self.consumed_sem.release()
+
+    def initialize_notifications(self):
+        """Create the semaphores RWoperation opens with --notify. Each reset hands the server its first credit."""
+        self.ready_sem = posix_ipc.Semaphore(READY_SEM_NAME, posix_ipc.O_CREAT, initial_value=0)
+        self.consumed_sem = posix_ipc.Semaphore(CONSUMED_SEM_NAME, posix_ipc.O_CREAT, initial_value=0)
+
+    def cleanup_notifications(self):
+        # Only unlink, a waiter thread from the previous run may still hold the old semaphore
+        for name in (READY_SEM_NAME, CONSUMED_SEM_NAME):
+            try:
+                posix_ipc.unlink_semaphore(name)
+            except posix_ipc.ExistentialError:
+                pass
+        self.ready_sem = None
+        self.consumed_sem = None
+
+    def wait_for_snapshots(self, process, ready_sem):
+        """Sleep until the C process publishes a snapshot, then wake the GUI thread. Runs on its own thread."""
+        while process.poll() is None:
+            try:
+                # Timeout only so the thread notices the process exiting
+                ready_sem.acquire(0.5)
+            except posix_ipc.BusyError:
+                continue
+            self.snapshot_ready.emit(process)
+        # One more wakeup to draw the last snapshot and report the exit
+        self.snapshot_ready.emit(process)
 
     def get_move_distance(self):
         return math.sqrt(2 * float(self.D_input.text()) * float(self.dt_input.text()))
         
-    def read_shared_memory(self):           
-        # If flag is still one from when python last operated
-        if struct.unpack('i', self.shm_buf[0:4])[0] != 0:
-            # print("Python read no update.\n")
-            return []
-        count = struct.unpack('i', self.shm_buf[4:8])[0]
-        topParticles = {}
-        bottomParticles = {}
-        offset = 12
-        minX = 0
-        maxX = 0
-        
-        for _ in range(count):
-            x = struct.unpack('f', self.shm_buf[offset:offset+4])[0]
-            y = struct.unpack('f', self.shm_buf[offset+4:offset+8])[0]
-            
-            if x > maxX:
-                maxX = x
-            if x < minX:
-                minX = x
-
-            if y == 1:
-                topParticles[x] = topParticles.get(x, 0) + 1
-            else:
-                bottomParticles[x] = bottomParticles.get(x, 0) + 1
-            
-            offset += 8
-        
-        moveDistance = self.get_move_distance()
-
-        particles = []   
-        totalParts = 0
-        for x in set(topParticles.keys()) | set(bottomParticles.keys()):
-            if x in topParticles:
-                yPart = topParticles[x] / count
-                totalParts += topParticles[x]
-                particles.append((x * moveDistance, yPart)) 
-            if x in bottomParticles:
-                yPart = bottomParticles[x] / count
-                totalParts += bottomParticles[x]
-                particles.append((x * moveDistance, -1 * yPart))
-
+    def read_snapshot(self, bins):
+        """Copy the newest complete histogram slot. Returns a (2, bins) array, or None if nothing new was published."""
+        while True:
+            start = struct.unpack('I', self.shm_buf[SEQUENCE_OFFSET:STATS_OFFSET])[0]
+            # Odd while the next snapshot is written to the other slot
+            snapshot = start >> 1
+            if snapshot == 0 or snapshot == self.last_snapshot:
+                return None
+            offset = self.histogram_offset + (snapshot & 1) * 2 * bins * 8
+            counts = np.frombuffer(self.shm_buf, dtype=np.int64, count=2 * bins, offset=offset).reshape(2, bins).copy()
+            # The slot is only rewritten once snapshot + 2 starts, retry if the kernel got there
+            end = struct.unpack('I', self.shm_buf[SEQUENCE_OFFSET:STATS_OFFSET])[0]
+            if (end - 2 * snapshot) & 0xFFFFFFFF <= 2:
+                self.last_snapshot = snapshot
+                return counts
+
+    def release_snapshot(self):
+        """Hand the snapshot back to the kernel: set the read flag, and wake it if it waits on the semaphore."""
         self.shm_buf[0:4] = struct.pack('i', 1)
-        newParts = [(x, y) for x, y in particles if not (x == 0 and y == 0)]
-        
-        return newParts
+        if self.consumed_sem is not None:
+            self.consumed_sem.release()
+
+    def read_shared_memory(self):
+        """Histogram the latest snapshot straight out of shared memory. Returns (x, frequency) arrays, or None if nothing new."""
+        if self.shm_buf is None:
+            return None
+        # Zero once the kernel has published, paced runs wait for it to go back to one
+        ready = struct.unpack('i', self.shm_buf[0:4])[0] == 0
+        count, layout, sites, bins, width, origin = struct.unpack('6i', self.shm_buf[4:28])
+
+        if bins > 0:
+            # The kernel already binned every particle, bottom lane row 0, top lane row 1
+            counts = self.read_snapshot(bins)
+            if counts is None:
+                return None
+            bottom, top = counts[0], counts[1]
+            positions = origin + np.arange(bins) * width + (width - 1) / 2
+        elif not ready:
+            # Particle data is only consistent between windows of a paced run
+            return None
+        elif layout == LAYOUT_LATTICE:
+            counts = np.frombuffer(self.shm_buf, dtype=np.int64, count=2 * sites, offset=HEADER_SIZE).reshape(2, sites)
+            bottom, top = counts[0].copy(), counts[1].copy()
+            positions = -(sites // 2) + np.arange(sites)
+        else:
+            # Views into the mapped segment, nothing is copied until bincount
+            if layout == LAYOUT_COMPACT:
+                xs = np.frombuffer(self.shm_buf, dtype=np.int32, count=count, offset=HEADER_SIZE)
+                laneBits = np.frombuffer(self.shm_buf, dtype=np.uint8, count=(count + 7) // 8, offset=HEADER_SIZE + count * 4)
+                lanes = np.unpackbits(laneBits, count=count, bitorder='little')
+            else:
+                particles = np.frombuffer(self.shm_buf, dtype=PARTICLE_DTYPE, count=count, offset=HEADER_SIZE)
+                xs = particles['x'].astype(np.int32)
+                lanes = (particles['y'] != 0).astype(np.uint8)
+            minX = int(xs.min())
+            span = int(xs.max()) - minX + 1
+            # Interleave lanes so one bincount gives both histograms
+            counts = np.bincount((xs - minX) * 2 + lanes, minlength=2 * span).reshape(span, 2)
+            bottom, top = counts[:, 0], counts[:, 1]
+            positions = minX + np.arange(span)
+
+        if ready:
+            self.release_snapshot()
+
+        # Scale to plot coordinates, top line positive and bottom line negative
+        positions = positions * self.get_move_distance()
+        topMask = top != 0
+        bottomMask = bottom != 0
+        split = np.count_nonzero(topMask)
+        x, y = self.frame_buffers(split + np.count_nonzero(bottomMask))
+        x[:split] = positions[topMask]
+        x[split:] = positions[bottomMask]
+        y[:split] = top[topMask]
+        y[split:] = bottom[bottomMask]
+        y[:split] /= count
+        y[split:] /= -count
+        return x, y
+
+    def frame_buffers(self, size):
+        """Views of the reused frame arrays. They are overwritten by the next frame, so copy anything kept longer."""
+        if self.frame_x is None or len(self.frame_x) < size:
+            capacity = max(size, 2 * len(self.frame_x) if self.frame_x is not None else 0, 1024)
+            self.frame_x = np.empty(capacity)
+            self.frame_y = np.empty(capacity)
+        return self.frame_x[:size], self.frame_y[:size]
 
-    def analyticSolution(self, x, t, b, D):    
-        lead = 1 / math.sqrt(4 * math.pi * D * t)
-        exponent = -1 * ((x - (b * t)) ** 2)/(4 * D * t)
-        return lead * (math.e ** exponent)
-    
     def solutionCurve(self, minX, maxX):
-        solutionVals = []
+        """Reference curve over the sites from minX to maxX, memoized by reference.referenceCurve."""
+        if self.master_curve is not None:
+            return self.master_curve
         timeIter = self.T_slider.value()# / float(self.dt_input.text())
         bValue = self.b_slider.value() / 100
         dValue = float(self.D_input.text())
-        moveDistance = self.get_move_distance()
-        #print(f"Solution values: t - {timeIter}, b - {bValue}, D - {dValue}\n")
-        if (minX == 0 and maxX == 0):
-            y = self.analyticSolution(0, timeIter, bValue, dValue)
-            solutionVals.append((0, y))
-            solutionVals.append((0, -y))
-            return solutionVals
-        for x in range(int(minX), int(maxX) + 1):
-            y = self.analyticSolution(x, timeIter, bValue, dValue)
-            solutionVals.append((x * moveDistance, y))
-        for x in range(int(minX), int(maxX) + 1):
-            y = self.analyticSolution(x, timeIter, -bValue, dValue)
-            solutionVals.append((x * moveDistance, -y))   
-        return solutionVals
+        gValue = self.g_slider.value() / 100
+        return reference.referenceCurve(timeIter, bValue, dValue, gValue, int(minX), int(maxX), self.get_move_distance())
     
-    def update_plot(self):
+    def masterCurve(self):
+        """Per-site probabilities from the master equation as (x, top line, negated bottom line)."""
+        x, bottom, top = (np.asarray(values) for values in self.master_solution)
+        return x * self.get_move_distance(), top, -bottom
+
+    def plot_frame(self, frame):
+        """Draw one (x, frequency) frame from read_shared_memory with its reference curve."""
+        if frame is None or not len(frame[0]):
+            return
+        start = time.perf_counter()
+        self.x_vals, self.y_vals = frame
+        # Top lane first with positive frequencies, every bin in a frame is non-zero
+        split = np.count_nonzero(self.y_vals > 0)
+        self.top_curve.setData(self.x_vals[:split], self.y_vals[:split])
+        self.bottom_curve.setData(self.x_vals[split:], self.y_vals[split:])
+
+        # Reference curves are memoized, an unchanged one comes back as the same object
+        solution = self.solutionCurve(self.x_vals.min(), self.x_vals.max())
+        if solution is not self.drawn_solution:
+            x, top, bottom = solution
+            self.top_solution.setData(x, top)
+            self.bottom_solution.setData(x, bottom)
+            self.drawn_solution = solution
+        self.report_frame_time(start, time.perf_counter())
+
+    def report_frame_time(self, start, end):
+        """Smooth the draw time and frame interval, and show them at most twice a second."""
+        smoothing = 0.1
+        drawTime = end - start
+        self.frame_time = drawTime if self.frame_time is None else self.frame_time + smoothing * (drawTime - self.frame_time)
+        if self.last_frame_at is not None:
+            interval = start - self.last_frame_at
+            self.frame_interval = interval if self.frame_interval is None else self.frame_interval + smoothing * (interval - self.frame_interval)
+        self.last_frame_at = start
+        if end - self.frame_reported_at >= 0.5:
+            self.frame_reported_at = end
+            rate = f", {1 / self.frame_interval:.0f} FPS" if self.frame_interval else ""
+            self.frame_label.setText(f"{self.frame_time * 1000:.1f} ms{rate}")
+            self.report_kernel_stats()
+
+    def report_kernel_stats(self):
+        """Show the simulator's live throughput and where its time goes, from the stats in the block header."""
+        if self.shm_buf is None:
+            self.kernel_label.setText("-")
+            return
+        increments, steps, elapsed, compute, blocked, sleep, rate = STATS_FIELDS.unpack_from(self.shm_buf, STATS_OFFSET)
+        if elapsed <= 0:
+            return
+        self.kernel_label.setText(f"{rate / 1e6:.1f}M steps/s, {compute / elapsed:.0%} computing, "
+                                  f"{(blocked + sleep) / elapsed:.0%} waiting")
+
+    def plot_snapshot(self, frame):
+        """Draw a snapshot frame, caching it once it is the last one of the run."""
+        self.plot_frame(frame)
+        if frame is not None and self.cache_key is not None and self.last_snapshot == self.final_snapshot:
+            cache.storeResult(self.cache_key, arrays={'x': frame[0], 'y': frame[1]})
+            self.cache_key = None
+
+    def update_plot(self, process):
         while not self.output_queue.empty():
             print(self.output_queue.get())
 
+        # Late wakeups from a server that has been replaced
+        if process is not self.process:
+            return
+
         if self.process is not None and self.process.poll() is None:
-            particles = self.read_shared_memory()
-            if particles:
-                self.x_vals, self.y_vals = zip(*particles)
-                solution = self.solutionCurve(min(self.x_vals), max(self.x_vals))
-                self.x_vals_sol, self.y_vals_sol = zip(*solution)
-                self.curve.setData(self.x_vals, self.y_vals)
-                self.solCurve.setData(self.x_vals_sol, self.y_vals_sol)
+            self.plot_snapshot(self.read_shared_memory())
         elif self.process is not None and self.process.poll() is not None:
-            self.timer.stop()
+            # Posts are merged, so the last wakeup may cover several snapshots
+            self.plot_snapshot(self.read_shared_memory())
             while not self.output_queue.empty():
                 print(self.output_queue.get())
             print("C process has terminated.")
 
-    def cleanup_shared_memory(self):
-        # Shared memory cleanup
-        if hasattr(self, 'shm_buf') and self.shm_buf is not None:
+    def close_shared_memory(self):
+        # Unmap without unlinking, the simulator owns the block
+        if self.shm_buf is not None:
             try:
                 self.shm_buf.close()  # Close mmap buffer
             except Exception as e:
                 print(f"Error closing shm_buf: {e}")
             finally:
                 self.shm_buf = None
+        if self.shm is not None:
+            self.shm.close_fd()
+            self.shm = None
 
-        if hasattr(self, 'shm') and self.shm is not None:
-            try:
-                posix_ipc.unlink_shared_memory(SHM_NAME)  # Remove from system
-            except posix_ipc.ExistentialError:
-                print("Shared memory already unlinked")
-            except Exception as e:
-                print(f"Shared memory cleanup error: {e}")
-            finally:
-                self.shm = None
+    def cleanup_shared_memory(self):
+        # Shared memory cleanup
+        self.close_shared_memory()
+
+        try:
+            posix_ipc.unlink_shared_memory(SHM_NAME)  # Remove from system
+        except posix_ipc.ExistentialError:
+            print("Shared memory already unlinked")
+        except Exception as e:
+            print(f"Shared memory cleanup error: {e}")
 
     def closeEvent(self, event):
         print("Shutting down simulation...")
-        self.timer.stop()
-        if self.process is not None and self.process.poll() is None:
-            self.process.terminate()
-            try:
-                self.process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                self.process.kill()
+        self.stop_server()
         self.cleanup_shared_memory()
         event.accept()
 
@@ -0,0 +1,88 @@
+import mmap
+import struct
+import numpy as np
+import posix_ipc
+
+# Ring RWoperation --moments appends to (matches moments.h)
+MOMENT_SHM_NAME = "/particle_moments"
+# Records written, capacity, record size, increments between samples, reserved
+RING_HEADER = struct.Struct('<QIIII')
+# Magic, version, record size, increments between samples
+FILE_HEADER = struct.Struct('<4sIII')
+MOMENT_FILE_MAGIC = b"RWMS"
+MOMENT_FILE_VERSION = 1
+# One sample, index 0 is the bottom lane, moments are in lattice steps
+MOMENT_DTYPE = np.dtype([
+    ('increment', '<i8'),
+    ('count', '<i8', (2,)),
+    ('mean', '<f8', (2,)),
+    ('variance', '<f8', (2,)),
+    ('third', '<f8', (2,)),
+])
+
+
+def readMomentFile(path):
+    """
+    This function reads a moment time series written with --moments-file.
+
+    Input: file path
+
+    Output: structured array of MOMENT_DTYPE records, increments between samples
+    """
+    with open(path, 'rb') as file:
+        magic, version, recordSize, every = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+        if magic != MOMENT_FILE_MAGIC or version != MOMENT_FILE_VERSION or recordSize != MOMENT_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a version {MOMENT_FILE_VERSION} moment file")
+        return np.fromfile(file, dtype=MOMENT_DTYPE), every
+
+
+def openMomentRing():
+    """
+    This function maps the ring of a running simulation for reading.
+
+    Input: None
+
+    Output: mapped buffer for readMomentRing
+    """
+    memory = posix_ipc.SharedMemory(MOMENT_SHM_NAME)
+    try:
+        return mmap.mmap(memory.fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+    finally:
+        memory.close_fd()
+
+
+def readMomentRing(buffer, start=0):
+    """
+    This function copies every record appended since start. Records the simulator may have overwritten
+    while they were copied are dropped, so a slow reader loses the oldest samples, never gets torn ones.
+
+    Input: buffer from openMomentRing, index of the first record wanted
+
+    Output: structured array of MOMENT_DTYPE records, index to pass as start next time
+    """
+    written, capacity, recordSize, _, _ = RING_HEADER.unpack_from(buffer)
+    if recordSize != MOMENT_DTYPE.itemsize:
+        raise ValueError(f"Ring records are {recordSize} bytes, expected {MOMENT_DTYPE.itemsize}")
+    first = max(start, written - capacity)
+    ring = np.frombuffer(buffer, dtype=MOMENT_DTYPE, count=capacity, offset=RING_HEADER.size)
+    records = ring[np.arange(first, written) % capacity].copy()
+
+    # Record i is rewritten once record i + capacity starts
+    after = RING_HEADER.unpack_from(buffer)[0]
+    return records[max(0, after - capacity + 1 - first):], written
+
+
+def effectiveTransport(records, incrementTime, moveDistance):
+    """
+    This function estimates drift and diffusion per lane from consecutive samples, v_eff = d<x>/dt and
+    D_eff = d Var(x) / (2 dt), to compare against analyticSolution.
+
+    Input: MOMENT_DTYPE records, time per increment (T / increments), distance of one lattice step
+
+    Output: times, v_eff and D_eff, both (samples - 1, 2) arrays with the bottom lane in column 0
+    """
+    times = records['increment'] * incrementTime
+    dt = np.diff(times)[:, None]
+    drift = np.diff(records['mean'], axis=0) * moveDistance / dt
+    diffusion = np.diff(records['variance'], axis=0) * moveDistance ** 2 / (2 * dt)
+    return times[1:], drift, diffusion
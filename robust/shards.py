@@ -0,0 +1,192 @@
+import os
+import struct
+import subprocess
+import numpy as np
+
+# Built with `make`, next to this file
+EXECUTABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RWoperation")
+# Matches helper.h
+DEFAULT_SEED = 123456789
+RNG_BLOCK_SIZE = 1024
+# Shard file written by RWoperation --shard (matches shard.h)
+SHARD_MAGIC = b"RWSH"
+SHARD_VERSION = 2
+SHARD_HEADER = struct.Struct('<4sI5fiQqqi4x')
+SHARD_FIELDS = ('dt', 'T', 'D', 'b', 'gamma', 'increments', 'seed', 'firstParticle', 'numParticles', 'window')
+# Fields every shard of one run shares
+RUN_FIELDS = ('dt', 'T', 'D', 'b', 'gamma', 'increments', 'seed', 'window')
+# MomentSums: int64 count[2], int64 sum[2], int128 sumSquares[2], int128 sumCubes[2]
+MOMENT_SUMS_SIZE = 96
+
+
+def shardRanges(numParticles, numShards):
+    """
+    This function splits a run into block aligned walker ranges, as even as whole RNG blocks allow.
+    Ranges use global walker indices, so a run too large for one process can still be described.
+
+    Input: walkers in the whole run, number of shards
+
+    Output: list of (first walker, walkers) pairs, empty shards left out
+    """
+    blocks = -(-numParticles // RNG_BLOCK_SIZE)
+    ranges = []
+    for shard in range(numShards):
+        first = blocks * shard // numShards * RNG_BLOCK_SIZE
+        end = min(blocks * (shard + 1) // numShards * RNG_BLOCK_SIZE, numParticles)
+        if end > first:
+            ranges.append((first, end - first))
+    return ranges
+
+
+def shardCommand(dt, T, D, b, gamma, first, count, cores, output, seed=DEFAULT_SEED, executable=EXECUTABLE_PATH):
+    """
+    This function builds the command line of one shard worker, to run locally or hand to a cluster
+    scheduler.
+
+    Input: delta t, time constant, diffusion constant, drift constant, gamma, first walker, walkers,
+    cores, output path, seed, executable
+
+    Output: argument list
+    """
+    return [executable, '--shard', str(dt), str(T), str(D), str(b), str(gamma), str(first), str(count),
+            str(cores), output, '--seed', str(seed)]
+
+
+def runLocalShards(dt, T, D, b, gamma, numParticles, numShards, directory, cores=1, seed=DEFAULT_SEED, executable=EXECUTABLE_PATH):
+    """
+    This function is the one machine stand-in for a cluster run: it starts one RWoperation process per
+    shard, waits for all of them and merges what they wrote.
+
+    Input: delta t, time constant, diffusion constant, drift constant, gamma, walkers in the whole run,
+    number of shards, directory for shard files, cores per shard, seed, executable
+
+    Output: merged result, see mergeShards
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    workers = []
+    for index, (first, count) in enumerate(shardRanges(numParticles, numShards)):
+        path = os.path.join(directory, f"shard{index}.bin")
+        command = shardCommand(dt, T, D, b, gamma, first, count, cores, path, seed, executable)
+        workers.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+        paths.append(path)
+
+    failed = [index for index, worker in enumerate(workers) if worker.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Shards {failed} failed")
+    return mergeShards(readShard(path) for path in paths)
+
+
+def _int128(words):
+    """Python ints from (n, 2) little endian uint64 halves of signed 128 bit integers."""
+    return [int(low) + (int(high) << 64) for low, high in zip(words[:, 0], words[:, 1].view('<i8'))]
+
+
+def readShard(path):
+    """
+    This function reads a shard file written with RWoperation --shard.
+
+    Input: file path
+
+    Output: dict of the header fields plus 'counts' ((2, 2 * increments + 1) int64, bottom lane first, x
+    from -increments) and 'sums' (per lane count, sum, sumSquares, sumCubes as exact Python ints)
+    """
+    with open(path, 'rb') as file:
+        magic, version, *values = SHARD_HEADER.unpack(file.read(SHARD_HEADER.size))
+        if magic != SHARD_MAGIC or version != SHARD_VERSION:
+            raise ValueError(f"{path} is not a version {SHARD_VERSION} shard")
+        shard = dict(zip(SHARD_FIELDS, values))
+        raw = np.frombuffer(file.read(MOMENT_SUMS_SIZE), dtype='<u8')
+        sites = 2 * shard['increments'] + 1
+        counts = np.fromfile(file, dtype='<i8', count=2 * sites)
+    if len(raw) * 8 != MOMENT_SUMS_SIZE or len(counts) != 2 * sites:
+        raise ValueError(f"{path} is truncated")
+
+    shard['counts'] = counts.reshape(2, sites)
+    shard['sums'] = {
+        'count': [int(value) for value in raw[0:2].view('<i8')],
+        'sum': [int(value) for value in raw[2:4].view('<i8')],
+        'sumSquares': _int128(raw[4:8].reshape(2, 2)),
+        'sumCubes': _int128(raw[8:12].reshape(2, 2)),
+    }
+    return shard
+
+
+def mergeShards(shards):
+    """
+    This function adds shards of one run together. Shards must share parameters and seed and cover
+    disjoint walker ranges. They can come from any mix of hosts, in any order.
+
+    Input: iterable of dicts from readShard
+
+    Output: dict like readShard with 'numParticles' the walkers merged and 'ranges' the sorted
+    (first walker, walkers) ranges covered
+    """
+    merged = None
+    ranges = []
+    for shard in shards:
+        if merged is None:
+            merged = {name: shard[name] for name in RUN_FIELDS}
+            merged['counts'] = np.zeros_like(shard['counts'])
+            merged['sums'] = {name: [0, 0] for name in shard['sums']}
+        mismatched = [name for name in RUN_FIELDS if shard[name] != merged[name]]
+        if mismatched:
+            raise ValueError(f"Shard from walker {shard['firstParticle']} differs in {', '.join(mismatched)}")
+        merged['counts'] += shard['counts']
+        for name, values in shard['sums'].items():
+            merged['sums'][name] = [total + value for total, value in zip(merged['sums'][name], values)]
+        ranges.append((shard['firstParticle'], shard['numParticles']))
+    if merged is None:
+        raise ValueError("No shards to merge")
+
+    ranges.sort()
+    for (first, count), (nextFirst, _) in zip(ranges, ranges[1:]):
+        if first + count > nextFirst:
+            raise ValueError(f"Shards from walkers {first} and {nextFirst} overlap")
+    merged['ranges'] = ranges
+    merged['numParticles'] = sum(count for _, count in ranges)
+    return merged
+
+
+def shardMoments(merged):
+    """
+    This function turns merged moment sums into per lane moments, the same quantities a MOMENT_DTYPE
+    record holds at the end of a run.
+
+    Input: dict from mergeShards or readShard
+
+    Output: counts, means, variances and third central moments, each a length 2 array, bottom lane
+    first, in lattice steps
+    """
+    sums = merged['sums']
+    count = np.array(sums['count'], dtype=np.int64)
+    mean = np.zeros(2)
+    variance = np.zeros(2)
+    third = np.zeros(2)
+    for lane in range(2):
+        n = sums['count'][lane]
+        if n == 0:
+            continue
+        total = sums['sum'][lane]
+        mean[lane] = total / n
+        # Exact integers until the final division
+        variance[lane] = (n * sums['sumSquares'][lane] - total * total) / (n * n)
+        third[lane] = (n * n * sums['sumCubes'][lane] - 3 * n * total * sums['sumSquares'][lane] + 2 * total ** 3) / n ** 3
+    return count, mean, variance, third
+
+
+def writeShardFrequencies(merged, output1, output2, moveDistance):
+    """
+    This function writes merged shards as the x,frequency tables utils.writeFreqCSV writes for RW.py,
+    top line to output1 and bottom line to output2, occupied sites only.
+
+    Input: dict from mergeShards, output name 1, output name 2, distance of one lattice step
+
+    Output: No output, operates on files
+    """
+    x = (np.arange(merged['counts'].shape[1]) - merged['increments']) * moveDistance
+    for output, counts in ((output1, merged['counts'][1]), (output2, merged['counts'][0])):
+        occupied = counts != 0
+        table = np.column_stack((x[occupied], counts[occupied] / merged['numParticles']))
+        np.savetxt(output + ".csv", table, delimiter=',', fmt='%.10g', header='x,frequency', comments='')
+    return
@@ -0,0 +1,132 @@
+import math
+import numpy as np
+
+
+def moveProbCalc(D, b, dt):
+    """
+    This function computes the move probability the same way as moveProbCalc in inc/helper.c: the square
+    root in double, the result rounded to float. The solver then gives the exact master-equation
+    distribution for the probabilities the C walk uses, which a finite stochastic run only approaches.
+
+    Input: diffusion constant, drift constant, delta t
+
+    Output: probability compared against each move draw
+    """
+    D, b, dt = np.float32(D), np.float32(b), np.float32(dt)
+    if D == 0 and b == 0:
+        return 0.5
+    prob = np.float32(0.5 * (1 + float(b) * math.sqrt(float(dt / (np.float32(2) * D)))))
+    return float(min(1.0, max(0.0, prob)))
+
+
+def incrementsCalc(dt, T, b):
+    """
+    This function mirrors the increment count used by RWoperation.c.
+
+    Input: delta t, time constant, drift constant
+
+    Output: number of increments
+    """
+    return math.floor((np.float32(T) / np.float32(dt)) * (1 + abs(np.float32(b))))
+
+
+def stepMasterEquation(bottom, top, moveProb, jumpProb):
+    """
+    This function advances the two-lane probability vector by one increment, using the same rules as
+    moveParticles: a particle first jumps lanes with jumpProb, otherwise it moves one site. On the bottom
+    line a move is +1 with probability moveProb, on the top line with probability 1 - moveProb.
+
+    Input: bottom line probabilities, top line probabilities, move probability, jump probability
+
+    Output: new bottom line probabilities, new top line probabilities (one site wider on each side)
+    """
+    rightProb = (moveProb, 1 - moveProb)
+    newLanes = []
+    for lane, other, right in ((bottom, top, rightProb[0]), (top, bottom, rightProb[1])):
+        new = np.zeros(len(lane) + 2)
+        stay = (1 - jumpProb) * lane
+        new[2:] += right * stay
+        new[:-2] += (1 - right) * stay
+        new[1:-1] += jumpProb * other
+        newLanes.append(new)
+    return newLanes[0], newLanes[1]
+
+
+def propagate(bottom, top, moveProb, jumpProb, steps):
+    """
+    This function advances the two-lane probability vector by many increments at once. In Fourier space
+    one increment is a 2x2 matrix per frequency, so the whole run is that matrix raised to the number of
+    steps by repeated squaring, applied between one real FFT and one inverse FFT per lane.
+
+    Input: bottom line probabilities, top line probabilities, move probability, jump probability, steps
+
+    Output: bottom line probabilities, top line probabilities (steps sites wider on each side)
+    """
+    width = len(bottom) + 2 * steps
+    size = 1 << (width - 1).bit_length()
+    # Center the start so nothing wraps around the periodic domain
+    spectra = np.zeros((2, size))
+    spectra[0, steps:steps + len(bottom)] = bottom
+    spectra[1, steps:steps + len(top)] = top
+    bottomHat, topHat = np.fft.rfft(spectra, axis=1)
+
+    # One increment: a move right multiplies by w, a move left by conj(w)
+    w = np.exp(-2j * np.pi * np.fft.rfftfreq(size))
+    rightProb = (moveProb, 1 - moveProb)
+    m00 = (1 - jumpProb) * (rightProb[0] * w + (1 - rightProb[0]) * w.conj())
+    m11 = (1 - jumpProb) * (rightProb[1] * w + (1 - rightProb[1]) * w.conj())
+    m01 = np.full_like(m00, jumpProb)
+    m10 = np.full_like(m00, jumpProb)
+
+    # Apply matrix ** steps by repeated squaring, elementwise over frequencies
+    remaining = steps
+    while remaining > 0:
+        if remaining & 1:
+            bottomHat, topHat = m00 * bottomHat + m01 * topHat, m10 * bottomHat + m11 * topHat
+        remaining >>= 1
+        if remaining:
+            m00, m01, m10, m11 = (m00 * m00 + m01 * m10, m00 * m01 + m01 * m11,
+                                  m10 * m00 + m11 * m10, m10 * m01 + m11 * m11)
+
+    result = np.fft.irfft(np.stack([bottomHat, topHat]), n=size, axis=1)[:, :width]
+    # Clear FFT round-off noise far out in the tails
+    result[result < 1e-13] = 0.0
+    return result[0], result[1]
+
+
+def masterEquation(dt, T, D, b, gamma, steps=None, topFraction=0.5, moveProb=None, topDrift=-1):
+    """
+    This function computes the noise-free distribution the C simulation samples. Every particle starts at
+    x = 0, with topFraction of them on the top line. By default the top line drifts -b like the robust
+    kernel; a simulation whose top line drifts +b passes topDrift=1 and its own move probability.
+
+    Input: delta t, time constant, diffusion constant, drift constant, gamma, optional number of
+    increments (defaults to the count RWoperation uses), optional starting share of the top line,
+    optional move probability (defaults to moveProbCalc), sign of the top line drift (-1 or 1)
+
+    Output: x-values in lattice units, bottom line probabilities, top line probabilities.
+    Probabilities sum to 1 over both lines, like the frequencies the GUI plots.
+    """
+    if steps is None:
+        steps = incrementsCalc(dt, T, b)
+    if moveProb is None:
+        moveProb = moveProbCalc(D, b, dt)
+    if topDrift > 0:
+        # Swapping the move probability swaps which line drifts which way
+        moveProb = 1 - moveProb
+    jumpProb = gamma * dt
+    bottom, top = propagate(np.array([1 - topFraction]), np.array([topFraction]), moveProb, jumpProb, steps)
+    x = np.arange(-steps, steps + 1)
+    return x, bottom, top
+
+
+def lineDensity(probabilities, moveDistance):
+    """
+    This function turns per-site probabilities into a density over x. Without jumps a particle only
+    reaches every other site, so neighbouring sites are averaged before dividing by the site spacing.
+
+    Input: per-site probabilities, move distance
+
+    Output: density at the midpoints between sites
+    """
+    return (probabilities[:-1] + probabilities[1:]) / (2 * moveDistance)
@@ -0,0 +1,57 @@
+#!/bin/bash
+# Checkpoint round trip from a clean /dev/shm: a run stopped with SIGTERM and
+# resumed from its checkpoint must end with the same walkers as a run that was
+# never stopped. Also checks that --stats and --moments-file work for single runs.
+
+cd "$(dirname "$0")/.."
+WORK=$(mktemp -d)
+trap 'rm -rf "$WORK"; rm -f /dev/shm/particle_shm /dev/shm/particle_moments' EXIT
+
+make -sB TARGET="$WORK/RWoperation" || exit 1
+
+PARTICLES=200000
+RUN="$WORK/RWoperation 0.01 20 1 0.5 0.5 $PARTICLES 1 --pace max"
+# Header, int32 positions, then one lane bit per walker
+HEADER=96
+BODY=$((4 * PARTICLES + (PARTICLES + 7) / 8))
+failed=0
+
+check() {
+    if [ "$2" -eq 0 ]; then
+        echo "$1: PASSED"
+    else
+        echo "$1: FAILED"
+        failed=1
+    fi
+}
+
+# Uninterrupted run
+rm -f /dev/shm/particle_shm /dev/shm/particle_moments
+$RUN --stats "$WORK/stats.json" --moments 100 --moments-file "$WORK/moments.bin" > /dev/null
+check "test_fullRun" $?
+cp /dev/shm/particle_shm "$WORK/full.bin"
+[ -s "$WORK/stats.json" ] && [ -s "$WORK/moments.bin" ]
+check "test_statsAndMoments" $?
+
+# Same run, stopped part way and resumed
+rm -f /dev/shm/particle_shm /dev/shm/particle_moments
+$RUN --checkpoint "$WORK/run.ck" --checkpoint-every 5 > "$WORK/stopped.txt" &
+pid=$!
+sleep 1
+kill -TERM $pid
+wait $pid
+stopped=$?
+grep -q "Stopped at increment" "$WORK/stopped.txt"
+check "test_stopSavesCheckpoint" $(( $? != 0 || stopped == 0 ))
+
+rm -f /dev/shm/particle_shm
+$RUN --resume "$WORK/run.ck" > /dev/null
+check "test_resume" $?
+cmp -s -i $HEADER -n $BODY "$WORK/full.bin" /dev/shm/particle_shm
+check "test_resumeMatchesFullRun" $?
+
+# A missing checkpoint is an error
+$RUN --resume "$WORK/missing.ck" > /dev/null
+check "test_missingCheckpointFails" $(( $? == 0 ))
+
+exit $failed
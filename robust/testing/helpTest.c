@@ -7,7 +7,7 @@
 // Test getSize
 void test_getSize() {
     int numParts = 10;
-    size_t result = getSize(numParts);
+    size_t result = getSize(numParts, LAYOUT_PARTICLES);
     size_t expected = sizeof(ParticleStruct) + numParts * sizeof(Particle);
     printf("test_getSize: %s (Result: %zu, Expected: %zu)\n", 
            result == expected ? "PASSED" : "FAILED", result, expected);
@@ -36,7 +36,7 @@ void test_initializeParticles() {
     int fd;
     sem_t* sem;
     // Create shared memory first (minimal setup for test)
-    size_t size = getSize(5);
+    size_t size = getSize(5, LAYOUT_PARTICLES);
     fd = shm_open(SHM_NAME, O_CREAT | O_RDWR, 0666);
     ftruncate(fd, size);
     sem = sem_open(SEM_NAME, O_CREAT, 0666, 1);
@@ -54,12 +54,12 @@ void test_initializeParticles() {
 // Test resizeSharedMemory
 void test_resizeSharedMemory() {
     int fd = shm_open(SHM_NAME, O_CREAT | O_RDWR, 0666);
-    size_t oldSize = getSize(5);
+    size_t oldSize = getSize(5, LAYOUT_PARTICLES);
     ftruncate(fd, oldSize);
     ParticleStruct* oldPtr = mmap(0, oldSize, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
     
     ParticleStruct* newPtr = resizeSharedMemory(fd, oldPtr, oldSize, 10);
-    size_t newSize = getSize(10);
+    size_t newSize = getSize(10, LAYOUT_PARTICLES);
     
     int passed = (newPtr != NULL);
     cleanup_shared_memory(fd, newPtr, newSize, SEM_FAILED);
@@ -72,7 +72,7 @@ void test_resizeSharedMemory() {
 void test_moveParticles() {
     int fd;
     sem_t* sem;
-    size_t size = getSize(2);
+    size_t size = getSize(2, LAYOUT_PARTICLES);
     fd = shm_open(SHM_NAME, O_CREAT | O_RDWR, 0666);
     ftruncate(fd, size);
     sem = sem_open(SEM_NAME, O_CREAT, 0666, 1);
@@ -81,26 +81,34 @@ void test_moveParticles() {
     shared->particles[0] = (Particle){0.0f, 0.0f};
     shared->particles[1] = (Particle){1.0f, 1.0f};
     
-    pcg32_random_t rng_states[1];
-    initialize_rng_states(1, rng_states);
-    int result = moveParticles(shared, 0.5f, 0.1f, rng_states, 1, sem);
+    RngStream* rng_streams = allocate_rng_streams(1);
+    initialize_rng_streams(rng_streams, 1, DEFAULT_SEED);
+    int result = moveParticles(shared, 0.5f, 0.1f, rng_streams, 1, NULL, NULL, 0);
     
     printf("test_moveParticles: %s (Return: %d)\n", 
            result == 0 ? "PASSED" : "FAILED", result);
     
     cleanup_shared_memory(fd, shared, size, sem);
     shm_unlink(SHM_NAME);
+    free(rng_streams);
 }
 
-// Test initialize_rng_states
-void test_initialize_rng_states() {
-    pcg32_random_t rng_states[2];
-    initialize_rng_states(2, rng_states);
-    uint32_t val1 = pcg32_random_r(&rng_states[0]);
-    uint32_t val2 = pcg32_random_r(&rng_states[1]);
-    int passed = (val1 != val2);  // Different seeds should give different values
-    printf("test_initialize_rng_states: %s (Val1: %u, Val2: %u)\n",
+// Test initialize_rng_streams
+void test_initialize_rng_streams() {
+    RngStream* rng_streams = allocate_rng_streams(2);
+    initialize_rng_streams(rng_streams, 2, DEFAULT_SEED);
+    uint32_t val1 = pcg32_random_r(&rng_streams[0].rng);
+    uint32_t val2 = pcg32_random_r(&rng_streams[1].rng);
+    int passed = (val1 != val2);  // Different blocks should give different values
+
+    // Block 1 must be block 0 advanced by one stride
+    pcg32_random_t check;
+    pcg32_srandom_r(&check, DEFAULT_SEED, DEFAULT_SEED);
+    pcg32_advance_r(&check, RNG_BLOCK_STRIDE);
+    passed = passed && (pcg32_random_r(&check) == val2);
+    printf("test_initialize_rng_streams: %s (Val1: %u, Val2: %u)\n",
            passed ? "PASSED" : "FAILED", val1, val2);
+    free(rng_streams);
 }
 
 // Test roundValue
@@ -115,7 +123,7 @@ void test_roundValue() {
 // Test cleanup_shared_memory
 void test_cleanup_shared_memory() {
     int fd = shm_open(SHM_NAME, O_CREAT | O_RDWR, 0666);
-    size_t size = getSize(5);
+    size_t size = getSize(5, LAYOUT_PARTICLES);
     ftruncate(fd, size);
     ParticleStruct* shared = mmap(0, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
     sem_t* sem = sem_open(SEM_NAME, O_CREAT, 0666, 1);
@@ -139,7 +147,7 @@ int main() {
     test_initializeParticles();
     test_resizeSharedMemory();
     test_moveParticles();
-    test_initialize_rng_states();
+    test_initialize_rng_streams();
     test_roundValue();
     test_cleanup_shared_memory();
     
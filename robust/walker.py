@@ -0,0 +1,160 @@
+import ctypes
+import os
+import struct
+import numpy as np
+
+# Built with `make lib`, next to this file
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "librw.so")
+# Matches helper.h
+DEFAULT_SEED = 123456789
+LAYOUT_COMPACT = 1
+KERNEL_SCALAR = 0
+# Checkpoint header written by RWoperation --checkpoint (matches checkpoint.h)
+CHECKPOINT_MAGIC = b"RWCK"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct('<4sI6i5fiQQQ')
+CHECKPOINT_FIELDS = ('layout', 'kernel', 'count', 'sites', 'increments', 'done',
+                     'dt', 'T', 'D', 'b', 'gamma', 'numStreams', 'seed', 'bodyBytes', 'streamBytes')
+# Each RngStream is {state, inc} padded to a 64 byte cache line
+RNG_STREAM_WORDS = 8
+
+_library = None
+
+
+def loadLibrary(path=LIBRARY_PATH):
+    """
+    This function loads librw.so once and declares its argument types. ctypes drops the GIL for the
+    length of every call, so other Python threads keep running while the kernel works.
+
+    Input: path to the shared library
+
+    Output: the loaded library
+    """
+    global _library
+    if _library is not None:
+        return _library
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, build it with `make lib` in robust/")
+
+    library = ctypes.CDLL(path)
+    positions = np.ctypeslib.ndpointer(dtype=np.int32, ndim=1, flags='C_CONTIGUOUS,WRITEABLE')
+    lanes = np.ctypeslib.ndpointer(dtype=np.uint8, ndim=1, flags='C_CONTIGUOUS,WRITEABLE')
+    streams = np.ctypeslib.ndpointer(dtype=np.uint64, ndim=2, flags='C_CONTIGUOUS,WRITEABLE')
+
+    library.rwStreamCount.argtypes = [ctypes.c_int]
+    library.rwStreamCount.restype = ctypes.c_int
+    library.rwSeedStreams.argtypes = [streams, ctypes.c_int, ctypes.c_uint64, ctypes.c_uint64]
+    library.rwSeedStreams.restype = ctypes.c_int
+    library.rwIncrements.argtypes = [ctypes.c_float] * 3
+    library.rwIncrements.restype = ctypes.c_int
+    library.rwAdvance.argtypes = [positions, lanes, ctypes.c_int, streams] + [ctypes.c_float] * 4 + [ctypes.c_int, ctypes.c_int]
+    library.rwAdvance.restype = ctypes.c_int
+
+    _library = library
+    return library
+
+
+def initialState(n):
+    """
+    This function builds the starting walkers RWoperation uses, every walker at x = 0 with odd
+    walkers on the top line.
+
+    Input: number of walkers
+
+    Output: int32 positions, uint8 lanes
+    """
+    x = np.zeros(n, dtype=np.int32)
+    lane = (np.arange(n) & 1).astype(np.uint8)
+    return x, lane
+
+
+def seedStreams(n, seed=DEFAULT_SEED, firstBlock=0):
+    """
+    This function seeds one generator per block of walkers, the same streams RWoperation draws from.
+    A run uses the blocks from 0, row r of a --sweep the blocks from r * streamCount(n).
+
+    Input: number of walkers, seed, index of the first block
+
+    Output: uint64 array of {state, inc} rows, to be passed back to advance
+    """
+    library = loadLibrary()
+    streams = np.empty((library.rwStreamCount(n), 2), dtype=np.uint64)
+    if library.rwSeedStreams(streams, n, seed, firstBlock) != 0:
+        raise MemoryError(f"could not seed {len(streams)} generator streams")
+    return streams
+
+
+def streamCount(n):
+    """
+    This function counts the generator blocks n walkers use.
+
+    Input: number of walkers
+
+    Output: number of blocks
+    """
+    return loadLibrary().rwStreamCount(n)
+
+
+def advance(x, lane, streams, dt, D, b, gamma, steps, threads=None):
+    """
+    This function walks existing walkers in place, continuing their generator streams. Splitting a run
+    into several calls gives a different, equally valid walk than one call of the same length.
+
+    Input: int32 positions, uint8 lanes, streams from seedStreams, delta t, diffusion constant, drift
+    constant, gamma, increments to run, threads (OpenMP default if None)
+
+    Output: None, x, lane and streams are updated
+    """
+    library = loadLibrary()
+    n = len(x)
+    if len(lane) != n:
+        raise ValueError(f"x has {n} walkers but lane has {len(lane)}")
+    if streams.shape != (library.rwStreamCount(n), 2):
+        raise ValueError(f"streams has shape {streams.shape}, {n} walkers need ({library.rwStreamCount(n)}, 2)")
+    if library.rwAdvance(x, lane, n, streams, dt, D, b, gamma, steps, threads or 0) != 0:
+        raise ValueError(f"rwAdvance rejected {steps} steps")
+
+
+def simulate(dt, T, D, b, gamma, n, threads=None, seed=DEFAULT_SEED, firstBlock=0):
+    """
+    This function runs a whole simulation in process. The result matches the same parameter set run
+    through RWoperation --sweep with the same seed, as row r of the table when firstBlock is
+    r * streamCount(n).
+
+    Input: delta t, time constant, diffusion constant, drift constant, gamma, number of walkers,
+    threads (OpenMP default if None), seed, index of the first generator block
+
+    Output: int32 positions in lattice steps, uint8 lanes
+    """
+    library = loadLibrary()
+    x, lane = initialState(n)
+    streams = seedStreams(n, seed, firstBlock)
+    advance(x, lane, streams, dt, D, b, gamma, library.rwIncrements(dt, T, b), threads)
+    return x, lane
+
+
+def loadCheckpoint(path):
+    """
+    This function reads a checkpoint RWoperation wrote for the compact layout with the scalar kernel, so
+    one shared warm-up can be forked in process with advance and new parameters.
+
+    Input: path to the checkpoint file
+
+    Output: int32 positions, uint8 lanes, streams for advance, dict of the saved run settings
+    """
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    magic, version, *values = CHECKPOINT_HEADER.unpack_from(raw)
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is not a version {CHECKPOINT_VERSION} checkpoint")
+    info = dict(zip(CHECKPOINT_FIELDS, values))
+    if info['layout'] != LAYOUT_COMPACT or info['kernel'] != KERNEL_SCALAR:
+        raise ValueError(f"{path} holds layout {info['layout']} for kernel {info['kernel']}, only compact scalar runs load here")
+
+    n = info['count']
+    body = CHECKPOINT_HEADER.size
+    x = np.frombuffer(raw, np.int32, n, body).copy()
+    lane = np.unpackbits(np.frombuffer(raw, np.uint8, (n + 7) // 8, body + 4 * n), bitorder='little')[:n]
+    streamOffset = (body + info['bodyBytes'] + 7) & ~7
+    words = np.frombuffer(raw, np.uint64, info['numStreams'] * RNG_STREAM_WORDS, streamOffset)
+    streams = np.ascontiguousarray(words.reshape(-1, RNG_STREAM_WORDS)[:, :2])
+    return x, lane, streams, info